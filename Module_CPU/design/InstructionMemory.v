@@ -27,6 +27,7 @@ module InstructionMemory(
     // initial 
     // begin
     //     $readmemb("D:/learn/Git/testgit/test/test2.txt", ROM);  //读取测试文档中的指令
+    //     $readmemh("machine_code_output.memh", ROM);  //或读取汇编器输出的映像 (python pseudo.py --format memh)
     // end
     initial begin
         for(i = 0; i < 256; i = i + 1) begin
@@ -1,7 +1,7 @@
 # python_sender_byte_underscore_format.py
 # 从 machineCode.txt 读取指令（格式如 0000_0000_0000_0000），并逐字节发送
+# CODE_FILE 以 .bin 结尾时直接读取汇编器输出的二进制映像 (python pseudo.py -o machineCode.txt --format bin)，不再解析文本
 
-import serial
 import time
 import os
 
@@ -41,12 +41,31 @@ def read_machine_code(filename):
     
     return instructions
 
+def read_machine_code_bin(filename):
+    """从 .bin 文件中读取机器码（每个字低字节在前），返回16位整数列表；字节数为奇数时文件不完整，不发送"""
+    if not os.path.exists(filename):
+        print(f"错误: 文件 '{filename}' 不存在。")
+        return None
+
+    with open(filename, 'rb') as f:
+        data = f.read()
+    if len(data) % 2:
+        print(f"错误: 文件 '{filename}' 的字节数为奇数 ({len(data)})，不是完整的16位机器码映像。")
+        return None
+    return [data[k] | (data[k + 1] << 8) for k in range(0, len(data), 2)]
+
 def main():
-    machine_code_bin = read_machine_code(CODE_FILE) # 读取的是不含下划线的二进制字符串列表
-    if machine_code_bin is None:
+    import serial # 只有发送时才需要 pyserial，读取/解析机器码不依赖它
+
+    if CODE_FILE.endswith('.bin'):
+        machine_code = read_machine_code_bin(CODE_FILE) # 16位整数列表
+    else:
+        machine_code_bin = read_machine_code(CODE_FILE) # 读取的是不含下划线的二进制字符串列表
+        machine_code = None if machine_code_bin is None else [int(instr_bin_str, 2) for instr_bin_str in machine_code_bin]
+    if machine_code is None:
         return
 
-    print(f"从 '{CODE_FILE}' 文件中成功读取 {len(machine_code_bin)} 条指令。")
+    print(f"从 '{CODE_FILE}' 文件中成功读取 {len(machine_code)} 条指令。")
 
     print(f"尝试连接串口 {SERIAL_PORT}...")
     try:
@@ -60,7 +79,7 @@ def main():
 
     try:
         # 1. 发送指令总数 (拆分为两个字节)
-        num_instructions = len(machine_code_bin)
+        num_instructions = len(machine_code)
         print(f"\n准备发送指令总数: {num_instructions}")
         
         count_lsb = (num_instructions & 0xFF).to_bytes(1, 'little')      # 低八位
@@ -77,12 +96,10 @@ def main():
         # 2. 逐条发送机器指令 (每条指令拆分为两个字节)
         if num_instructions > 0:
             print("\n准备发送机器指令...")
-            # enumerate() 用于同时获取当前索引（i）和内容（instr_bin_str）
-            for i, instr_bin_str in enumerate(machine_code_bin): # instr_bin_str 是不含下划线的二进制字符串
-                print(f"发送指令 {i+1}/{num_instructions}: {instr_bin_str}") # 打印的是不含下划线的版本
-                # 将二进制字符串转换为整数
-                value = int(instr_bin_str, 2) 
-                
+            # enumerate() 用于同时获取当前索引（i）和内容（value）
+            for i, value in enumerate(machine_code): # value 是16位整数
+                print(f"发送指令 {i+1}/{num_instructions}: {value:016b}") # 打印不含下划线的二进制
+
                 instr_lsb = (value & 0xFF).to_bytes(1, 'little')
                 instr_msb = ((value >> 8) & 0xFF).to_bytes(1, 'little')
 
@@ -0,0 +1,205 @@
+# 汇编缓存：以内容为键把汇编结果保存在磁盘上，同一份源码再次汇编时只需读一个文件 (CI 中反复汇编 program.txt/program2.txt)
+#
+# 键为以下内容的 SHA-256:
+#   源码文本 (每行去掉行尾换行后以 \n 连接，readlines()/splitlines() 得到的行键相同)
+#   ISA 表 (opcode_map、instruction_format、register_alias) 和 ROM 大小
+#   汇编器版本 pseudo.ASSEMBLER_VERSION
+# 每个键一个 JSON 文件: {image, label_map, data_lma_values, source_lines}，先写临时文件再改名，多个进程同时写入也不会读到半个文件
+# LRU：命中时更新文件的修改时间，目录总大小超过上限时从最久未使用的文件开始删除
+# 命中/未命中/写入/淘汰次数累加到目录中的 stats.json (尽力而为，并发写入时可能少计)
+#
+# 用法 (在 编译程序 目录下):
+#   python pseudo.py program2.txt --cache              (使用默认缓存目录 .asm_cache)
+#   python -m asm_cache stats                          (查看条目数、大小和命中率)
+#   python -m asm_cache clear
+#   cache = AssemblyCache(); image, label_map, data_lma_values, source_lines = cache.assemble(lines)
+
+import argparse
+import hashlib
+import json
+import os
+import sys
+import tempfile
+
+import pseudo as pse # 导入pseudo.py
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_DIR = os.path.join(HERE, '.asm_cache')
+DEFAULT_MAX_BYTES = 16 * 1024 * 1024
+ENTRY_SUFFIX = '.json'
+STATS_FILE = 'stats.json'
+STAT_NAMES = ('hits', 'misses', 'stores', 'evictions')
+
+
+def isa_fingerprint():
+    # 影响汇编结果的 ISA 表和映像布局
+    return json.dumps({
+        'opcode_map': pse.opcode_map,
+        'instruction_format': pse.instruction_format,
+        'register_alias': pse.register_alias,
+        'rom_words': pse.ROM_WORDS,
+        'version': pse.ASSEMBLER_VERSION,
+    }, sort_keys=True)
+
+
+def cache_key(lines):
+    digest = hashlib.sha256(isa_fingerprint().encode('utf-8'))
+    digest.update(b'\0')
+    digest.update('\n'.join(line.rstrip('\r\n') for line in lines).encode('utf-8'))
+    return digest.hexdigest()
+
+
+class AssemblyCache:
+    def __init__(self, directory=DEFAULT_DIR, max_bytes=DEFAULT_MAX_BYTES):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.counts = dict.fromkeys(STAT_NAMES, 0) # 本进程中的计数，save_stats() 时累加到 stats.json
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, key):
+        return os.path.join(self.directory, key + ENTRY_SUFFIX)
+
+    def get(self, key):
+        # 返回 (image, label_map, data_lma_values, source_lines)，不存在或文件损坏时返回 None
+        path = self._path(key)
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                entry = json.load(f)
+            result = (entry['image'], entry['label_map'], entry['data_lma_values'], entry['source_lines'])
+        except (OSError, ValueError, KeyError):
+            self.counts['misses'] += 1
+            return None
+        try:
+            os.utime(path) # LRU：记录最近一次使用
+        except OSError:
+            pass
+        self.counts['hits'] += 1
+        return result
+
+    def put(self, key, image, label_map, data_lma_values, source_lines):
+        entry = {'image': image, 'label_map': label_map, 'data_lma_values': data_lma_values, 'source_lines': source_lines}
+        fd, tmp_path = tempfile.mkstemp(suffix='.tmp', dir=self.directory)
+        try:
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                json.dump(entry, f, separators=(',', ':'))
+            os.replace(tmp_path, self._path(key))
+        except BaseException:
+            os.remove(tmp_path)
+            raise
+        self.counts['stores'] += 1
+        self.evict()
+
+    def assemble(self, lines):
+        # 与 expand_pseudo_instructions + build_image 的结果相同，返回 (image, label_map, data_lma_values, source_lines)
+        key = cache_key(lines)
+        result = self.get(key)
+        if result is not None:
+            return result
+        expanded, label_map, data_lma_values, source_lines = pse.expand_pseudo_instructions(lines)
+        image = pse.build_image(expanded, label_map, data_lma_values)
+        self.put(key, image, label_map, data_lma_values, source_lines)
+        return image, label_map, data_lma_values, source_lines
+
+    def entries(self):
+        # [(修改时间, 大小, 路径)]，最久未使用的在前
+        entries = []
+        for name in os.listdir(self.directory):
+            if not name.endswith(ENTRY_SUFFIX) or name == STATS_FILE:
+                continue
+            path = os.path.join(self.directory, name)
+            try:
+                st = os.stat(path)
+            except FileNotFoundError: # 其他进程刚刚淘汰了它
+                continue
+            entries.append((st.st_mtime, st.st_size, path))
+        entries.sort()
+        return entries
+
+    def evict(self):
+        # 总大小超过 max_bytes 时从最久未使用的条目开始删除，返回删除的条目数
+        entries = self.entries()
+        total = sum(size for _, size, _ in entries)
+        removed = 0
+        for _, size, path in entries:
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+                removed += 1
+            except FileNotFoundError:
+                pass
+            total -= size
+        self.counts['evictions'] += removed
+        return removed
+
+    def clear(self):
+        for _, _, path in self.entries():
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+        try:
+            os.remove(os.path.join(self.directory, STATS_FILE))
+        except FileNotFoundError:
+            pass
+
+    def load_stats(self):
+        try:
+            with open(os.path.join(self.directory, STATS_FILE), 'r', encoding='utf-8') as f:
+                saved = json.load(f)
+        except (OSError, ValueError):
+            saved = {}
+        return {name: int(saved.get(name, 0)) for name in STAT_NAMES}
+
+    def save_stats(self):
+        # 把本进程的计数累加到 stats.json，然后清零
+        if not any(self.counts.values()):
+            return
+        totals = self.load_stats()
+        for name in STAT_NAMES:
+            totals[name] += self.counts[name]
+        fd, tmp_path = tempfile.mkstemp(suffix='.tmp', dir=self.directory)
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            json.dump(totals, f)
+        os.replace(tmp_path, os.path.join(self.directory, STATS_FILE))
+        self.counts = dict.fromkeys(STAT_NAMES, 0)
+
+    def report(self):
+        # 累计计数 (包括本进程尚未保存的部分) 和当前的条目数、总大小
+        stats = self.load_stats()
+        for name in STAT_NAMES:
+            stats[name] += self.counts[name]
+        lookups = stats['hits'] + stats['misses']
+        entries = self.entries()
+        stats['hit_rate'] = stats['hits'] / lookups if lookups else 0.0
+        stats['entries'] = len(entries)
+        stats['bytes'] = sum(size for _, size, _ in entries)
+        stats['max_bytes'] = self.max_bytes
+        return stats
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="磁盘上的汇编缓存：查看统计或清空")
+    parser.add_argument('command', choices=('stats', 'clear'))
+    parser.add_argument('--dir', default=DEFAULT_DIR, help="缓存目录 (默认 .asm_cache)")
+    parser.add_argument('--json', action='store_true', help="以 JSON 输出统计")
+    args = parser.parse_args(argv)
+
+    cache = AssemblyCache(args.dir)
+    if args.command == 'clear':
+        cache.clear()
+        print(f"已清空 {args.dir}")
+        return 0
+
+    stats = cache.report()
+    if args.json:
+        print(json.dumps(stats))
+    else:
+        print(f"命中 {stats['hits']}  未命中 {stats['misses']}  命中率 {stats['hit_rate']:.1%}  "
+              f"写入 {stats['stores']}  淘汰 {stats['evictions']}")
+        print(f"条目 {stats['entries']}  大小 {stats['bytes']} / {stats['max_bytes']} 字节")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
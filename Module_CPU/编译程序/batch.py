@@ -0,0 +1,171 @@
+# 多进程批量运行：把多个程序/测试用例分发到 ProcessPoolExecutor，每个工作进程复用一个模拟器
+# 结果按完成顺序逐个返回，并检查对最终寄存器和内存的断言
+#
+# 用法 (在 编译程序 目录下):
+#   python -m batch program.txt program2.txt ../../test/test2.txt -j 4
+#   python -m batch --jobs jobs.json
+#
+# jobs.json 为任务列表，每个任务是一个对象:
+#   {"file": "program2.txt",                         汇编源文件或机器码文件
+#    "name": "排序",                                  可选，结果中显示的名字 (默认为 file)
+#    "max_steps": 100000,                             可选
+#    "inputs": {"0x1000": [12, 9, 13, 7, 12, 11]},    可选，运行前写入内存的字节
+#    "mem": ["0x3000:6"],                             可选，结果中输出的内存区间
+#    "expect": {"stop_reason": "halt",                可选，断言
+#               "registers": {"a5": 11},
+#               "memory": {"0x3000": [7, 9, 11, 12, 12, 13]}}}
+
+import argparse
+import json
+import os
+import sys
+
+import headless
+
+_worker_simulator = None # 每个工作进程一个模拟器，在进程内的多个任务之间复用
+
+
+def _init_worker():
+    global _worker_simulator
+    _worker_simulator = headless.new_simulator()
+
+
+def _parse_addr(addr):
+    return addr if isinstance(addr, int) else int(addr, 0)
+
+
+def normalize_job(job):
+    # 接受文件路径字符串或任务字典，返回补全默认值后的任务字典
+    if isinstance(job, str):
+        job = {'file': job}
+    job = dict(job)
+    if 'file' not in job:
+        raise ValueError(f"任务缺少 'file': {job}")
+    job.setdefault('name', job['file'])
+    job.setdefault('max_steps', 100000)
+    job['inputs'] = {_parse_addr(addr): list(values) for addr, values in job.get('inputs', {}).items()}
+
+    mem_ranges = [headless.parse_mem_range(r) if isinstance(r, str) else tuple(r) for r in job.get('mem', [])]
+    expect = job.get('expect', {})
+    for addr, values in expect.get('memory', {}).items(): # 断言涉及的内存区间也要读出来
+        mem_ranges.append((_parse_addr(addr), len(values)))
+    job['mem'] = mem_ranges
+    return job
+
+
+def check_expectations(result, expect):
+    # 比较运行结果与断言，返回失败信息列表 (为空表示通过)
+    failures = []
+    if result['stop_reason'] == 'load_error':
+        return [f"加载失败: {result.get('error')}"]
+
+    expected_reason = expect.get('stop_reason')
+    if expected_reason is not None and result['stop_reason'] != expected_reason:
+        failures.append(f"停止原因为 {result['stop_reason']}，期望 {expected_reason}")
+
+    if 'pc' in expect and result['pc'] != expect['pc']:
+        failures.append(f"PC 为 {result['pc']}，期望 {expect['pc']}")
+
+    for reg, value in expect.get('registers', {}).items():
+        actual = result['registers'].get(reg)
+        if actual is None:
+            failures.append(f"未知寄存器 '{reg}'")
+        elif actual != value & 0xFFFF:
+            failures.append(f"{reg} = {actual} (0x{actual:04X})，期望 {value}")
+
+    for addr, values in expect.get('memory', {}).items():
+        start = _parse_addr(addr)
+        actual = result['memory'].get(f"0x{start:04X}", [])[:len(values)]
+        if actual != list(values):
+            failures.append(f"内存 0x{start:04X} 起为 {actual}，期望 {list(values)}")
+
+    return failures
+
+
+def run_job(job):
+    # 运行单个任务 (在工作进程中执行)，返回结果字典，含 name、passed、failures
+    global _worker_simulator
+    if _worker_simulator is None: # 不经过进程池直接调用时
+        _init_worker()
+
+    job = normalize_job(job)
+    result = headless.run_file(job['file'], job['max_steps'], job['mem'],
+                               simulator=_worker_simulator, inputs=job['inputs'])
+    result['name'] = job['name']
+    failures = check_expectations(result, job.get('expect', {}))
+    if result['stop_reason'] in ('load_error', 'error') and not failures:
+        failures.append(f"运行出错: {result['stop_reason']}")
+    result['passed'] = not failures
+    result['failures'] = failures
+    return result
+
+
+def run_batch(jobs, workers=None):
+    # 生成器：并行运行所有任务，按完成顺序逐个返回结果
+    # workers 为进程数 (默认 CPU 核数)；为 1 时在当前进程内顺序执行
+    jobs = list(jobs)
+    if workers is None:
+        workers = os.cpu_count() or 1
+    workers = max(1, min(workers, len(jobs)))
+
+    if workers == 1:
+        for job in jobs:
+            yield run_job(job)
+        return
+
+    from concurrent.futures import ProcessPoolExecutor, as_completed # 只在多进程运行时导入
+
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker) as executor:
+        futures = [executor.submit(run_job, job) for job in jobs]
+        for future in as_completed(futures):
+            yield future.result()
+
+
+def load_jobs(path):
+    # 读取 JSON 任务列表；任务中的相对路径相对于任务文件所在目录
+    with open(path, 'r', encoding='utf-8') as f:
+        jobs = json.load(f)
+    base_dir = os.path.dirname(os.path.abspath(path))
+    result = []
+    for job in jobs:
+        job = dict(job) if isinstance(job, dict) else {'file': job}
+        job.setdefault('name', job.get('file'))
+        if 'file' in job and not os.path.isabs(job['file']):
+            job['file'] = os.path.join(base_dir, job['file'])
+        result.append(job)
+    return result
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="多进程批量运行16位CPU程序，以 JSON 逐行输出结果并检查断言")
+    parser.add_argument('files', nargs='*', help="汇编源文件或机器码文件")
+    parser.add_argument('--jobs', dest='jobs_file', help="JSON 任务列表文件")
+    parser.add_argument('-j', '--workers', type=int, default=None, help="工作进程数 (默认 CPU 核数)")
+    parser.add_argument('--max-steps', type=int, default=100000, help="命令行给出的文件最多执行的指令条数")
+    parser.add_argument('--mem', type=headless.parse_mem_range, action='append', default=[],
+                        metavar='START:LEN', help="命令行给出的文件要输出的内存区间，可重复指定")
+    args = parser.parse_args(argv)
+
+    jobs = [{'file': path, 'max_steps': args.max_steps, 'mem': args.mem} for path in args.files]
+    if args.jobs_file:
+        jobs += load_jobs(args.jobs_file)
+    if not jobs:
+        parser.error("没有要运行的程序")
+
+    passed = failed = 0
+    for result in run_batch(jobs, args.workers):
+        sys.stdout.write(json.dumps(result, ensure_ascii=False) + '\n')
+        sys.stdout.flush()
+        if result['passed']:
+            passed += 1
+        else:
+            failed += 1
+            for failure in result['failures']:
+                print(f"失败 {result['name']}: {failure}", file=sys.stderr)
+
+    print(f"共 {passed + failed} 个任务: 通过 {passed}，失败 {failed}", file=sys.stderr)
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,298 @@
+# 性能基准：用固定的工作负载测量汇编器、模拟器和上传程序的热点路径，结果写入 JSON，并与保存的基线比较
+#
+# 工作负载:
+#   program / program2        仓库中的两个示例程序
+#   synth32/64/128            随机生成 (固定种子) 的程序，扩展后为 32/64/128 个字 (128 为 ROM 上限)
+#   stress2k / stress8k       更大的源码 (扩展后 2048/8192 条指令，超过 ROM，只用于汇编器各阶段和机器码解析)
+# 测量项:
+#   expand         pseudo.expand_pseudo_instructions    源码行/秒
+#   resolve        pseudo.resolve_labels                指令/秒
+#   encode         pseudo.encode (整数编码，原 assemble_line)  指令/秒
+#   step           Simulator16Bit.step                  指令/秒
+#   run            Simulator16Bit.run_until (按基本块，关闭计数循环快进)  指令/秒
+#   fast_forward   Simulator16Bit.run_until (按基本块，计数循环直接算出结束状态)  指令/秒 (含快进跳过的指令)
+#   compile        block_jit 翻译程序用到的全部基本块  指令/秒
+#   step/run/fast_forward 在程序结束后恢复 PC、寄存器和内存从头再运行，不作废已翻译的基本块 (翻译开销见 compile)
+#   read_machine_code  transport/ByteByByteSender.read_machine_code  机器码行/秒
+#   read_machine_code_bin  transport/ByteByByteSender.read_machine_code_bin (.bin 映像)  字/秒
+# 基线比较：某项的速率比基线低超过阈值 (默认 20%) 时视为性能回退，返回非0
+#
+# 用法 (在 编译程序 目录下):
+#   python -m bench                                   (与 bench_baseline.json 比较，如果存在)
+#   python -m bench --save-baseline                   (把本次结果保存为基线)
+#   python -m bench --only expand --only step --json bench.json --threshold 0.3
+
+import argparse
+import json
+import os
+import random
+import sys
+import tempfile
+import timeit
+
+import pseudo as pse # 导入pseudo.py
+from simulator import Simulator16Bit
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_BASELINE = os.path.join(HERE, 'bench_baseline.json')
+TRANSPORT_DIR = os.path.join(os.path.dirname(HERE), 'transport')
+
+SYNTH_SIZES = {'synth32': 32, 'synth64': 64, 'synth128': pse.ROM_WORDS}
+STRESS_SIZES = {'stress2k': 2048, 'stress8k': 8192}
+STEP_COUNT = 5000 # step / run 每次测量执行的指令条数
+
+BENCHMARKS = ('expand', 'resolve', 'encode', 'step', 'run', 'fast_forward', 'compile',
+              'read_machine_code', 'read_machine_code_bin')
+
+
+def synthetic_source(n_words, seed=0):
+    # 生成扩展后恰好 n_words 条指令的汇编源码 (固定种子，每次相同)：
+    # 覆盖 li/la/j/bge 伪指令、各类真实指令和标签，末尾附带 _data_lma 数据
+    rng = random.Random(seed)
+    regs = [f'a{i}' for i in range(13)]
+    lines = []
+    labels = []
+    near_labels = [] # 地址不超过 0xFF 的标签，la 只能加载这些 (lui 的立即数为8位)
+    words = 0
+    while words < n_words:
+        if words % 8 == 0:
+            label = f'L{len(labels)}'
+            labels.append(label)
+            if words <= 0xFF:
+                near_labels.append(label)
+            lines.append(f'{label}:')
+        room = n_words - words
+        rd, rs1, rs2 = rng.choice(regs), rng.choice(regs), rng.choice(regs)
+        kind = rng.randrange(10)
+        if kind == 0 and room >= 3:
+            value = rng.randrange(0x10000)
+            lines.append(f'    li {rd}, 0x{value:04X}')
+            words += 1 + bool(value & 0xFF) * (bool(value & 0xF0) + bool(value & 0x0F))
+            continue
+        if kind == 1:
+            lines.append(f'    la {rd}, {rng.choice(near_labels)}')
+        elif kind == 2:
+            lines.append(f'    {rng.choice(("beq", "ble", "bge"))} {rs1}, {rs2}, {rng.choice(labels)}')
+        elif kind == 3:
+            lines.append(f'    j {rng.choice(labels)}')
+        elif kind == 4:
+            lines.append(f'    {rng.choice(("lb", "lw"))} {rd}, {rng.randrange(8)}({rs1})')
+        elif kind == 5:
+            lines.append(f'    {rng.choice(("sb", "sw"))} {rd}, {rng.randrange(8)}({rs1})')
+        elif kind == 6:
+            lines.append(f'    lui {rd}, 0x{rng.randrange(0x100):02X}')
+        elif kind == 7:
+            lines.append(f'    {rng.choice(("addi", "subi"))} {rd}, {rs1}, {rng.randrange(16)}   // 立即数')
+        else:
+            lines.append(f'    {rng.choice(("add", "sub", "and", "or"))} {rd}, {rs1}, {rs2}')
+        words += 1
+    lines.append('_data_lma:')
+    lines.append('    .byte ' + ', '.join(str(rng.randrange(128)) for _ in range(16)))
+    return lines
+
+
+def load_workloads():
+    # 工作负载名 -> 源码行列表
+    workloads = {}
+    for name in ('program', 'program2'):
+        with open(os.path.join(HERE, name + '.txt'), 'r', encoding='utf-8') as f:
+            workloads[name] = f.read().splitlines()
+    for seed, (name, size) in enumerate({**SYNTH_SIZES, **STRESS_SIZES}.items()):
+        workloads[name] = synthetic_source(size, seed)
+    return workloads
+
+
+def _time(func, repeat):
+    # 每次调用的最短耗时 (秒)：先自动确定循环次数使一轮至少 0.2 秒，再取 repeat 轮中的最小值
+    timer = timeit.Timer(func)
+    number, _ = timer.autorange()
+    return min(timer.repeat(repeat, number)) / number
+
+
+def _new_simulator(lines):
+    simulator = Simulator16Bit()
+    simulator.verbose = False
+    expanded, label_map, data, source_lines = pse.expand_pseudo_instructions(lines)
+    success, message = simulator.load_program_from_source(expanded, label_map, data, source_lines)
+    if not success:
+        raise ValueError(message)
+    return simulator
+
+
+def _restart(simulator, initial):
+    # 程序结束后从头开始：恢复 PC、寄存器和内存 (数据区)，保留预解码缓存和已翻译的基本块
+    # (load_machine_code_to_memory 会作废全部基本块，测到的就成了翻译开销)
+    memory = simulator.memory
+    if memory[:pse.ROM_WORDS] != initial[:pse.ROM_WORDS]: # 程序改写了自己的代码
+        simulator.invalidate_code()
+        simulator.decode_cache[:pse.ROM_WORDS] = [None] * pse.ROM_WORDS
+    memory[:] = initial
+    simulator.registers[:] = [0] * 16
+    simulator.pc = 0
+    simulator.previous_pc = 0
+    simulator.halted = False
+    if simulator.bus is not None:
+        simulator.bus.reset()
+
+
+def _step_func(simulator, count):
+    initial = simulator.memory[:]
+    def run():
+        for _ in range(count):
+            if not simulator.step(): # 程序结束后从头开始
+                _restart(simulator, initial)
+    return run
+
+
+def _run_func(simulator, count):
+    initial = simulator.memory[:]
+    def run():
+        steps = 0
+        while steps < count:
+            n, reason = simulator.run_until(count - steps)
+            steps += n
+            if reason not in ('max_steps', 'breakpoint'): # 程序结束 (或死循环) 后从头开始
+                _restart(simulator, initial)
+    return run
+
+
+def _compile_func(simulator, count):
+    # 先运行 count 条指令收集程序用到的基本块，每次测量作废后重新翻译这些块；返回 (测量函数, 翻译的指令条数)
+    simulator.compile_threshold = 1
+    _run_func(simulator, count)()
+    starts = sorted(simulator.block_cache)
+    length = sum(block.length for block in simulator.block_cache.values())
+    def run():
+        simulator.invalidate_code()
+        for pc in starts:
+            simulator._compile_block(pc)
+    return run, length
+
+
+def _sender():
+    # 上传程序不是包，按路径导入；模块顶层不依赖 pyserial
+    if TRANSPORT_DIR not in sys.path:
+        sys.path.insert(0, TRANSPORT_DIR)
+    import ByteByByteSender
+    return ByteByByteSender
+
+
+def run_benchmarks(only=None, repeat=5):
+    # 运行所有 (或 only 中的) 测量项，返回 {"测量项/工作负载": {seconds, items, rate, unit}}
+    only = set(only or BENCHMARKS)
+    workloads = load_workloads()
+    results = {}
+
+    def record(bench, workload, func, items, unit):
+        seconds = _time(func, repeat)
+        results[f'{bench}/{workload}'] = {'seconds': seconds, 'items': items, 'rate': items / seconds, 'unit': unit}
+
+    with tempfile.TemporaryDirectory() as tmp:
+        for name, lines in workloads.items():
+            expanded, label_map, data, _ = pse.expand_pseudo_instructions(lines)
+            resolved = pse.resolve_labels(expanded, label_map)
+
+            if 'expand' in only:
+                record('expand', name, lambda: pse.expand_pseudo_instructions(lines), len(lines), 'lines/s')
+            if 'resolve' in only:
+                record('resolve', name, lambda: pse.resolve_labels(expanded, label_map), len(expanded), 'instr/s')
+            if 'encode' in only:
+                encode = pse.encode
+                record('encode', name, lambda: [encode(instr) for instr in resolved], len(resolved), 'instr/s')
+            words = [pse.encode(instr) for instr in resolved] + pse.data_words(data)
+            if 'read_machine_code' in only:
+                path = os.path.join(tmp, name + '.txt')
+                with open(path, 'w', encoding='utf-8') as f:
+                    f.write(''.join(pse.format_word(word) + '\n' for word in words))
+                read_machine_code = _sender().read_machine_code
+                record('read_machine_code', name, lambda: read_machine_code(path), len(words), 'lines/s')
+            if 'read_machine_code_bin' in only:
+                import image_formats as imf
+                bin_path = os.path.join(tmp, name + '.bin')
+                with open(bin_path, 'wb') as f:
+                    f.write(imf.to_bin(words))
+                read_machine_code_bin = _sender().read_machine_code_bin
+                record('read_machine_code_bin', name, lambda: read_machine_code_bin(bin_path), len(words), 'words/s')
+
+    for name in ('program', 'program2'): # 模拟器只运行仓库中的真实程序
+        if 'step' in only:
+            record('step', name, _step_func(_new_simulator(workloads[name]), STEP_COUNT), STEP_COUNT, 'instr/s')
+        if 'run' in only:
+            simulator = _new_simulator(workloads[name])
+            simulator.fast_forward = False # 计数循环快进会跳过大部分指令 (program 的延时循环)，单独测量
+            record('run', name, _run_func(simulator, STEP_COUNT), STEP_COUNT, 'instr/s')
+        if 'fast_forward' in only:
+            record('fast_forward', name, _run_func(_new_simulator(workloads[name]), STEP_COUNT), STEP_COUNT, 'instr/s')
+        if 'compile' in only:
+            func, length = _compile_func(_new_simulator(workloads[name]), STEP_COUNT)
+            record('compile', name, func, length, 'instr/s')
+    return results
+
+
+def compare(results, baseline, threshold=0.2):
+    # 与基线比较，返回 {"测量项/工作负载": 速率比 (本次/基线)} 和回退项列表 (速率低于基线的 1-threshold)
+    ratios = {}
+    regressions = []
+    for key, result in results.items():
+        base = baseline.get(key)
+        if not base or not base.get('rate'):
+            continue
+        ratio = result['rate'] / base['rate']
+        ratios[key] = ratio
+        if ratio < 1 - threshold:
+            regressions.append(key)
+    return ratios, regressions
+
+
+def _format_rate(rate):
+    for scale, suffix in ((1e6, 'M'), (1e3, 'k')):
+        if rate >= scale:
+            return f"{rate / scale:8.2f}{suffix}"
+    return f"{rate:8.2f} "
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="汇编器/模拟器/上传程序热点路径的性能基准，与基线比较发现性能回退")
+    parser.add_argument('--only', action='append', choices=BENCHMARKS, help="只运行指定的测量项，可重复指定")
+    parser.add_argument('--repeat', type=int, default=5, help="每项测量的轮数，取最小值 (默认 5)")
+    parser.add_argument('--json', help="结果写入的 JSON 文件")
+    parser.add_argument('--baseline', default=DEFAULT_BASELINE, help="基线文件 (默认 bench_baseline.json)")
+    parser.add_argument('--save-baseline', action='store_true', help="把本次结果保存为基线")
+    parser.add_argument('--threshold', type=float, default=0.2, help="速率低于基线多少比例算作回退 (默认 0.2)")
+    args = parser.parse_args(argv)
+
+    results = run_benchmarks(args.only, args.repeat)
+
+    baseline = {}
+    if not args.save_baseline and os.path.exists(args.baseline):
+        with open(args.baseline, 'r', encoding='utf-8') as f:
+            baseline = json.load(f)['results']
+    ratios, regressions = compare(results, baseline, args.threshold)
+
+    for key, result in results.items():
+        ratio = ratios.get(key)
+        ratio_text = f"  x{ratio:5.2f}{'  回退' if key in regressions else ''}" if ratio is not None else ''
+        print(f"{key:<32} {_format_rate(result['rate'])} {result['unit']:<8}{ratio_text}")
+
+    report = {
+        'python': sys.version.split()[0],
+        'results': results,
+        'baseline': args.baseline if baseline else None,
+        'ratios': ratios,
+        'regressions': regressions,
+    }
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+    if args.save_baseline:
+        with open(args.baseline, 'w', encoding='utf-8') as f:
+            json.dump({'python': report['python'], 'results': results}, f, ensure_ascii=False, indent=2)
+        print(f"基线已保存到 {args.baseline}")
+    if regressions:
+        print(f"性能回退 (低于基线 {args.threshold:.0%} 以上): {', '.join(regressions)}")
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
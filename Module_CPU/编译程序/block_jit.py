@@ -0,0 +1,245 @@
+# 基本块翻译 (block JIT)：把一段直线执行的指令 (以 beq/ble/jal/jalr 结尾) 一次性翻译为 Python 函数
+# 生成的函数直接读写寄存器和内存，由 Simulator16Bit.run() 按块执行，结果与逐条 step() 完全一致
+#
+# 生成的函数签名为 block(regs, mem, sim)，返回 (下一条指令的PC, 本次实际执行的指令条数)
+# 遇到需要解释器处理的情况 (如访存越界) 时提前返回，执行条数小于块长度，由解释器执行该条指令
+
+import pseudo as pse # 导入pseudo.py
+
+MAX_BLOCK_LENGTH = 64 # 单个基本块最多包含的指令条数
+
+# 数值操作码 -> 指令名，由共用的 ISA 定义 pseudo.opcode_map 生成
+OPCODE_NAMES = {int(code, 2): name for name, code in pse.opcode_map.items()}
+
+# 结束基本块的跳转/分支指令
+BLOCK_TERMINATORS = ('beq', 'ble', 'jal', 'jalr')
+
+
+class CompiledBlock:
+    __slots__ = ('fn', 'start_pc', 'length', 'last_pc', 'self_loop', 'source', 'loop')
+
+    def __init__(self, fn, start_pc, length, last_pc, self_loop, source, loop=None):
+        self.fn = fn                # 生成的 Python 函数
+        self.start_pc = start_pc    # 块起始PC (字地址)
+        self.length = length        # 块内指令条数
+        self.last_pc = last_pc      # 块内最后一条指令的PC
+        self.self_loop = self_loop  # 结尾的 jal/beq/ble 跳转到自身时，机器状态不再改变
+        self.source = source        # 生成的源码，便于调试
+        self.loop = loop            # 块本身是计数循环时为 CountedLoop，可以一次跳过多轮
+
+
+class CountedLoop:
+    # 计数循环 (如延时循环)：块以 ble 跳回块首，块内其余指令都是 addi/subi rX, rX, k 形式的寄存器自增/自减
+    # 不访存、不读其它寄存器，因此执行 n 轮的结果可以直接算出:
+    #   每个自增寄存器增加 n * k，n 轮后分支不再跳转，PC 落到块后的下一条
+    # 例:
+    #   inner_loop1:
+    #       addi a5, a5, 1
+    #       ble a5, a3, inner_loop1
+    __slots__ = ('counter', 'limit', 'counter_is_rs1', 'deltas', 'delta')
+
+    def __init__(self, counter, limit, counter_is_rs1, deltas):
+        self.counter = counter                  # 参与比较的计数寄存器
+        self.limit = limit                      # 与之比较的寄存器 (循环内不变)
+        self.counter_is_rs1 = counter_is_rs1    # True: ble 计数, 上限；False: ble 下限, 计数
+        self.deltas = deltas                    # [(寄存器号, 每轮增量)]
+        self.delta = dict(deltas)[counter]      # 计数寄存器每轮的增量
+
+    def iterations(self, regs):
+        # 从当前寄存器值开始，循环体还会执行的轮数 (含分支不再跳转的最后一轮)
+        # 计数值会在中途越过 0/0xFFFF 回绕等无法直接算出的情况返回 None，交给普通执行
+        delta = self.delta
+        limit = regs[self.limit]
+        c1 = (regs[self.counter] + delta) & 0xFFFF # 第一轮之后的计数值
+
+        if self.counter_is_rs1:
+            if not c1 <= limit:
+                return 1
+            if delta > 0: # 计数递增，直到大于上限
+                n = (limit - c1) // delta + 2
+                return n if c1 + (n - 1) * delta <= 0xFFFF else None
+        else:
+            if not limit <= c1:
+                return 1
+            if delta < 0: # 计数递减，直到小于下限
+                n = (c1 - limit) // -delta + 2
+                return n if c1 + (n - 1) * delta >= 0 else None
+        return None
+
+
+def _analyze_counted_loop(simulator, start_pc, count):
+    # 判断 [start_pc, start_pc + count) 这个块是否为 CountedLoop 形式的计数循环，不是则返回 None
+    memory = simulator.memory
+    deltas = {}
+    for pc in range(start_pc, start_pc + count - 1):
+        name = OPCODE_NAMES.get(memory[pc] & 0xF)
+        _, rd, rs1, rs2, imm = simulator.decode_word(memory[pc])
+        if rd == 0 and name in ('addi', 'subi'): # 写 r0 的指令没有效果
+            continue
+        if name not in ('addi', 'subi') or rs1 != rd or rd in deltas:
+            return None
+        delta = imm if name == 'addi' else -imm
+        deltas[rd] = delta
+
+    last_word = memory[start_pc + count - 1]
+    if OPCODE_NAMES.get(last_word & 0xF) != 'ble':
+        return None
+    _, _, rs1, rs2, imm = simulator.decode_word(last_word)
+    if imm != -(count - 1): # 分支目标必须是块首
+        return None
+
+    if rs1 in deltas and rs2 not in deltas:
+        counter, limit, counter_is_rs1 = rs1, rs2, True
+    elif rs2 in deltas and rs1 not in deltas:
+        counter, limit, counter_is_rs1 = rs2, rs1, False
+    else:
+        return None
+    if deltas[counter] == 0:
+        return None
+    return CountedLoop(counter, limit, counter_is_rs1, list(deltas.items()))
+
+
+def _reg(idx):
+    # 读寄存器的表达式，r0 恒为 0
+    return '0' if idx == 0 else f'regs[{idx}]'
+
+
+# 各指令的代码生成函数：返回若干行源码 (不含缩进)
+# pc 为该指令的PC，i 为该指令在块内的序号 (之前已执行 i 条)
+
+def _emit_add(pc, i, rd, rs1, rs2, imm):
+    return [f'regs[{rd}] = ({_reg(rs1)} + {_reg(rs2)}) & 0xFFFF'] if rd else []
+
+def _emit_sub(pc, i, rd, rs1, rs2, imm):
+    return [f'regs[{rd}] = ({_reg(rs1)} - {_reg(rs2)}) & 0xFFFF'] if rd else []
+
+def _emit_and(pc, i, rd, rs1, rs2, imm):
+    return [f'regs[{rd}] = {_reg(rs1)} & {_reg(rs2)}'] if rd else []
+
+def _emit_or(pc, i, rd, rs1, rs2, imm):
+    return [f'regs[{rd}] = {_reg(rs1)} | {_reg(rs2)}'] if rd else []
+
+def _emit_addi(pc, i, rd, rs1, rs2, imm):
+    return [f'regs[{rd}] = ({_reg(rs1)} + {imm}) & 0xFFFF'] if rd else []
+
+def _emit_subi(pc, i, rd, rs1, rs2, imm):
+    return [f'regs[{rd}] = ({_reg(rs1)} - {imm}) & 0xFFFF'] if rd else []
+
+def _emit_lui(pc, i, rd, rs1, rs2, imm):
+    return [f'regs[{rd}] = {imm}'] if rd else []
+
+def _emit_address(pc, i, rs1, imm):
+    # 计算访存地址，越界 (打印错误并停止) 或访问被监视的字 (检查监视点) 时交给解释器处理
+    return [
+        f'a = ({_reg(rs1)} + {imm}) & 0xFFFF',
+        'wa = a >> 1',
+        f'if wa >= nwords or watch_flags[wa]: return {pc}, {i}',
+    ]
+
+def _emit_load_check(pc, i, width):
+    # 接有外设总线时检查地址映射 (与 Simulator16Bit._exec_lw/_exec_lb 相同)；块内第 i 条指令是第 step_count + i 步
+    return [f'if bus is not None: bus.on_load(a, {width}, {pc}, sim.step_count + {i})']
+
+def _emit_lw(pc, i, rd, rs1, rs2, imm):
+    lines = _emit_address(pc, i, rs1, imm) + _emit_load_check(pc, i, 2)
+    if rd:
+        lines.append(f'regs[{rd}] = mem[wa]')
+    return lines
+
+def _emit_lb(pc, i, rd, rs1, rs2, imm):
+    lines = _emit_address(pc, i, rs1, imm) + _emit_load_check(pc, i, 1)
+    if rd:
+        lines += [
+            'b = mem[wa] & 0xFF if a & 1 else mem[wa] >> 8',
+            f'regs[{rd}] = b | 0xFF00 if b & 0x80 else b', # 符号扩展
+        ]
+    return lines
+
+def _emit_store_tail(pc, i, value, width):
+    # 写入后通知外设总线并作废预解码记录；若写到已翻译的代码上，作废相关基本块并立即退出本块
+    return [
+        f'if bus is not None: bus.on_store(a, {value}, {width}, {pc}, sim.step_count + {i})',
+        'sim.dirty_pages[wa >> 8] = 1', # 快照按页 (256 字) 记录改动
+        'sim.decode_cache[wa] = None',
+        'if code_flags[wa]:',
+        '    sim.invalidate_code(wa)',
+        f'    return {pc + 1}, {i + 1}',
+    ]
+
+def _emit_sw(pc, i, rd, rs1, rs2, imm):
+    return _emit_address(pc, i, rs1, imm) + [f'mem[wa] = {_reg(rs2)}'] + _emit_store_tail(pc, i, _reg(rs2), 2)
+
+def _emit_sb(pc, i, rd, rs1, rs2, imm):
+    return _emit_address(pc, i, rs1, imm) + [
+        f'v = {_reg(rs2)} & 0xFF',
+        'mem[wa] = (mem[wa] & 0xFF00) | v if a & 1 else (v << 8) | (mem[wa] & 0x00FF)',
+    ] + _emit_store_tail(pc, i, 'v', 1)
+
+# 跳转/分支与 Simulator16Bit._exec_* 一致：目标为 当前PC + 偏移
+def _emit_beq(pc, i, rd, rs1, rs2, imm):
+    return [f'return ({(pc + imm) & 0xFFFF} if {_reg(rs1)} == {_reg(rs2)} else {pc + 1}), {i + 1}']
+
+def _emit_ble(pc, i, rd, rs1, rs2, imm):
+    return [f'return ({(pc + imm) & 0xFFFF} if {_reg(rs1)} <= {_reg(rs2)} else {pc + 1}), {i + 1}']
+
+def _emit_jal(pc, i, rd, rs1, rs2, imm):
+    lines = [f'regs[{rd}] = {(pc + 1) & 0xFFFF}'] if rd else []
+    return lines + [f'return {(pc + imm) & 0xFFFF}, {i + 1}']
+
+def _emit_jalr(pc, i, rd, rs1, rs2, imm):
+    lines = [f't = {_reg(rs1)}']
+    if rd:
+        lines.append(f'regs[{rd}] = {(pc + 1) & 0xFFFF}')
+    return lines + [f'return (t + {imm}) & 0xFFFF, {i + 1}']
+
+# 指令名 -> 代码生成函数；没有代码生成函数的指令会结束基本块，交给解释器执行
+EMITTERS = {
+    'add': _emit_add, 'sub': _emit_sub, 'and': _emit_and, 'or': _emit_or,
+    'addi': _emit_addi, 'subi': _emit_subi, 'lui': _emit_lui,
+    'lw': _emit_lw, 'lb': _emit_lb, 'sw': _emit_sw, 'sb': _emit_sb,
+    'beq': _emit_beq, 'ble': _emit_ble, 'jal': _emit_jal, 'jalr': _emit_jalr,
+}
+
+
+def compile_block(simulator, start_pc):
+    # 从 start_pc 开始收集基本块并翻译为 Python 函数；第一条指令就无法翻译时返回 None
+    memory = simulator.memory
+    body = []
+    pc = start_pc
+    count = 0
+    terminator = None
+
+    while count < MAX_BLOCK_LENGTH and pc < len(memory) and memory[pc] != 0:
+        word = memory[pc]
+        name = OPCODE_NAMES.get(word & 0xF)
+        emitter = EMITTERS.get(name)
+        if emitter is None:
+            break
+        _, rd, rs1, rs2, imm = simulator.decode_word(word)
+        body += emitter(pc, count, rd, rs1, rs2, imm)
+        count += 1
+        pc += 1
+        if name in BLOCK_TERMINATORS:
+            terminator = name
+            break
+
+    if count == 0:
+        return None
+
+    if terminator is None: # 块没有以跳转结束 (长度上限/全0指令/无法翻译的指令)，顺序执行到下一条
+        body.append(f'return {pc}, {count}')
+
+    last_pc = start_pc + count - 1
+    source = f'def block_{start_pc:04X}(regs, mem, sim):\n'
+    source += '    code_flags = sim.code_flags\n'
+    source += '    bus = sim.bus\n'
+    source += '    watch_flags = sim.watch_flags\n'
+    source += '\n'.join('    ' + line for line in body) + '\n'
+
+    namespace = {'nwords': len(memory)}
+    exec(compile(source, f'<block 0x{start_pc:04X}>', 'exec'), namespace)
+    fn = namespace[f'block_{start_pc:04X}']
+
+    self_loop = terminator in ('beq', 'ble', 'jal') # jalr 会改写寄存器，跳到自身也不一定是死循环
+    loop = _analyze_counted_loop(simulator, start_pc, count) if terminator == 'ble' and count > 1 else None
+    return CompiledBlock(fn, start_pc, count, last_pc, self_loop, source, loop)
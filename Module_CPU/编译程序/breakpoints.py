@@ -0,0 +1,128 @@
+# 条件断点：断点上可以附加条件表达式，只有条件成立时才停下
+#
+# 条件在设置断点时编译一次为 Python 函数 (参数为寄存器列表和内存数组)，执行到断点PC时直接调用，
+# 不会每步重新解析文本。表达式中可以使用:
+#   寄存器名       a4、sp、r7 等 (16位无符号值)
+#   mem8[地址]     字节 (地址为字节地址，偶地址为高8位，与 lb 一致，但不做符号扩展)
+#   mem16[地址]    字 (字节地址，忽略最低位，与 lw 一致)
+#   pc             当前PC (字地址)
+#   hits           本断点被执行到的次数 (包括这一次)
+#   steps          已执行的指令条数
+#   整数常量、+ - * // % & | ^ << >> ~、比较运算 (可连写)、and / or / not
+# 例如 "a4 == 0x1005"、"mem8[0x1000] > mem8[0x1001]"、"hits >= 100"
+#
+# Simulator16Bit.run_until 的 pc_breakpoints 可以是PC集合 (无条件断点)，
+# 也可以是字典 {PC: Breakpoint 或 None}，None 表示该PC为无条件断点
+# 条件在运行时出错 (如除以0) 时在该断点处停下，停止原因仍为 'breakpoint'，错误信息见 Breakpoint.error；机器状态不受影响
+
+import ast
+
+import pseudo as pse # 导入pseudo.py
+
+REGISTER_NAMES = dict(pse.register_alias)
+REGISTER_NAMES.update({f'r{i}': i for i in range(16)})
+
+MEMORY_NAMES = ('mem8', 'mem16')
+VARIABLE_NAMES = ('pc', 'hits', 'steps')
+
+# 条件表达式中允许出现的语法结点
+_ALLOWED_NODES = (
+    ast.Expression, ast.BoolOp, ast.And, ast.Or, ast.UnaryOp, ast.Not, ast.USub, ast.UAdd, ast.Invert,
+    ast.BinOp, ast.Add, ast.Sub, ast.Mult, ast.FloorDiv, ast.Mod, ast.BitAnd, ast.BitOr, ast.BitXor,
+    ast.LShift, ast.RShift, ast.Compare, ast.Eq, ast.NotEq, ast.Lt, ast.LtE, ast.Gt, ast.GtE,
+    ast.Constant, ast.Name, ast.Load, ast.Subscript,
+)
+
+
+def _mem8(mem, byte_addr):
+    word_addr = (byte_addr & 0xFFFF) >> 1
+    if word_addr >= len(mem):
+        return 0
+    word = mem[word_addr]
+    return word & 0xFF if byte_addr & 1 else word >> 8
+
+
+def _mem16(mem, byte_addr):
+    word_addr = (byte_addr & 0xFFFF) >> 1
+    return mem[word_addr] if word_addr < len(mem) else 0
+
+
+class _Rewriter(ast.NodeTransformer):
+    # 寄存器名 -> regs[i]，mem8[e] / mem16[e] -> _mem8(mem, e) / _mem16(mem, e)
+
+    def visit_Name(self, node):
+        if node.id in REGISTER_NAMES:
+            index = ast.Constant(REGISTER_NAMES[node.id])
+            return ast.copy_location(ast.Subscript(ast.Name('regs', ast.Load()), index, ast.Load()), node)
+        return node
+
+    def visit_Subscript(self, node):
+        func = ast.Name('_' + node.value.id, ast.Load())
+        call = ast.Call(func, [ast.Name('mem', ast.Load()), self.visit(node.slice)], [])
+        return ast.copy_location(call, node)
+
+
+def _validate(tree, text):
+    subscripted = {id(node.value) for node in ast.walk(tree) if isinstance(node, ast.Subscript)}
+    for node in ast.walk(tree):
+        if not isinstance(node, _ALLOWED_NODES):
+            raise ValueError(f"条件中不支持的语法 ({type(node).__name__}): '{text}'")
+        if isinstance(node, ast.Constant) and (isinstance(node.value, bool) or not isinstance(node.value, int)):
+            raise ValueError(f"条件中只能使用整数常量: '{text}'")
+        if isinstance(node, ast.Subscript):
+            if not isinstance(node.value, ast.Name) or node.value.id not in MEMORY_NAMES:
+                raise ValueError(f"只能对 mem8 / mem16 取下标: '{text}'")
+        elif isinstance(node, ast.Name) and id(node) not in subscripted and \
+                node.id not in REGISTER_NAMES and node.id not in VARIABLE_NAMES:
+            if node.id in MEMORY_NAMES:
+                raise ValueError(f"{node.id} 需要用 [地址] 访问: '{text}'")
+            raise ValueError(f"未知的名字 '{node.id}': '{text}'")
+
+
+def compile_condition(text):
+    # 把条件表达式编译为函数 test(regs, mem, pc, hits, steps)，语法错误或使用了不支持的名字时抛出 ValueError
+    try:
+        tree = ast.parse(text.strip(), mode='eval')
+    except SyntaxError as e:
+        raise ValueError(f"条件表达式语法错误: '{text}' ({e.msg})") from None
+    _validate(tree, text)
+
+    body = _Rewriter().visit(tree.body)
+    args = ast.arguments(posonlyargs=[], args=[ast.arg(name) for name in ('regs', 'mem', 'pc', 'hits', 'steps')],
+                         kwonlyargs=[], kw_defaults=[], defaults=[])
+    lambda_tree = ast.fix_missing_locations(ast.Expression(ast.Lambda(args, body)))
+    namespace = {'__builtins__': {}, '_mem8': _mem8, '_mem16': _mem16}
+    return eval(compile(lambda_tree, f'<condition {text!r}>', 'eval'), namespace)
+
+
+class Breakpoint:
+    __slots__ = ('condition', 'test', 'hits', 'error')
+
+    def __init__(self, condition=None):
+        self.condition = condition.strip() if condition and condition.strip() else None # 条件文本，None 为无条件
+        self.test = compile_condition(self.condition) if self.condition else None
+        self.hits = 0
+        self.error = None # 最近一次计算条件时的错误信息，没有出错时为 None
+
+    def should_stop(self, simulator):
+        # 执行到断点PC (该指令执行之前) 时调用：命中次数加一，条件成立时返回 True
+        # 条件计算出错时也返回 True (在这里停下让用户修改条件)，错误信息记在 self.error
+        self.hits += 1
+        self.error = None
+        if self.test is None:
+            return True
+        try:
+            return bool(self.test(simulator.registers, simulator.memory, simulator.pc, self.hits, simulator.step_count))
+        except Exception as e: # 除以0、负的移位数等
+            self.error = f"条件 '{self.condition}' 计算出错: {type(e).__name__}: {e}"
+            return True
+
+    def describe(self):
+        # 停在该断点时显示的说明
+        if self.error is not None:
+            return self.error
+        return f"{self.condition}, 第 {self.hits} 次执行到" if self.condition else f"第 {self.hits} 次执行到"
+
+    def __repr__(self):
+        return f"Breakpoint({self.condition!r}, hits={self.hits})"
+
@@ -0,0 +1,227 @@
+# 外设总线模型：按 design/DataMemory.v 的地址映射划分区域，写入外设地址时分发给设备对象
+#
+#   0x0000 - 0x0FFF   ROM (指令与 _data_lma 数据，读出 InstructionMemory 的内容)
+#   0x1000 - 0x103F   RAM (64 字节)
+#   0x2000 - 0x2003   LED1 - LED4 (写入数据的最低位)
+#   0x3000 - 0x3005   六个数码管 (从左到右，写入数据的低8位)
+#
+# 模拟器的内存仍是连续的 16384 字，CPU 读写的结果不变；总线在每次写入后被通知，
+# 由它把外设地址的写入交给设备对象，并记录哪些区域、哪些内存行被改动过 (脏集合)，
+# 界面和日志只需重绘改动过的外设和内存行。
+# 总线同时检查 CPU 的访存是否在地址映射之内 (CPU 的执行结果仍然不变)，与 DataMemory.v 不一致的访问记为 BusFault:
+#   写 ROM (开发板上被忽略)、读写 RAM 之后的地址 (0x1040 起，超出 RAM[0:63])、
+#   读外设地址 (开发板上读出的是 RAM 的内容) 以及其他未映射的地址
+# 通过 Simulator16Bit.attach_bus() 接入；可以用 MemoryBus.add_region() 挂接自定义设备。
+
+ROM_START = 0x0000
+RAM_START = 0x1000
+RAM_BYTES = 64
+LED_ADDR = 0x2000
+DIGIT_ADDR = 0x3000
+
+ROW_BYTES = 16 # 内存脏行的粒度 (字节)
+MAX_FAULTS = 100 # 最多保留的越界访问记录条数，之后只计数
+
+
+class Region:
+    # 一段字节地址区间 [start, end)；readable / writable 为 False 时 CPU 的读/写记为越界访问
+
+    def __init__(self, name, start, end, readable=True, writable=True):
+        self.name = name
+        self.start = start
+        self.end = end
+        self.readable = readable
+        self.writable = writable
+
+    def contains(self, byte_addr):
+        return self.start <= byte_addr < self.end
+
+    def reset(self):
+        pass
+
+
+class Device(Region):
+    # 内存映射 (MMIO) 设备的基类：子类实现 write()，offset 为相对区域起始的字节偏移
+    # value 为写入的数据：sb 为寄存器的低8位，sw 为整个16位寄存器值 (与 DataMemory.v 的 DataIn 一致)
+    # 外设只能写，读外设地址在开发板上读出的是 RAM 的内容
+
+    def __init__(self, name, start, end):
+        super().__init__(name, start, end, readable=False)
+
+    def write(self, offset, value, width):
+        raise NotImplementedError
+
+    def state(self):
+        return {}
+
+    def load_state(self, state):
+        # 恢复 state() 返回的状态 (从检查点恢复时使用)
+        pass
+
+
+class LedDevice(Device):
+
+    def __init__(self, name='led', start=LED_ADDR, count=4):
+        super().__init__(name, start, start + count)
+        self.leds = [0] * count
+
+    def write(self, offset, value, width):
+        self.leds[offset] = value & 1 # led <= DataIn[0]
+
+    def reset(self):
+        self.leds = [0] * len(self.leds)
+
+    def state(self):
+        return {'leds': list(self.leds)}
+
+    def load_state(self, state):
+        self.leds = list(state['leds'])
+
+
+class SevenSegmentDevice(Device):
+
+    def __init__(self, name='digits', start=DIGIT_ADDR, count=6):
+        super().__init__(name, start, start + count)
+        self.digits = [0] * count
+
+    def write(self, offset, value, width):
+        self.digits[offset] = value & 0xFF # digit[DAddress - digitAddress] = DataIn[7:0]
+
+    def reset(self):
+        self.digits = [0] * len(self.digits)
+
+    def state(self):
+        return {'digits': list(self.digits)}
+
+    def load_state(self, state):
+        self.digits = list(state['digits'])
+
+
+class BusFault:
+    __slots__ = ('kind', 'byte_addr', 'width', 'pc', 'step', 'region')
+
+    def __init__(self, kind, byte_addr, width, pc, step, region):
+        self.kind = kind            # 'load' / 'store'
+        self.byte_addr = byte_addr  # 访存的字节地址
+        self.width = width          # 字节数 (lb/sb 为1，lw/sw 为2)
+        self.pc = pc                # 访存指令的PC
+        self.step = step            # 访存指令是第几步 (从0开始)
+        self.region = region        # 地址所在区域名，未映射的地址为 None
+
+    def to_dict(self):
+        return {'kind': self.kind, 'byte_addr': self.byte_addr, 'width': self.width, 'pc': self.pc, 'step': self.step,
+                'region': self.region}
+
+    def describe(self):
+        action = '读取' if self.kind == 'load' else '写入'
+        where = f"{self.region} 区域" if self.region is not None else "未映射的地址"
+        return f"第 {self.step} 步 PC={self.pc} {action} {where} 0x{self.byte_addr:04X}"
+
+
+class MemoryBus:
+
+    def __init__(self):
+        self.regions = []          # 按添加顺序匹配，先添加的优先
+        self.devices = {}          # 设备的每个字节地址 -> 设备
+        self.dirty_regions = set() # 自上次 take_dirty() 以来被写过的区域名
+        self.dirty_rows = set()    # 自上次 take_dirty() 以来被写过的内存行 (字节地址 // ROW_BYTES)
+        self.all_dirty = True      # 为 True 时所有区域和内存行都需要重绘 (复位、加载程序后)
+        self.faults = []           # 地址映射之外的访存 (BusFault)，最多保留 MAX_FAULTS 条
+        self.fault_count = 0       # 地址映射之外的访存总次数
+        self.last_fault_step = -1  # 最近一次记录的越界访存的步数
+
+    def add_region(self, region):
+        self.regions.append(region)
+        if isinstance(region, Device):
+            for addr in range(region.start, region.end):
+                self.devices.setdefault(addr, region)
+        return region
+
+    def region_at(self, byte_addr):
+        for region in self.regions:
+            if region.contains(byte_addr):
+                return region
+        return None
+
+    def device(self, name):
+        for region in self.regions:
+            if region.name == name:
+                return region
+        return None
+
+    def on_store(self, byte_addr, value, width, pc=None, step=None):
+        # 模拟器每次写内存后调用：byte_addr 为写入的字节地址，width 为写入的字节数 (sb 为1，sw 为2)
+        # pc/step 为写入指令的PC和步数，CPU 执行的写入才检查地址映射 (加载程序、在界面上改内存时为 None)
+        self.dirty_rows.add(byte_addr // ROW_BYTES) # 写入的字的两个字节总在同一行
+
+        device = self.devices.get(byte_addr)
+        if device is not None:
+            device.write(byte_addr - device.start, value, width)
+            self.dirty_regions.add(device.name)
+            return
+
+        region = self.region_at(byte_addr)
+        if region is not None:
+            self.dirty_regions.add(region.name)
+        if pc is not None and (region is None or not region.writable):
+            self._fault('store', byte_addr, width, pc, step, region)
+
+    def on_load(self, byte_addr, width, pc, step):
+        # 模拟器执行 lb/lw 时调用，只检查地址映射
+        region = self.region_at(byte_addr)
+        if region is None or not region.readable:
+            self._fault('load', byte_addr, width, pc, step, region)
+
+    def _fault(self, kind, byte_addr, width, pc, step, region):
+        # 每条指令最多一次访存；执行历史回退后重新执行到的越界访存已经记录过 (执行是确定的)，不再重复记录
+        if step <= self.last_fault_step:
+            return
+        self.last_fault_step = step
+        self.fault_count += 1
+        if len(self.faults) < MAX_FAULTS:
+            self.faults.append(BusFault(kind, byte_addr, width, pc, step, region.name if region is not None else None))
+
+    def mark_all_dirty(self):
+        self.all_dirty = True
+
+    def take_dirty(self):
+        # 取出并清空脏集合，返回 (区域名集合, 内存行集合)；需要全部重绘时两者都为 None
+        if self.all_dirty:
+            regions, rows = None, None
+        else:
+            regions, rows = self.dirty_regions, self.dirty_rows
+        self.all_dirty = False
+        self.dirty_regions = set()
+        self.dirty_rows = set()
+        return regions, rows
+
+    def reset(self):
+        # 复位 (对应 DataMemory.v 的 RESET)：设备回到初始状态，所有内容需要重绘
+        for region in self.regions:
+            region.reset()
+        self.faults = []
+        self.fault_count = 0
+        self.last_fault_step = -1
+        self.mark_all_dirty()
+
+    def state(self):
+        # 所有设备的当前状态，例如 {'led': {'leds': [...]}, 'digits': {'digits': [...]}}
+        return {region.name: region.state() for region in self.regions if isinstance(region, Device)}
+
+    def load_state(self, states):
+        # 恢复 state() 返回的所有设备状态，所有内容需要重绘
+        for name, state in states.items():
+            device = self.device(name)
+            if isinstance(device, Device):
+                device.load_state(state)
+        self.mark_all_dirty()
+
+
+def board_bus():
+    # 与开发板上 DataMemory.v 一致的总线
+    bus = MemoryBus()
+    bus.add_region(Region('rom', ROM_START, RAM_START, writable=False))
+    bus.add_region(Region('ram', RAM_START, RAM_START + RAM_BYTES))
+    bus.add_region(LedDevice())
+    bus.add_region(SevenSegmentDevice())
+    return bus
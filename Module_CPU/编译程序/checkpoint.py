@@ -0,0 +1,152 @@
+# 检查点：把完整的机器状态 (寄存器、PC、内存映像、外设状态、已执行步数) 保存为带版本号的文件，之后从中恢复继续运行
+# 通过 Simulator16Bit.save_checkpoint() / load_checkpoint() 使用
+#
+# 文件格式 (小端):
+#   文件头   HEADER: 魔数、版本、内存映像偏移、内存字数、已执行步数、PC、上一条PC、是否停止、附加信息长度
+#            寄存器 16 x u16
+#   内存映像 位于 MEMORY_OFFSET 处，内存字数 x u16
+#   附加信息 JSON (UTF-8)：外设状态、机器码、PC到源码行的映射
+#
+# 恢复时整个文件以写时复制方式 mmap，小端机器上模拟器的内存直接是映射区上的 'H' 视图，不复制 32 KiB 内存映像；
+# 之后对内存的写入只改动进程内的私有页，不会写回文件
+#
+# 用法 (在 编译程序 目录下):
+#   python -m headless program2.txt --max-steps 100 --save-checkpoint run.ckpt
+#   python -m headless run.ckpt                     (从检查点继续运行)
+#   python -m checkpoint run.ckpt                   (查看检查点内容)
+
+import json
+import mmap
+import os
+import struct
+import sys
+from array import array
+
+import pseudo as pse # 导入pseudo.py
+
+MAGIC = b'CPUCKPT\x00'
+VERSION = 1
+HEADER = struct.Struct('<8sHHIQHHB3xI')
+REGISTERS = struct.Struct('<16H')
+MEMORY_OFFSET = 128 # 内存映像在文件中的偏移，文件头之后留有余量供以后的版本扩展
+
+
+def is_checkpoint(path):
+    try:
+        with open(path, 'rb') as f:
+            return f.read(len(MAGIC)) == MAGIC
+    except OSError:
+        return False
+
+
+def _memory_bytes(memory):
+    # 内存按小端 u16 写入文件
+    if sys.byteorder == 'little':
+        return memoryview(memory).cast('B') if isinstance(memory, memoryview) else memory.tobytes()
+    swapped = array('H', memory)
+    swapped.byteswap()
+    return swapped.tobytes()
+
+
+def save(simulator, path):
+    # 写入检查点；先写临时文件再改名，写到一半中断时不会留下损坏的检查点
+    meta = {
+        'bus': simulator.bus.state() if simulator.bus is not None else None,
+        'machine_code': list(simulator.machine_code),
+        'pc_to_source_line_map': list(simulator.pc_to_source_line_map),
+    }
+    meta_bytes = json.dumps(meta, separators=(',', ':')).encode('utf-8')
+    memory = simulator.memory
+
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'wb') as f:
+        f.write(HEADER.pack(MAGIC, VERSION, MEMORY_OFFSET, len(memory), simulator.step_count,
+                            simulator.pc, simulator.previous_pc, simulator.halted, len(meta_bytes)))
+        f.write(REGISTERS.pack(*simulator.registers))
+        f.write(bytes(MEMORY_OFFSET - HEADER.size - REGISTERS.size))
+        f.write(_memory_bytes(memory))
+        f.write(meta_bytes)
+    os.replace(tmp_path, path)
+
+
+class Checkpoint:
+    # 以 mmap 打开的检查点文件 (写时复制，不会改动文件)
+
+    def __init__(self, path):
+        with open(path, 'rb') as f:
+            self.data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_COPY)
+
+        if len(self.data) < MEMORY_OFFSET or self.data[:len(MAGIC)] != MAGIC:
+            raise ValueError(f"不是检查点文件: {path}")
+        (_, self.version, self.memory_offset, self.memory_words, self.step_count,
+         self.pc, self.previous_pc, halted, meta_length) = HEADER.unpack_from(self.data, 0)
+        if self.version != VERSION:
+            raise ValueError(f"不支持的检查点版本 {self.version} (当前为 {VERSION}): {path}")
+        self.halted = bool(halted)
+        self.registers = list(REGISTERS.unpack_from(self.data, HEADER.size))
+
+        memory_end = self.memory_offset + 2 * self.memory_words
+        if len(self.data) < memory_end + meta_length:
+            raise ValueError(f"检查点文件不完整: {path}")
+        self.memory_end = memory_end
+        self.meta = json.loads(self.data[memory_end:memory_end + meta_length].decode('utf-8'))
+
+    def memory(self):
+        # 内存映像：小端机器上为映射区上的 'H' 视图 (不复制)，否则为按字节序转换后的 array('H')
+        view = memoryview(self.data)[self.memory_offset:self.memory_end]
+        if sys.byteorder == 'little':
+            return view.cast('H')
+        memory = array('H', view.tobytes())
+        memory.byteswap()
+        return memory
+
+
+def load(simulator, path):
+    # 把检查点装入模拟器，返回 Checkpoint
+    checkpoint = Checkpoint(path)
+    if checkpoint.memory_words != simulator.MEMORY_WORDS:
+        raise ValueError(f"检查点的内存大小 ({checkpoint.memory_words} 字) 与模拟器 ({simulator.MEMORY_WORDS} 字) 不一致")
+
+    meta = checkpoint.meta
+    simulator.machine_code = meta.get('machine_code', [])
+    simulator.pc_to_source_line_map = meta.get('pc_to_source_line_map', [])
+    simulator.load_memory_image(checkpoint.memory())
+
+    simulator.registers[:] = checkpoint.registers
+    simulator.registers[0] = 0
+    simulator.pc = checkpoint.pc
+    simulator.previous_pc = checkpoint.previous_pc
+    simulator.halted = checkpoint.halted
+    simulator.step_count = checkpoint.step_count
+    if simulator.bus is not None and meta.get('bus'):
+        simulator.bus.load_state(meta['bus'])
+    if simulator.history is not None: # 从检查点所在的步数开始记录历史
+        simulator.history.add_snapshot(simulator)
+    return checkpoint
+
+
+def main(argv=None):
+    import argparse
+
+    parser = argparse.ArgumentParser(description="查看检查点文件的内容")
+    parser.add_argument('checkpoint', help="检查点文件")
+    parser.add_argument('--mem', default='0x1000:16', metavar='START:LEN', help="显示的内存区间 (默认 0x1000:16)")
+    args = parser.parse_args(argv)
+
+    checkpoint = Checkpoint(args.checkpoint)
+    print(f"版本 {checkpoint.version}, 第 {checkpoint.step_count} 步, PC = 0x{checkpoint.pc:04X}"
+          f"{' (已停止)' if checkpoint.halted else ''}")
+    print('  ' + '  '.join(f"{pse.reg_num_to_name[i]}={checkpoint.registers[i]}" for i in range(16)))
+    if checkpoint.meta.get('bus'):
+        print(f"外设: {json.dumps(checkpoint.meta['bus'], ensure_ascii=False)}")
+
+    start_str, _, length_str = args.mem.partition(':')
+    start, length = int(start_str, 0), int(length_str or '16', 0)
+    memory = checkpoint.memory()
+    values = [(memory[addr >> 1] & 0xFF) if addr & 1 else (memory[addr >> 1] >> 8) for addr in range(start, start + length)]
+    print(f"内存 0x{start:04X}: {values}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,62 @@
+# 核心接口：ISA 定义、汇编器、模拟器和无界面运行，不依赖 tkinter，供工作进程、CI 脚本等导入
+# 各名字在第一次访问时才导入所在的模块 (模块级 __getattr__)，import core 本身几乎没有开销
+#
+# 用法 (在 编译程序 目录下):
+#   import core
+#   words = core.assemble(lines)                 # 源码行 -> 内存映像 (16位整数列表)
+#   simulator = core.new_simulator()
+#   core.load_lines(simulator, lines)
+#   steps, stop_reason = simulator.run(100000)
+
+import importlib
+
+# 名字 -> (所在模块, 模块中的名字)
+_EXPORTS = {
+    # ISA
+    'opcode_map': ('pseudo', 'opcode_map'),
+    'instruction_format': ('pseudo', 'instruction_format'),
+    'register_alias': ('pseudo', 'register_alias'),
+    'reg_num_to_name': ('pseudo', 'reg_num_to_name'),
+    # 汇编器
+    'expand_pseudo_instructions': ('pseudo', 'expand_pseudo_instructions'),
+    'resolve_labels': ('pseudo', 'resolve_labels'),
+    'assemble_line': ('pseudo', 'assemble_line'),
+    'Instruction': ('pseudo', 'Instruction'),
+    'parse_instruction': ('pseudo', 'parse_instruction'),
+    'encode': ('pseudo', 'encode'),
+    'build_image': ('pseudo', 'build_image'),
+    'assemble_program': ('pseudo', 'assemble_program'),
+    'write_image_files': ('image_formats', 'write_image_files'),
+    'AssemblyCache': ('asm_cache', 'AssemblyCache'),
+    'link_files': ('linker', 'link_files'),
+    # 模拟器
+    'Simulator16Bit': ('simulator', 'Simulator16Bit'),
+    'new_simulator': ('headless', 'new_simulator'),
+    'load_lines': ('headless', 'load_lines'),
+    'load_program': ('headless', 'load_program'),
+    'run_file': ('headless', 'run_file'),
+    'TimingModel': ('timing', 'TimingModel'),
+    'Breakpoint': ('breakpoints', 'Breakpoint'),
+    'Watchpoint': ('watchpoints', 'Watchpoint'),
+}
+
+
+def __getattr__(name):
+    try:
+        module_name, attr = _EXPORTS[name]
+    except KeyError:
+        raise AttributeError(f"module 'core' has no attribute '{name}'") from None
+    value = getattr(importlib.import_module(module_name), attr)
+    globals()[name] = value # 之后直接从模块字典取得
+    return value
+
+
+def __dir__():
+    return sorted(list(globals()) + list(_EXPORTS))
+
+
+def assemble(lines):
+    # 汇编源码行，返回完整的内存映像 (ROM 128 字 + _data_lma 数据字)，与 machine_code_output.txt 的内容一致
+    import pseudo as pse
+    expanded_instr, label_map, data_lma_values, _ = pse.expand_pseudo_instructions(lines)
+    return pse.build_image(expanded_instr, label_map, data_lma_values)
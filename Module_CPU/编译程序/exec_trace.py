@@ -0,0 +1,258 @@
+# 执行轨迹：把每一步的 PC、指令字、寄存器或内存写入记录为定长二进制记录，供事后分析和回放
+# 通过 Simulator16Bit.start_trace() 开启，stop_trace() 结束并写完文件
+#
+# 文件格式 (小端):
+#   文件头   HEADER: 魔数、版本、记录长度、内存字数、记录条数、初始PC、结束PC
+#            初始寄存器 16 x u16，初始内存 (内存字数 x u16)
+#   记录     RECORD (12 字节): pc u16, 指令字 u16, 写入类型 u8, 保留 u8, 写入目标 u16, 新值 u16, 旧值 u16
+#            写入类型: 0 无写入, 1 写寄存器 (目标为寄存器号), 2 写内存 (目标为字地址)
+# 记录定长，第 N 步的记录位于 文件头之后 N * 12 字节处，可以 O(1) 定位
+#
+# 用法 (在 编译程序 目录下):
+#   python -m exec_trace record program2.txt -o run.trc
+#   python -m exec_trace show run.trc --step 100 --count 5
+
+import argparse
+import mmap
+import struct
+import sys
+from array import array
+
+import pseudo as pse # 导入pseudo.py
+
+MAGIC = b'CPUTRACE'
+VERSION = 1
+HEADER = struct.Struct('<8sHHIIHH')
+REGISTERS = struct.Struct('<16H')
+RECORD = struct.Struct('<HHBxHHH')
+
+WRITE_NONE, WRITE_REG, WRITE_MEM = 0, 1, 2
+KEYFRAME_INTERVAL = 16384 # 读取时每隔多少步缓存一次完整机器状态，加快 state_at()
+
+# 各指令格式写入的是寄存器 (rd) 还是内存
+_WRITES_REG = {'R', 'I', 'U', 'UJ'}
+_OPCODE_FORMATS = {int(code, 2): pse.instruction_format[name] for name, code in pse.opcode_map.items()}
+
+
+def _memory_bytes(memory):
+    # 内存按小端 u16 写入文件
+    if sys.byteorder == 'little':
+        return memory.tobytes()
+    swapped = array('H', memory)
+    swapped.byteswap()
+    return swapped.tobytes()
+
+
+class TraceWriter:
+
+    def __init__(self, path, simulator, chunk_records=65536):
+        self.file = open(path, 'wb')
+        self.count = 0
+        self.chunk = bytearray(RECORD.size * chunk_records) # 记录先写入缓冲区，满了再整块写入文件
+        self.chunk_used = 0
+        self.pending = None # 上一条指令的记录 (pc, 指令字, 写入类型, 目标, 旧值)，新值在下一次记录时读取
+        self.initial_pc = simulator.pc
+        self.initial_step = simulator.step_count
+
+        self.file.write(HEADER.pack(MAGIC, VERSION, RECORD.size, len(simulator.memory), 0, simulator.pc, simulator.pc))
+        self.file.write(REGISTERS.pack(*simulator.registers))
+        self.file.write(_memory_bytes(simulator.memory))
+
+    def record(self, simulator, decoded):
+        # 在执行一条指令之前调用 (decoded 为该指令的预解码记录)
+        # 指令每次最多写一个寄存器或一个内存字，执行前记下目标和旧值，执行后的新值在下一次调用时取得
+        # 执行历史回退后重新执行已记录过的步时不再记录 (执行是确定的)，轨迹中每一步只出现一次
+        if simulator.step_count < self.initial_step + self.count + (self.pending is not None):
+            return
+        if self.pending is not None:
+            self._finish_pending(simulator)
+
+        pc = simulator.pc
+        word = simulator.memory[pc]
+        _, rd, rs1, rs2, imm = decoded
+        fmt = _OPCODE_FORMATS.get(word & 0xF)
+        kind, target, old = WRITE_NONE, 0, 0
+        if fmt in _WRITES_REG and rd != 0:
+            kind, target, old = WRITE_REG, rd, simulator.registers[rd]
+        elif fmt == 'S':
+            word_addr = ((simulator.registers[rs1] + imm) & 0xFFFF) >> 1
+            if word_addr < len(simulator.memory): # 越界的写入会停止模拟器，不会写内存
+                kind, target, old = WRITE_MEM, word_addr, simulator.memory[word_addr]
+        self.pending = (pc, word, kind, target, old)
+
+    def finish_pending(self, simulator):
+        # 执行历史回退之前调用：此时的状态就是最后一条记录执行之后的状态
+        if self.pending is not None:
+            self._finish_pending(simulator)
+
+    def _finish_pending(self, simulator):
+        pc, word, kind, target, old = self.pending
+        self.pending = None
+        if kind == WRITE_REG:
+            new = simulator.registers[target]
+        elif kind == WRITE_MEM:
+            new = simulator.memory[target]
+        else:
+            new = 0
+
+        RECORD.pack_into(self.chunk, self.chunk_used, pc, word, kind, target, new, old)
+        self.chunk_used += RECORD.size
+        self.count += 1
+        if self.chunk_used == len(self.chunk):
+            self.file.write(self.chunk)
+            self.chunk_used = 0
+
+    def close(self, simulator):
+        # 写完最后一条记录和缓冲区，并在文件头中填入记录条数和结束PC
+        if self.file.closed:
+            return
+        if self.pending is not None:
+            self._finish_pending(simulator)
+        self.file.write(memoryview(self.chunk)[:self.chunk_used])
+        self.file.seek(0)
+        self.file.write(HEADER.pack(MAGIC, VERSION, RECORD.size, len(simulator.memory),
+                                    self.count, self.initial_pc, simulator.pc))
+        self.file.close()
+
+
+class TraceReader:
+    # 读取轨迹文件：record(n) 以 O(1) 取出第 n 步的记录，state_at(n) 重建执行 n 步之后的机器状态
+
+    def __init__(self, path, use_mmap=True):
+        with open(path, 'rb') as f:
+            if use_mmap:
+                self.data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            else:
+                self.data = f.read()
+
+        magic, version, record_size, memory_words, count, initial_pc, final_pc = HEADER.unpack_from(self.data, 0)
+        if magic != MAGIC or version != VERSION or record_size != RECORD.size:
+            raise ValueError(f"不是可识别的轨迹文件: {path}")
+        self.memory_words = memory_words
+        self.count = count
+        self.initial_pc = initial_pc
+        self.final_pc = final_pc
+
+        offset = HEADER.size
+        self.initial_registers = list(REGISTERS.unpack_from(self.data, offset))
+        offset += REGISTERS.size
+        self.initial_memory = array('H', self.data[offset:offset + 2 * memory_words])
+        if sys.byteorder != 'little':
+            self.initial_memory.byteswap()
+        self.records_offset = offset + 2 * memory_words
+        self.keyframes = {} # 步数 -> (寄存器, 内存)，state_at() 重建时顺带缓存
+
+    def __len__(self):
+        return self.count
+
+    def record(self, n):
+        # 第 n 步 (从0开始) 的记录: (pc, 指令字, 写入类型, 写入目标, 新值, 旧值)
+        if not 0 <= n < self.count:
+            raise IndexError(f"步数 {n} 超出轨迹范围 (共 {self.count} 步)")
+        return RECORD.unpack_from(self.data, self.records_offset + n * RECORD.size)
+
+    def records(self, start=0, stop=None):
+        stop = self.count if stop is None else min(stop, self.count)
+        for n in range(start, stop):
+            yield self.record(n)
+
+    def pc_at(self, n):
+        # 执行 n 步之后 (即第 n 步执行之前) 的 PC
+        return self.record(n)[0] if n < self.count else self.final_pc
+
+    def state_at(self, n):
+        # 重建执行 n 步之后的机器状态，返回 (寄存器列表, PC, 内存 array)
+        # 从不晚于 n 的最近缓存状态开始，按记录依次写回寄存器/内存
+        n = max(0, min(n, self.count))
+        start = max((k for k in self.keyframes if k <= n), default=0)
+        if start:
+            registers, memory = self.keyframes[start]
+            registers, memory = list(registers), array('H', memory)
+        else:
+            registers, memory = list(self.initial_registers), array('H', self.initial_memory)
+
+        for step in range(start, n):
+            _, _, kind, target, new, _ = RECORD.unpack_from(self.data, self.records_offset + step * RECORD.size)
+            if kind == WRITE_REG:
+                registers[target] = new
+            elif kind == WRITE_MEM:
+                memory[target] = new
+            if (step + 1) % KEYFRAME_INTERVAL == 0 and step + 1 not in self.keyframes:
+                self.keyframes[step + 1] = (list(registers), array('H', memory))
+
+        return registers, self.pc_at(n), memory
+
+    def replay(self, simulator, n):
+        # 把执行 n 步之后的状态装入模拟器 (程序需已加载，便于继续单步或运行)
+        registers, pc, memory = self.state_at(n)
+        simulator.registers[:] = registers
+        simulator.memory[:] = memory
+        simulator.pc = pc
+        simulator.previous_pc = self.record(n - 1)[0] if n > 0 else pc
+        simulator.halted = False
+        simulator.step_count = n
+        simulator.decode_cache[:] = [None] * len(simulator.decode_cache)
+        simulator.invalidate_code()
+        simulator.dirty_pages[:] = b'\x01' * len(simulator.dirty_pages)
+        if simulator.bus is not None:
+            simulator.bus.mark_all_dirty()
+
+    def close(self):
+        if isinstance(self.data, mmap.mmap):
+            self.data.close()
+
+
+def format_record(n, record):
+    pc, word, kind, target, new, old = record
+    text = f"{n:>8}  PC 0x{pc:04X}  {word >> 12 & 0xF:04b}_{word >> 8 & 0xF:04b}_{word >> 4 & 0xF:04b}_{word & 0xF:04b}"
+    if kind == WRITE_REG:
+        text += f"  {pse.reg_num_to_name[target]}: {old} -> {new}"
+    elif kind == WRITE_MEM:
+        text += f"  mem[0x{target * 2:04X}]: 0x{old:04X} -> 0x{new:04X}"
+    return text
+
+
+def main(argv=None):
+    import headless
+
+    parser = argparse.ArgumentParser(description="记录或查看二进制执行轨迹")
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    record_parser = commands.add_parser('record', help="运行程序并记录轨迹")
+    record_parser.add_argument('file', help="汇编源文件或机器码文件")
+    record_parser.add_argument('-o', '--output', required=True, help="轨迹文件")
+    record_parser.add_argument('--max-steps', type=int, default=100000, help="最多执行的指令条数 (默认 100000)")
+
+    show_parser = commands.add_parser('show', help="查看轨迹中的记录和机器状态")
+    show_parser.add_argument('trace', help="轨迹文件")
+    show_parser.add_argument('--step', type=int, default=0, help="从第几步开始显示 (默认 0)")
+    show_parser.add_argument('--count', type=int, default=10, help="显示的记录条数 (默认 10)")
+    args = parser.parse_args(argv)
+
+    if args.command == 'record':
+        simulator = headless.new_simulator()
+        success, _, message = headless.load_program(simulator, args.file)
+        if not success:
+            print(message, file=sys.stderr)
+            return 1
+        simulator.start_trace(args.output)
+        steps, stop_reason = simulator.run(args.max_steps)
+        simulator.stop_trace()
+        print(f"已记录 {steps} 步 ({stop_reason}) 到 {args.output}")
+        return 0
+
+    reader = TraceReader(args.trace)
+    try:
+        print(f"共 {len(reader)} 步")
+        for n, record in enumerate(reader.records(args.step, args.step + args.count), args.step):
+            print(format_record(n, record))
+        registers, pc, _ = reader.state_at(args.step)
+        print(f"\n第 {args.step} 步执行前: PC = 0x{pc:04X}")
+        print('  ' + '  '.join(f"{pse.reg_num_to_name[i]}={registers[i]}" for i in range(16)))
+    finally:
+        reader.close()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,224 @@
+# 无界面批量运行模拟器 (不导入 tkinter，无延时，不逐条打印)
+# 用法 (在 编译程序 目录下):
+#   python -m headless program2.txt
+#   python -m headless program2.txt machine_code_output.txt --max-steps 200000 --mem 0x1000:6 --mem 0x3000:6
+#   python -m headless program2.txt --watch w:0x1000:6    (写入 RAM 0x1000-0x1005 时停下)
+#   python -m headless program2.txt --break "17:mem8[0x1000] > mem8[0x1001]"    (PC 17 处条件成立时停下)
+#   python -m headless program2.txt --max-steps 100 --save-checkpoint run.ckpt
+#   python -m headless run.ckpt                        (从检查点继续运行)
+# 每个输入文件输出一行 JSON (寄存器、PC、执行步数、停止原因、指定内存区间的字节)
+
+import argparse
+import json
+import sys
+
+import pseudo as pse # 导入pseudo.py
+from simulator import Simulator16Bit
+import timing
+import watchpoints as wpt
+
+
+def is_machine_code_image(lines):
+    # 所有非空、非注释行都是16位二进制机器码时，认为是 machine_code_output.txt 格式的文件
+    has_code = False
+    for line in lines:
+        code = line.split('//')[0].split('#')[0].strip()
+        if not code:
+            continue
+        if Simulator16Bit.parse_word(code) is None:
+            return False
+        has_code = True
+    return has_code
+
+
+def parse_mem_range(text):
+    # 解析 "起始字节地址:字节数"，如 "0x1000:6"；省略字节数时默认16字节
+    start_str, _, length_str = text.partition(':')
+    start = int(start_str, 0)
+    length = int(length_str, 0) if length_str else 16
+    if start < 0 or length <= 0:
+        raise argparse.ArgumentTypeError(f"无效的内存区间: '{text}'")
+    return start, length
+
+
+def parse_watch(text):
+    try:
+        return wpt.parse_watch_spec(text)
+    except ValueError as e:
+        raise argparse.ArgumentTypeError(str(e))
+
+
+def parse_break(text):
+    # "PC[:条件]"，条件在这里先编译一次以便尽早报告错误
+    import breakpoints as brk
+    pc_str, _, condition = text.partition(':')
+    try:
+        pc = int(pc_str, 0)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"无效的断点PC: '{text}'")
+    if condition.strip():
+        try:
+            brk.compile_condition(condition)
+        except ValueError as e:
+            raise argparse.ArgumentTypeError(str(e))
+    return pc, condition
+
+
+def load_lines(simulator, lines):
+    # 根据内容加载汇编源码或机器码，返回 (是否成功, 文件格式, 信息)
+    if is_machine_code_image(lines):
+        success, message = simulator.load_machine_code_image(lines)
+        return success, 'image', message
+
+    expanded_instr, label_map, data_lma_values, source_lines_for_expanded = \
+        pse.expand_pseudo_instructions(lines)
+    success, message = simulator.load_program_from_source(
+        expanded_instr, label_map, data_lma_values, source_lines_for_expanded
+    )
+    return success, 'asm', message
+
+
+def load_program(simulator, path):
+    # 根据文件内容加载汇编源码、机器码或检查点文件，返回 (是否成功, 文件格式, 信息)
+    import checkpoint
+    if checkpoint.is_checkpoint(path):
+        simulator.load_checkpoint(path)
+        return True, 'checkpoint', f"已从检查点恢复: 第 {simulator.step_count} 步"
+
+    with open(path, 'r', encoding='utf-8') as f:
+        lines = f.read().splitlines()
+    return load_lines(simulator, lines)
+
+
+def new_simulator():
+    # 无界面运行用的模拟器：不逐条打印
+    simulator = Simulator16Bit()
+    simulator.verbose = False
+    return simulator
+
+
+def read_mem_ranges(simulator, mem_ranges):
+    # 读取若干内存区间的字节，键为起始字节地址的十六进制字符串
+    return {
+        f"0x{start:04X}": [simulator.read_byte(addr) for addr in range(start, start + length)
+                           if (addr >> 1) < len(simulator.memory)]
+        for start, length in mem_ranges
+    }
+
+
+def run_file(path, max_steps=100000, mem_ranges=(), simulator=None, lines=None, inputs=None,
+             timing_model=None, realtime=False, watchpoints=None, pc_breakpoints=None, save_checkpoint=None):
+    # 运行单个程序文件，返回可直接序列化为 JSON 的结果字典
+    # simulator: 复用的模拟器 (批量运行时每个进程一个)；lines: 直接给出的程序内容，此时 path 只作为名字
+    # inputs: 运行前写入内存的数据 {起始字节地址: [字节, ...]}
+    # timing_model: 换算开发板运行时间用的 timing.TimingModel (默认 50 MHz)；realtime: 按开发板时钟实时执行
+    # watchpoints: 内存监视点 (watchpoints.Watchpoint 列表)，命中时停止运行，停止原因为 'watchpoint'
+    # pc_breakpoints: 断点 {PC: breakpoints.Breakpoint 或 None}，与 run_until 相同，停止原因为 'breakpoint'
+    # save_checkpoint: 运行结束后把机器状态保存到该检查点文件；path 本身是检查点文件时从它继续运行
+    if timing_model is None:
+        timing_model = timing.TimingModel()
+    if simulator is None:
+        simulator = new_simulator()
+    simulator.registers[:] = [0] * 16 # 复用模拟器时清除上一个程序留下的寄存器值
+    result = {'file': path}
+
+    try:
+        if lines is None:
+            success, file_format, message = load_program(simulator, path)
+        else:
+            success, file_format, message = load_lines(simulator, lines)
+    except Exception as e:
+        success, file_format, message = False, None, str(e)
+    result['format'] = file_format
+
+    if not success:
+        result['stop_reason'] = 'load_error'
+        result['error'] = message
+        return result
+
+    for start, values in (inputs or {}).items():
+        for offset, value in enumerate(values):
+            simulator.write_byte(start + offset, value)
+
+    if watchpoints is not None:
+        simulator.clear_watchpoints()
+        for wp in watchpoints: # 每次运行使用新的监视点对象，命中次数从0开始
+            simulator.add_watchpoint(wp.start, wp.length, wp.read, wp.write, wp.change)
+
+    if realtime:
+        steps, stop_reason = timing.RealTimePacer(simulator, timing_model).run(max_steps, pc_breakpoints)
+    else:
+        steps, stop_reason = simulator.run_until(max_steps, pc_breakpoints)
+
+    if save_checkpoint:
+        simulator.save_checkpoint(save_checkpoint)
+        result['checkpoint'] = save_checkpoint
+
+    result['steps'] = steps
+    result['stop_reason'] = stop_reason
+    result['cycles'] = timing_model.cycles(simulator)
+    result['board_seconds'] = timing_model.board_time(simulator)
+    result['pc'] = simulator.pc
+    result['registers'] = {pse.reg_num_to_name[i]: simulator.registers[i] for i in range(16)}
+    result['memory'] = read_mem_ranges(simulator, mem_ranges)
+    if stop_reason == 'error' and simulator.last_error is not None:
+        result['error'] = simulator.last_error
+    if simulator.bus is not None and simulator.bus.fault_count: # 接有总线时报告地址映射之外的访存
+        result['bus_faults'] = {'count': simulator.bus.fault_count,
+                                'faults': [fault.to_dict() for fault in simulator.bus.faults]}
+    if stop_reason == 'watchpoint':
+        result['watch_hit'] = simulator.watch_hit.to_dict()
+    if stop_reason == 'breakpoint' and pc_breakpoints:
+        breakpoint = pc_breakpoints[simulator.pc] if isinstance(pc_breakpoints, dict) else None
+        result['breakpoint'] = {'pc': simulator.pc, 'condition': breakpoint.condition, 'hits': breakpoint.hits} \
+            if breakpoint is not None else {'pc': simulator.pc}
+        if breakpoint is not None and breakpoint.error is not None:
+            result['breakpoint']['error'] = breakpoint.error
+    return result
+
+
+def main(argv=None):
+    import breakpoints
+
+    parser = argparse.ArgumentParser(description="无界面运行16位CPU模拟器，以 JSON 输出运行结果")
+    parser.add_argument('files', nargs='+', help="汇编源文件、machine_code_output.txt 格式的机器码文件或检查点文件")
+    parser.add_argument('--max-steps', type=int, default=100000, help="最多执行的指令条数 (默认 100000)")
+    parser.add_argument('--mem', type=parse_mem_range, action='append', default=[],
+                        metavar='START:LEN', help="要输出的内存区间 (字节地址:字节数)，可重复指定")
+    parser.add_argument('--watch', type=parse_watch, action='append', default=None, metavar='KIND:START[:LEN]',
+                        help="内存监视点，类型为 r(读)/w(写)/c(值改变) 的组合，如 w:0x1000:6，可重复指定")
+    parser.add_argument('--break', dest='breaks', type=parse_break, action='append', default=[], metavar='PC[:COND]',
+                        help="断点PC (字地址)，可附加条件，如 17:a4==0x1005，可重复指定")
+    parser.add_argument('--bus', action='store_true',
+                        help="接入开发板的地址映射 (DataMemory.v)，在结果的 bus_faults 中报告写ROM、读外设等映射之外的访存")
+    parser.add_argument('--save-checkpoint', metavar='PATH', help="运行结束后保存检查点 (只能指定一个输入文件)")
+    parser.add_argument('--clock', type=float, default=timing.DEFAULT_CLOCK_HZ,
+                        help="开发板时钟频率 Hz，用于换算运行时间 (默认 50e6)")
+    parser.add_argument('--realtime', action='store_true', help="按开发板时钟的速度实时执行")
+    parser.add_argument('-o', '--output', help="结果写入的文件 (默认输出到标准输出)")
+    args = parser.parse_args(argv)
+    if args.save_checkpoint and len(args.files) > 1:
+        parser.error("--save-checkpoint 只能用于单个输入文件")
+    timing_model = timing.TimingModel(args.clock)
+
+    out = open(args.output, 'w', encoding='utf-8') if args.output else sys.stdout
+    failed = False
+    try:
+        for path in args.files:
+            pc_breakpoints = {pc: breakpoints.Breakpoint(condition) for pc, condition in args.breaks} # 每个文件重新计数
+            simulator = new_simulator()
+            if args.bus:
+                simulator.attach_bus()
+            result = run_file(path, args.max_steps, args.mem, simulator=simulator, timing_model=timing_model,
+                              realtime=args.realtime, watchpoints=args.watch, pc_breakpoints=pc_breakpoints or None,
+                              save_checkpoint=args.save_checkpoint)
+            failed = failed or result['stop_reason'] in ('load_error', 'error')
+            out.write(json.dumps(result, ensure_ascii=False) + '\n')
+    finally:
+        if out is not sys.stdout:
+            out.close()
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,196 @@
+# 执行历史：机器快照 (按页写时复制的内存) 与撤销日志，用于后退单步和跳到第K步
+#
+# 快照只复制自上一个快照以来被写过的内存页，其余页直接共享上一个快照的 bytes 对象
+# 撤销日志每条指令只记录它改写的一个寄存器或一个内存字的旧值，以及执行前的PC
+# 接有外设总线时，快照同时保存所有设备的状态，写外设地址的指令在日志中记录该设备写入前的状态
+# (设备状态不能从内存内容推出，例如 sw 写 LED 时取的是寄存器的最低位)
+# 开启剖析时，快照同时保存剖析计数，后退时撤销被撤销指令的计数，剖析结果始终对应当前步数 (TimingModel.cycles 也是)
+# 记录轨迹时，回退后重新执行已记录过的步不再写入轨迹 (见 exec_trace.TraceWriter.record)
+
+from array import array
+from collections import deque
+
+PAGE_WORDS = 256 # 每页的字数，16384 字的内存共 64 页
+ZERO_PAGE = bytes(2 * PAGE_WORDS) # 全0页，所有快照共享
+
+
+class MachineSnapshot:
+    __slots__ = ('registers', 'pc', 'previous_pc', 'halted', 'step_count', 'pages', 'devices', 'profile')
+
+    def __init__(self, registers, pc, previous_pc, halted, step_count, pages, devices=None, profile=None):
+        self.registers = registers      # 寄存器值 (tuple)
+        self.pc = pc
+        self.previous_pc = previous_pc
+        self.halted = halted
+        self.step_count = step_count    # 快照时已执行的指令条数
+        self.pages = pages              # 每页内存内容 (bytes)，未改动的页与上一个快照共享
+        self.devices = devices          # 外设状态 (bus.MemoryBus.state())，没有接总线时为 None
+        self.profile = profile          # (剖析器, Profiler.state())，没有开启剖析时为 None
+
+
+def take_snapshot(simulator, base=None):
+    # 生成快照；base 为上一个快照，simulator.dirty_pages 中未置位的页直接复用 base 的页
+    memory = simulator.memory
+    dirty = simulator.dirty_pages
+    pages = []
+    for page in range(len(dirty)):
+        if base is not None and not dirty[page]:
+            pages.append(base.pages[page])
+            continue
+        data = memory[page * PAGE_WORDS:(page + 1) * PAGE_WORDS].tobytes()
+        pages.append(ZERO_PAGE if data == ZERO_PAGE else data)
+    dirty[:] = bytes(len(dirty))
+
+    devices = simulator.bus.state() if simulator.bus is not None else None
+    profiler = simulator.profiler
+    profile = (profiler, profiler.state()) if profiler is not None else None
+    return MachineSnapshot(tuple(simulator.registers), simulator.pc, simulator.previous_pc,
+                           simulator.halted, simulator.step_count, tuple(pages), devices, profile)
+
+
+def _finish_trace(simulator):
+    # 回退之前调用：轨迹中最后一条记录的新值要在回退前的状态中取得
+    if simulator.tracer is not None:
+        simulator.tracer.finish_pending(simulator)
+
+
+def restore_snapshot(simulator, snapshot, base=None):
+    # 恢复快照；base 为内存当前对应的快照，只需写回与其不同或被改写过的页
+    _finish_trace(simulator)
+    memory = simulator.memory
+    dirty = simulator.dirty_pages
+    changed = False
+    for page, data in enumerate(snapshot.pages):
+        if base is not None and not dirty[page] and base.pages[page] is data:
+            continue
+        memory[page * PAGE_WORDS:(page + 1) * PAGE_WORDS] = array('H', data)
+        changed = True
+    dirty[:] = bytes(len(dirty))
+
+    simulator.registers[:] = snapshot.registers
+    simulator.pc = snapshot.pc
+    simulator.previous_pc = snapshot.previous_pc
+    simulator.halted = snapshot.halted
+    simulator.step_count = snapshot.step_count
+    if simulator.bus is not None and snapshot.devices is not None: # LED/数码管回到快照时的状态，并全部重绘
+        simulator.bus.load_state(snapshot.devices)
+    profiler = simulator.profiler
+    if profiler is not None:
+        if snapshot.profile is not None and snapshot.profile[0] is profiler:
+            profiler.load_state(snapshot.profile[1])
+        else: # 快照早于本次剖析，从快照处重新开始统计
+            profiler.clear(snapshot.step_count)
+    if changed: # 代码可能被改写过，预解码记录和基本块全部作废
+        simulator.decode_cache[:] = [None] * len(simulator.decode_cache)
+        simulator.invalidate_code()
+
+
+class ExecutionHistory:
+    # 撤销日志 + 周期性快照
+    # journal 中每条记录为 (pc, previous_pc, halted, 寄存器号, 寄存器旧值, 字地址, 字旧值, 设备旧状态)，
+    # 字地址为 -1 表示没有写内存；设备旧状态为 (设备名, state())，不是写外设地址时为 None
+
+    def __init__(self, snapshot_interval=10000, max_journal=1000000, max_snapshots=256):
+        self.snapshot_interval = snapshot_interval
+        self.max_snapshots = max_snapshots
+        self.journal = deque(maxlen=max_journal)
+        self.snapshots = [] # 按 step_count 递增排列
+
+    def clear(self):
+        self.journal.clear()
+        self.snapshots = []
+
+    def add_snapshot(self, simulator):
+        # 记录当前状态的快照 (内存页与最近的快照共享)
+        # 回退后重新执行时，时间线上更晚的快照仍然有效 (程序执行是确定的)，同一步只保留一个快照
+        if any(s.step_count == simulator.step_count for s in self.snapshots):
+            return
+        snapshot = take_snapshot(simulator, simulator.last_snapshot)
+        simulator.last_snapshot = snapshot
+        self.snapshots.append(snapshot)
+        self.snapshots.sort(key=lambda s: s.step_count)
+        if len(self.snapshots) > self.max_snapshots:
+            del self.snapshots[1] # 保留第0步的快照，丢弃最早的其余快照
+
+    def record(self, simulator, decoded, step_index):
+        # 在执行一条指令之前调用：记录它将改写的寄存器或内存字的旧值
+        if step_index % self.snapshot_interval == 0:
+            self.add_snapshot(simulator)
+
+        handler, rd, rs1, rs2, imm = decoded
+        regs = simulator.registers
+        word_addr = -1
+        old_word = 0
+        old_device = None
+        if handler in simulator.store_handlers:
+            byte_addr = (regs[rs1] + imm) & 0xFFFF
+            word_addr = byte_addr >> 1
+            if word_addr < len(simulator.memory):
+                old_word = simulator.memory[word_addr]
+                device = simulator.bus.devices.get(byte_addr) if simulator.bus is not None else None
+                if device is not None:
+                    old_device = (device.name, device.state())
+            else:
+                word_addr = -1 # 访存越界，指令会停止模拟器，不会写内存
+            rd = 0
+        self.journal.append((simulator.pc, simulator.previous_pc, simulator.halted,
+                             rd, regs[rd], word_addr, old_word, old_device))
+
+    def step_back(self, simulator, n=1):
+        # 撤销最近执行的 n 条指令，返回实际撤销的条数 (受日志长度限制)
+        journal = self.journal
+        regs = simulator.registers
+        memory = simulator.memory
+        profiler = simulator.profiler
+        undone = 0
+        _finish_trace(simulator)
+        while undone < n and journal:
+            pc, previous_pc, halted, rd, old_reg, word_addr, old_word, old_device = journal.pop()
+            regs[rd] = old_reg
+            if word_addr >= 0:
+                memory[word_addr] = old_word
+                simulator.decode_cache[word_addr] = None
+                simulator.dirty_pages[word_addr // PAGE_WORDS] = 1
+                if simulator.code_flags[word_addr]:
+                    simulator.invalidate_code(word_addr)
+            if old_device is not None and simulator.bus is not None:
+                simulator.bus.load_state({old_device[0]: old_device[1]})
+            simulator.pc = pc
+            simulator.previous_pc = previous_pc
+            simulator.halted = halted
+            simulator.step_count -= 1
+            if profiler is not None:
+                decoded = simulator.fetch_decoded()
+                if decoded[0] is not None: # 非法指令不计入剖析
+                    profiler.unrecord(simulator, decoded)
+            undone += 1
+        regs[0] = 0
+        return undone
+
+    def go_to_step(self, simulator, target_step):
+        # 跳到第 target_step 步 (已执行 target_step 条指令时的状态)，返回实际到达的步数
+        # 向后：日志足够时逐条撤销，否则恢复不晚于目标的最近快照再向前执行
+        # 向前：带日志地继续执行 (遇到停止条件时提前结束)
+        target_step = max(0, target_step)
+        current = simulator.step_count
+
+        if target_step < current:
+            if current - target_step <= len(self.journal):
+                self.step_back(simulator, current - target_step)
+            else:
+                candidates = [s for s in self.snapshots if s.step_count <= target_step]
+                if not candidates:
+                    return simulator.step_count
+                snapshot = candidates[-1]
+                # 快照之后的日志记录已失效，之前的仍然有效
+                for _ in range(min(len(self.journal), current - snapshot.step_count)):
+                    self.journal.pop()
+                restore_snapshot(simulator, snapshot, simulator.last_snapshot)
+                simulator.last_snapshot = snapshot
+
+        while target_step > simulator.step_count:
+            _, reason = simulator.run_until(target_step - simulator.step_count, jit=False)
+            if reason != 'watchpoint': # 重新执行时经过监视点不停下
+                break
+
+        return simulator.step_count
@@ -0,0 +1,94 @@
+# 内存映像 (16位整数列表，见 pseudo.build_image) 的其他输出格式，供上传程序和 Verilog 仿真直接使用，不必再解析 0000_0000_0000_0000 文本
+#   bin   原始二进制，每个字低字节在前 (小端，与 ByteByByteSender 发送的字节顺序相同)
+#   hex   Intel HEX，字节顺序与 bin 相同，地址为字节地址
+#   memh  $readmemh 文件，每行一个字 (4位十六进制)，补0到 ROM[0:255] 的 256 行
+#   memb  $readmemb 文件，每行一个字 (16位二进制)，补0到 256 行
+#
+# 用法 (在 编译程序 目录下):
+#   python pseudo.py program2.txt -o out.txt --format all       (同时生成 out.txt/out.bin/out.hex/out.memh/out.memb)
+#   image_formats.write_image_files(words, 'out', ['bin', 'memh'])
+
+import os
+
+ROM_DEPTH = 256 # InstructionMemory.v 中 reg[15:0] ROM[0:255]
+HEX_RECORD_BYTES = 16 # Intel HEX 每条数据记录的字节数
+
+
+def to_bin(words):
+    # 内存映像 -> 小端字节串
+    data = bytearray()
+    for word in words:
+        data.append(word & 0xFF)
+        data.append((word >> 8) & 0xFF)
+    return bytes(data)
+
+
+def _hex_record(address, record_type, payload):
+    record = bytes([len(payload), (address >> 8) & 0xFF, address & 0xFF, record_type]) + payload
+    checksum = (-sum(record)) & 0xFF
+    return ':' + record.hex().upper() + f'{checksum:02X}'
+
+
+def to_intel_hex(words):
+    # 内存映像 -> Intel HEX 文本 (只用数据记录和结束记录，16位地址最多 64KB，足够放下 16384 个字的内存)
+    data = to_bin(words)
+    if len(data) > 0x10000:
+        raise ValueError(f"映像共 {len(data)} 字节，超过 Intel HEX 16位地址的范围")
+    lines = [_hex_record(start, 0x00, data[start:start + HEX_RECORD_BYTES])
+             for start in range(0, len(data), HEX_RECORD_BYTES)]
+    lines.append(_hex_record(0, 0x01, b''))
+    return '\n'.join(lines) + '\n'
+
+
+def _readmem_words(words, depth):
+    words = list(words)
+    if len(words) > depth:
+        raise ValueError(f"映像共 {len(words)} 个字，放不下 ROM[0:{depth - 1}]")
+    return words + [0] * (depth - len(words))
+
+
+def to_readmemh(words, depth=ROM_DEPTH):
+    # 内存映像 -> $readmemh 文件内容，补0到 depth 行
+    lines = [f'// $readmemh: ROM[0:{depth - 1}]']
+    lines.extend(f'{word & 0xFFFF:04X}' for word in _readmem_words(words, depth))
+    return '\n'.join(lines) + '\n'
+
+
+def to_readmemb(words, depth=ROM_DEPTH):
+    # 内存映像 -> $readmemb 文件内容 (每行16位二进制)，补0到 depth 行
+    lines = [f'// $readmemb: ROM[0:{depth - 1}]']
+    lines.extend(f'{word & 0xFFFF:016b}' for word in _readmem_words(words, depth))
+    return '\n'.join(lines) + '\n'
+
+
+# 格式名 -> (扩展名, 转换函数, 是否为二进制文件)
+FORMATS = {
+    'bin': ('.bin', to_bin, True),
+    'hex': ('.hex', to_intel_hex, False),
+    'memh': ('.memh', to_readmemh, False),
+    'memb': ('.memb', to_readmemb, False),
+}
+
+
+def write_image_files(words, base_path, formats=FORMATS):
+    # 把同一个内存映像写成 formats 中的各个格式，文件名为 base_path + 扩展名，返回写入的文件路径列表
+    # 先全部转换再写文件，某个格式出错 (如超出 ROM[0:255]) 时不会留下一部分新、一部分旧的文件
+    words = list(words)
+    outputs = []
+    for name in formats:
+        extension, convert, binary = FORMATS[name]
+        outputs.append((base_path + extension, convert(words), binary))
+
+    for path, content, binary in outputs:
+        if binary:
+            with open(path, 'wb') as f:
+                f.write(content)
+        else:
+            with open(path, 'w', encoding='utf-8') as f:
+                f.write(content)
+    return [path for path, _, _ in outputs]
+
+
+def output_base(output_filename):
+    # machine_code_output.txt -> machine_code_output (其他格式的文件与文本输出放在一起)
+    return os.path.splitext(output_filename)[0]
@@ -0,0 +1,96 @@
+# 导入时间基准：在新的解释器进程中分别导入各核心模块，测量导入耗时，并检查没有带入 tkinter/numpy
+# 任一模块超过时间预算或导入了不该导入的模块时返回非0，可在 CI 中发现启动变慢
+#
+# 用法 (在 编译程序 目录下):
+#   python -m import_bench
+#   python -m import_bench --repeat 10 --budget simulator=20 --json import_times.json
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+# 模块 -> 默认的导入时间预算 (毫秒，取多次中的最小值)
+DEFAULT_BUDGETS_MS = {
+    'core': 5,
+    'pseudo': 5,
+    'simulator': 15,
+    'headless': 30,
+    'batch': 30,
+}
+
+# 无界面使用的模块不应带入的模块
+FORBIDDEN_MODULES = ('tkinter', 'numpy')
+
+_PROBE = '''
+import sys, time
+start = time.perf_counter()
+import {module}
+elapsed = time.perf_counter() - start
+print(elapsed * 1000)
+print(','.join(name for name in {forbidden!r} if name in sys.modules))
+'''
+
+
+def measure(module, repeat=5, directory=None):
+    # 在 repeat 个新进程中导入 module，返回 (最短导入时间 ms, 被带入的禁止模块列表)
+    directory = directory or os.path.dirname(os.path.abspath(__file__))
+    code = _PROBE.format(module=module, forbidden=FORBIDDEN_MODULES)
+    # 测量的是有字节码缓存时的导入时间：允许写入 __pycache__，第一次运行只用于生成缓存，不计入结果
+    env = dict(os.environ)
+    env.pop('PYTHONDONTWRITEBYTECODE', None)
+    times = []
+    pulled_in = set()
+    for run in range(repeat + 1):
+        out = subprocess.run([sys.executable, '-c', code], cwd=directory, env=env,
+                             capture_output=True, text=True, check=True)
+        elapsed, names = out.stdout.splitlines()[-2:] # 最后两行为耗时和带入的禁止模块
+        if run:
+            times.append(float(elapsed))
+        pulled_in.update(name for name in names.split(',') if name)
+    return min(times), sorted(pulled_in)
+
+
+def parse_budget(text):
+    module, _, ms = text.partition('=')
+    try:
+        return module, float(ms)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"无效的预算: '{text}' (格式为 模块=毫秒)")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="测量核心模块的导入时间，超过预算或导入 tkinter/numpy 时返回非0")
+    parser.add_argument('modules', nargs='*', help="要测量的模块 (默认为 core pseudo simulator headless batch)")
+    parser.add_argument('--repeat', type=int, default=5, help="每个模块导入的次数，取最小值 (默认 5)")
+    parser.add_argument('--budget', type=parse_budget, action='append', default=[], metavar='MODULE=MS',
+                        help="覆盖某个模块的时间预算 (毫秒)，可重复指定")
+    parser.add_argument('--json', help="结果写入的 JSON 文件")
+    args = parser.parse_args(argv)
+
+    budgets = dict(DEFAULT_BUDGETS_MS)
+    budgets.update(args.budget)
+    modules = args.modules or list(DEFAULT_BUDGETS_MS)
+
+    results = []
+    failed = False
+    for module in modules:
+        best_ms, pulled_in = measure(module, args.repeat)
+        budget = budgets.get(module)
+        ok = (budget is None or best_ms <= budget) and not pulled_in
+        failed = failed or not ok
+        results.append({'module': module, 'ms': round(best_ms, 3), 'budget_ms': budget,
+                        'forbidden_imports': pulled_in, 'ok': ok})
+        budget_text = f"{budget:g} ms" if budget is not None else "-"
+        extra = f"  导入了 {', '.join(pulled_in)}" if pulled_in else ''
+        print(f"{'OK  ' if ok else 'FAIL'} {module:<12} {best_ms:8.2f} ms  (预算 {budget_text}){extra}")
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
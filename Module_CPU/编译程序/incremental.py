@@ -0,0 +1,131 @@
+# 增量汇编：编辑器中每次修改后重新汇编时，只处理变化了的部分 (边写边汇编)
+#
+# - 每行的伪指令扩展/解析结果按行文本缓存 (pseudo.iter_expanded 的 cache)，内容未变的行不再解析
+# - 指令序列与上一次相同的前缀部分PC不变，只有引用了地址改变的标签的指令 (按 references 查找) 需要重新解析标签；
+#   第一条变化的指令及其后的指令重新解析标签，编码结果按 (指令, 解析后的偏移/地址) 缓存，
+#   只是整体平移、相对偏移不变的分支不会重新编码
+# - patch_simulator 把新映像与模拟器中的映像逐字比较，只改写变化了的字，并原地更新 machine_code / pc_to_source_line_map
+#
+# 用法:
+#   assembler = IncrementalAssembler()
+#   result = assembler.assemble(lines)            # 返回 AssembleResult
+#   assembler.load_simulator(simulator, result)   # 第一次: 整体加载 (与 load_program_from_source 相同)
+#   result = assembler.assemble(edited_lines)
+#   assembler.patch_simulator(simulator, result)  # 之后: 原地改写变化的字，寄存器、PC、RAM 保持不变
+
+import pseudo as pse # 导入pseudo.py
+
+
+class AssembleResult:
+    __slots__ = ('image', 'label_map', 'data_lma_values', 'source_lines', 'changed', 'encoded')
+
+    def __init__(self, image, label_map, data_lma_values, source_lines, changed, encoded):
+        self.image = image                      # 完整的内存映像 (与 pseudo.build_image 相同)
+        self.label_map = label_map
+        self.data_lma_values = data_lma_values
+        self.source_lines = source_lines        # 每条指令的源码行号 (即 pc_to_source_line_map)
+        self.changed = changed                  # 与上一次汇编相比改变了的字地址 (升序)
+        self.encoded = encoded                  # 本次实际调用 pseudo.encode 的次数
+
+
+class IncrementalAssembler:
+    MAX_CACHE_FACTOR = 4 # 行缓存超过源码行数的这个倍数时清空 (编辑过程中旧版本的行会不断积累)
+
+    def __init__(self):
+        self.line_cache = {}    # pseudo.iter_expanded 的逐行缓存
+        self.encoded = {}       # (Instruction, 解析后的最后一个操作数) -> 编码后的字
+        self.instructions = []  # 上一次的指令序列 (来自 line_cache 的同一对象)
+        self.code = []          # 上一次每条指令编码后的字 (包括超出ROM的部分)
+        self.label_map = {}
+        self.references = {}    # 标签 -> 引用它的指令PC集合
+        self.image = []
+        self.loaded_code = None # 由 load_simulator 装入模拟器的 machine_code 列表，用于判断模拟器中是否为本汇编器的代码
+
+    def assemble(self, lines):
+        # 汇编源码行，出错时抛出异常 (与 pseudo.expand_pseudo_instructions / resolve_labels 相同)，内部状态保持上一次的结果
+        if len(self.line_cache) > self.MAX_CACHE_FACTOR * len(lines) + 256:
+            self.line_cache = {}
+            self.encoded = {}
+
+        label_map = {}
+        instructions = []
+        source_lines = []
+        data_lma_values = []
+        for kind, value, line_no in pse.iter_expanded(lines, label_map, cache=self.line_cache):
+            if kind == 'data':
+                data_lma_values.extend(value)
+            else:
+                instructions.append(value)
+                source_lines.append(line_no)
+
+        # 与上一次相同的指令前缀 (同一行文本得到的是同一对象)
+        previous = self.instructions
+        first = 0
+        common = min(len(previous), len(instructions))
+        while first < common and previous[first] is instructions[first]:
+            first += 1
+
+        # 前缀中只有引用了地址改变的标签的指令需要重新解析
+        old_labels = self.label_map
+        changed_labels = [name for name in label_map.keys() | old_labels.keys()
+                          if label_map.get(name) != old_labels.get(name)]
+        todo = {pc for name in changed_labels for pc in self.references.get(name, ()) if pc < first}
+        todo.update(range(first, len(instructions)))
+
+        references = {name: {pc for pc in pcs if pc < first} for name, pcs in self.references.items()}
+        code = self.code[:first] + [0] * (len(instructions) - first)
+        encoded_count = 0
+        for pc in sorted(todo):
+            instr = instructions[pc]
+            target = instr.args[-1]
+            if isinstance(target, str):
+                references.setdefault(target, set()).add(pc)
+                resolved = pse.resolve_instruction(instr, pc, label_map)
+                key = (instr, resolved.args[-1])
+            else:
+                resolved = instr
+                key = (instr, target)
+            word = self.encoded.get(key)
+            if word is None:
+                word = self.encoded[key] = pse.encode(resolved)
+                encoded_count += 1
+            code[pc] = word
+
+        if len(instructions) > pse.ROM_WORDS and len(self.code) <= pse.ROM_WORDS:
+            print(f"警告: 共 {len(instructions)} 条指令，ROM区限制为 {pse.ROM_WORDS} 行，多出的指令被截断")
+        image = code[:pse.ROM_WORDS] + [0] * (pse.ROM_WORDS - len(code)) + pse.data_words(data_lma_values)
+        old_image = self.image
+        changed = [addr for addr in range(max(len(image), len(old_image)))
+                   if (image[addr] if addr < len(image) else 0) != (old_image[addr] if addr < len(old_image) else None)]
+
+        self.instructions = instructions
+        self.code = code
+        self.label_map = label_map
+        self.references = {name: pcs for name, pcs in references.items() if pcs}
+        self.image = image
+        return AssembleResult(image, label_map, data_lma_values, source_lines, changed, encoded_count)
+
+    def load_simulator(self, simulator, result):
+        # 整体加载到模拟器 (清空内存、PC 置0)，与 Simulator16Bit.load_program_from_source 的效果相同
+        simulator.machine_code = list(result.image)
+        simulator.pc_to_source_line_map = list(result.source_lines)
+        simulator.load_machine_code_to_memory()
+        simulator.pc = 0
+        simulator.halted = False
+        self.loaded_code = simulator.machine_code
+
+    def patch_simulator(self, simulator, result):
+        # 只改写模拟器内存中与新映像不同的字，原地更新 machine_code 和 pc_to_source_line_map
+        # 返回改写的字数；模拟器中不是本汇编器装入的代码 (例如之后载入了检查点) 时返回 None，应改用 load_simulator
+        machine_code = simulator.machine_code
+        if machine_code is not self.loaded_code:
+            return None
+        image = result.image
+        old_length = len(machine_code)
+        updates = [(addr, image[addr] if addr < len(image) else 0)
+                   for addr in range(max(len(image), old_length))
+                   if (image[addr] if addr < len(image) else 0) != (machine_code[addr] if addr < old_length else 0)]
+        count = simulator.patch_words(updates)
+        machine_code[:] = image
+        simulator.pc_to_source_line_map[:] = result.source_lines
+        return count
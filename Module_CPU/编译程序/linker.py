@@ -0,0 +1,270 @@
+# 多文件汇编和链接：每个源文件 (连同其 .include 的文件) 单独汇编为目标文件，再由链接器排布到 ROM 区和数据区
+#
+# 源文件中可以写 .include "文件名" (相对于当前文件所在目录)，被包含文件的内容原样插入该处，与写在同一个文件中相同
+# 目标文件 (JSON，保存在 --obj-dir 中):
+#   code         指令字；引用了标签的指令在这里为0，由链接器根据 relocations 重新编码
+#   relocations  [偏移, 指令名, 操作数]，操作数的最后一个是标签 (jal/beq/ble 的跳转目标、la 展开的 lui)；
+#                所有标签都是全局的，链接时按最终地址解析，规则与 pseudo.resolve_instruction 相同
+#   symbols      标签 -> 目标文件内的指令偏移
+#   data         _data_lma 的字节 (数据段)
+#   files/lines  每条指令的源文件 (files 的下标) 和行号
+#   key          源文件和所有被包含文件的内容、ISA 表、汇编器版本的哈希；与当前源码的哈希相同时直接复用目标文件，不再汇编
+# 链接：按命令行顺序把各目标文件的代码依次放入 ROM 区 (第一个文件从 PC 0 开始执行)，数据段依次接在 ROM 区之后，
+#       结果与把各文件按顺序拼接成一个源文件再汇编相同；需要重新汇编的文件在多个工作进程中并行汇编
+#
+# 用法 (在 编译程序 目录下):
+#   python -m linker main.s sort.s -o code.txt -j 4          (目标文件默认放在 .asm_obj，未改动的文件不重新汇编)
+#   python -m linker main.s sort.s -o code.txt --format bin  (其他输出格式见 image_formats.py)
+#   program = link_files(['main.s', 'sort.s']); program.image
+
+import argparse
+import hashlib
+import json
+import os
+import sys
+
+import pseudo as pse # 导入pseudo.py
+
+OBJECT_VERSION = 1
+DEFAULT_OBJ_DIR = '.asm_obj'
+INCLUDE_DIRECTIVE = '.include'
+
+
+class LinkedProgram:
+    __slots__ = ('image', 'label_map', 'data_lma_values', 'source_lines', 'assembled', 'reused')
+
+    def __init__(self, image, label_map, data_lma_values, source_lines, assembled, reused):
+        self.image = image                      # 完整的内存映像 (与 pseudo.build_image 相同)
+        self.label_map = label_map              # 全局标签 -> PC
+        self.data_lma_values = data_lma_values
+        self.source_lines = source_lines        # 每条指令的 (源文件, 行号)
+        self.assembled = assembled              # 本次重新汇编的源文件
+        self.reused = reused                    # 直接复用了目标文件的源文件
+
+
+def _include_target(text):
+    # ".include "file"" -> file；不是 .include 时返回 None
+    tokens = text.split(maxsplit=1)
+    if not tokens or tokens[0] != INCLUDE_DIRECTIVE:
+        return None
+    if len(tokens) < 2 or not tokens[1].strip('"\' '):
+        raise ValueError(f"'{INCLUDE_DIRECTIVE}' needs a file name. Got: '{text}'")
+    return tokens[1].strip('"\' ')
+
+
+def read_source(path, origins, digest=None, _stack=()):
+    # 生成器：逐行产生源文件的内容，.include 的文件在该处展开；每产生一行先把它的 (源文件, 行号) 追加到 origins
+    # digest 为 hashlib 对象时，把读到的每个文件的路径和内容加入哈希
+    path = os.path.normpath(path)
+    if path in _stack:
+        raise ValueError(f"{INCLUDE_DIRECTIVE} 循环: {' -> '.join(_stack + (path,))}")
+    with open(path, 'r', encoding='utf-8') as f:
+        lines = f.read().splitlines()
+    if digest is not None:
+        digest.update(path.encode('utf-8') + b'\0' + '\n'.join(lines).encode('utf-8') + b'\0')
+
+    for line_no, line in enumerate(lines, 1):
+        target = _include_target(pse.strip_comments(line))
+        if target is None:
+            origins.append((path, line_no))
+            yield line
+            continue
+        try:
+            yield from read_source(os.path.join(os.path.dirname(path), target), origins, digest, _stack + (path,))
+        except OSError as e:
+            raise ValueError(f"{path}:{line_no}: 无法读取 {target}: {e}") from None
+
+
+def _new_digest():
+    import asm_cache # ISA 表和汇编器版本与汇编缓存的键相同
+    digest = hashlib.sha256(asm_cache.isa_fingerprint().encode('utf-8'))
+    digest.update(f'obj{OBJECT_VERSION}\0'.encode('utf-8'))
+    return digest
+
+
+def source_key(path):
+    # 源文件 (连同被包含的文件) 的内容哈希，用于判断目标文件是否可以复用
+    digest = _new_digest()
+    for _ in read_source(path, [], digest):
+        pass
+    return digest.hexdigest()
+
+
+def assemble_object(path):
+    # 把一个源文件汇编为目标文件 (字典)；出错时抛出 ValueError，消息中为出错的源文件和行号
+    digest = _new_digest() # 与 source_key(path) 相同，在汇编的同时计算，源文件只读一遍
+    origins = []
+    symbols = {}
+    code = []
+    relocations = []
+    data = []
+    lines = []
+    files = {}
+    try:
+        for kind, value, line_no in pse.iter_expanded(read_source(path, origins, digest), symbols):
+            if kind == 'data':
+                data.extend(value)
+                continue
+            if isinstance(value.args[-1], str): # 引用了标签，链接时解析
+                relocations.append([len(code), value.op, list(value.args)])
+                code.append(0)
+            else:
+                code.append(pse.encode(value))
+            source, source_line = origins[line_no - 1]
+            lines.append([files.setdefault(source, len(files)), source_line])
+    except (ValueError, KeyError) as e:
+        if not origins: # 还没有读到任何一行 (如 .include 循环)
+            raise ValueError(str(e)) from None
+        source, source_line = origins[-1] # 出错时 iter_expanded 正在处理最后读到的一行
+        raise ValueError(f"{source}:{source_line}: {e}") from None
+
+    return {
+        'version': OBJECT_VERSION,
+        'key': digest.hexdigest(),
+        'source': os.path.normpath(path),
+        'code': code,
+        'relocations': relocations,
+        'symbols': symbols,
+        'data': data,
+        'files': list(files),
+        'lines': lines,
+    }
+
+
+def object_path(obj_dir, source):
+    # 源文件 -> 目标文件路径；文件名中带上源文件绝对路径的哈希，不同目录中的同名源文件不会冲突
+    source = os.path.abspath(source)
+    stem = os.path.splitext(os.path.basename(source))[0]
+    tag = hashlib.sha1(source.encode('utf-8')).hexdigest()[:8]
+    return os.path.join(obj_dir, f'{stem}-{tag}.obj')
+
+
+def load_object(path, key):
+    # 读取目标文件，不存在、格式不对或 key 不同 (源码已改动) 时返回 None
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            obj = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if not isinstance(obj, dict) or obj.get('version') != OBJECT_VERSION or obj.get('key') != key:
+        return None
+    return obj
+
+
+def save_object(path, obj):
+    tmp_path = f'{path}.{os.getpid()}.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        f.write(json.dumps(obj, ensure_ascii=False, separators=(',', ':'))) # json.dumps 使用C实现的编码器，比 json.dump 快得多
+    os.replace(tmp_path, path)
+
+
+def assemble_objects(sources, obj_dir=DEFAULT_OBJ_DIR, workers=None):
+    # 返回 (目标文件列表 (与 sources 顺序相同), 重新汇编的源文件, 复用的源文件)
+    # 源码未改动的直接读取目标文件，其余的并行汇编 (workers 为进程数，默认 CPU 核数；为 1 时在当前进程内顺序汇编)
+    os.makedirs(obj_dir, exist_ok=True)
+    objects = [None] * len(sources)
+    stale = []
+    for index, source in enumerate(sources):
+        obj = load_object(object_path(obj_dir, source), source_key(source))
+        if obj is None:
+            stale.append(index)
+        else:
+            objects[index] = obj
+
+    if workers is None:
+        workers = os.cpu_count() or 1
+    workers = max(1, min(workers, len(stale)))
+    if workers == 1:
+        built = [assemble_object(sources[index]) for index in stale]
+    else:
+        from concurrent.futures import ProcessPoolExecutor # 只在多进程汇编时导入
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            built = list(executor.map(assemble_object, [sources[index] for index in stale]))
+
+    for index, obj in zip(stale, built):
+        save_object(object_path(obj_dir, sources[index]), obj)
+        objects[index] = obj
+    reused = [source for index, source in enumerate(sources) if index not in stale]
+    return objects, [sources[index] for index in stale], reused
+
+
+def link(objects):
+    # 链接目标文件，返回 (内存映像, 全局标签表, _data_lma 数值, 每条指令的 (源文件, 行号))
+    label_map = {}
+    defined_in = {}
+    bases = []
+    pc = 0
+    for obj in objects:
+        bases.append(pc)
+        for label, offset in obj['symbols'].items():
+            if label in label_map:
+                raise ValueError(f"Duplicate label '{label}' in {defined_in[label]} and {obj['source']}")
+            label_map[label] = pc + offset
+            defined_in[label] = obj['source']
+        pc += len(obj['code'])
+
+    code = []
+    data_lma_values = []
+    source_lines = []
+    for obj, base in zip(objects, bases):
+        words = list(obj['code'])
+        for offset, op, args in obj['relocations']:
+            instr = pse.Instruction(op, tuple(args), obj['lines'][offset][1])
+            try:
+                words[offset] = pse.encode(pse.resolve_instruction(instr, base + offset, label_map))
+            except KeyError as e:
+                file_index, line_no = obj['lines'][offset]
+                raise ValueError(f"{obj['files'][file_index]}:{line_no}: {e.args[0]}") from None
+        code.extend(words)
+        data_lma_values.extend(obj['data']) # 数据段按字节依次拼接，与把源文件拼接在一起时相同
+        source_lines.extend((obj['files'][file_index], line_no) for file_index, line_no in obj['lines'])
+
+    if len(code) > pse.ROM_WORDS:
+        print(f"警告: 共 {len(code)} 条指令，ROM区限制为 {pse.ROM_WORDS} 行，多出的指令被截断")
+    image = code[:pse.ROM_WORDS] + [0] * (pse.ROM_WORDS - len(code)) + pse.data_words(data_lma_values)
+    return image, label_map, data_lma_values, source_lines
+
+
+def link_files(sources, obj_dir=DEFAULT_OBJ_DIR, workers=None):
+    # 汇编 (复用未改动的目标文件) 并链接，返回 LinkedProgram
+    objects, assembled, reused = assemble_objects(sources, obj_dir, workers)
+    image, label_map, data_lma_values, source_lines = link(objects)
+    return LinkedProgram(image, label_map, data_lma_values, source_lines, assembled, reused)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="多文件汇编：各源文件单独汇编为目标文件 (并行、复用未改动的)，再链接为一个内存映像")
+    parser.add_argument('sources', nargs='+', help="汇编源文件，按顺序放入 ROM 区 (第一个文件从 PC 0 开始)")
+    parser.add_argument('-o', '--output', default='machine_code_output.txt', help="输出的机器码文件")
+    parser.add_argument('--obj-dir', default=DEFAULT_OBJ_DIR, help="目标文件目录 (默认 .asm_obj)")
+    parser.add_argument('-j', '--workers', type=int, default=None, help="汇编的工作进程数 (默认 CPU 核数)")
+    parser.add_argument('--format', action='append', choices=('txt', 'bin', 'hex', 'memh', 'memb'),
+                        help="输出格式，可重复指定 (默认 txt)，见 pseudo.py")
+    args = parser.parse_args(argv)
+
+    try:
+        program = link_files(args.sources, args.obj_dir, args.workers)
+    except (OSError, ValueError) as e:
+        print(f"汇编错误: {e}")
+        return 1
+    print(f"汇编 {len(program.assembled)} 个文件，复用 {len(program.reused)} 个目标文件，"
+          f"共 {len(program.source_lines)} 条指令，{len(program.data_lma_values)} 个数据字节")
+
+    formats = args.format or ['txt']
+    image_formats = [name for name in formats if name != 'txt']
+    if image_formats:
+        import image_formats as imf
+        try:
+            paths = imf.write_image_files(program.image, imf.output_base(args.output), image_formats)
+        except (ValueError, OSError) as e:
+            print(f"错误: {e}")
+            return 1
+        for path in paths:
+            print(f"已写入 {path}")
+    if 'txt' in formats:
+        pse.write_machine_code_to_file([pse.format_word(word) for word in program.image], args.output)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,202 @@
+# 程序执行剖析：按 PC、源码行、操作码统计执行次数，以及 beq/ble 的跳转/不跳转次数
+# 通过 Simulator16Bit.enable_profiler() 开启；关闭时 (simulator.profiler 为 None) 执行循环中没有任何额外开销
+#
+# 用法 (在 编译程序 目录下):
+#   python -m profiler program2.txt
+#   python -m profiler program2.txt --top 10 --csv profile.csv --json profile.json
+
+import argparse
+import csv
+import json
+import sys
+
+import pseudo as pse # 导入pseudo.py
+
+OPCODE_NAMES = {int(code, 2): name for name, code in pse.opcode_map.items()}
+BEQ = int(pse.opcode_map['beq'], 2)
+BLE = int(pse.opcode_map['ble'], 2)
+
+
+class Profiler:
+
+    def __init__(self, memory_words, start_step=0):
+        self.pc_counts = [0] * memory_words   # 每个PC (字地址) 的执行次数
+        self.opcode_counts = [0] * 16         # 每个操作码的执行次数
+        self.branch_counts = {}               # beq/ble 所在PC -> [跳转次数, 不跳转次数]
+        self.total = 0
+        self.start_step = start_step          # 开始统计时模拟器的 step_count，后退到这之前的指令不在统计中
+
+    def record(self, simulator, decoded):
+        # 在执行一条指令之前调用 (decoded 为该指令的预解码记录)
+        self._count(simulator, decoded, 1)
+
+    def unrecord(self, simulator, decoded):
+        # 执行历史后退一条指令时调用 (此时模拟器已回到执行该指令之前的状态)，撤销 record 的计数
+        if simulator.step_count >= self.start_step:
+            self._count(simulator, decoded, -1)
+
+    def _count(self, simulator, decoded, delta):
+        pc = simulator.pc
+        opcode = simulator.memory[pc] & 0xF
+        self.pc_counts[pc] += delta
+        self.opcode_counts[opcode] += delta
+        self.total += delta
+
+        if opcode == BEQ or opcode == BLE:
+            _, rd, rs1, rs2, imm = decoded
+            regs = simulator.registers
+            if opcode == BEQ:
+                taken = regs[rs1] == regs[rs2]
+            else:
+                taken = regs[rs1] <= regs[rs2]
+            counts = self.branch_counts.get(pc)
+            if counts is None:
+                counts = self.branch_counts[pc] = [0, 0]
+            counts[0 if taken else 1] += delta
+            if counts == [0, 0]:
+                del self.branch_counts[pc]
+
+    def state(self):
+        # 当前计数 (只保存非0的PC)，保存在执行历史的快照中，跳到更早的步数时用 load_state 恢复
+        return ({pc: count for pc, count in enumerate(self.pc_counts) if count}, tuple(self.opcode_counts),
+                {pc: tuple(counts) for pc, counts in self.branch_counts.items()}, self.total, self.start_step)
+
+    def load_state(self, state):
+        pcs, opcode_counts, branch_counts, self.total, self.start_step = state
+        self.pc_counts = [0] * len(self.pc_counts)
+        for pc, count in pcs.items():
+            self.pc_counts[pc] = count
+        self.opcode_counts = list(opcode_counts)
+        self.branch_counts = {pc: list(counts) for pc, counts in branch_counts.items()}
+
+    def clear(self, start_step=0):
+        # 清零，从 start_step 重新开始统计
+        self.load_state(({}, (0,) * 16, {}, 0, start_step))
+
+    def pc_profile(self):
+        # [(pc, 次数)]，按次数从多到少排列
+        hits = [(pc, count) for pc, count in enumerate(self.pc_counts) if count]
+        hits.sort(key=lambda item: (-item[1], item[0]))
+        return hits
+
+    def line_profile(self, pc_to_source_line_map):
+        # [(源码行号, 次数)]，按次数从多到少排列；没有源码行信息的PC不计入
+        counts = {}
+        for pc, count in enumerate(self.pc_counts):
+            if count and pc < len(pc_to_source_line_map):
+                line = pc_to_source_line_map[pc]
+                counts[line] = counts.get(line, 0) + count
+        return sorted(counts.items(), key=lambda item: (-item[1], item[0]))
+
+    def opcode_profile(self):
+        # [(指令名, 次数)]，按次数从多到少排列
+        hits = [(OPCODE_NAMES.get(op, f'op{op:04b}'), count) for op, count in enumerate(self.opcode_counts) if count]
+        hits.sort(key=lambda item: -item[1])
+        return hits
+
+    def branch_profile(self):
+        # [(pc, 跳转次数, 不跳转次数)]，按执行次数从多到少排列
+        hits = [(pc, taken, not_taken) for pc, (taken, not_taken) in self.branch_counts.items()]
+        hits.sort(key=lambda item: (-(item[1] + item[2]), item[0]))
+        return hits
+
+    def to_dict(self, pc_to_source_line_map=()):
+        # 可直接序列化为 JSON 的统计结果
+        line_of = lambda pc: pc_to_source_line_map[pc] if pc < len(pc_to_source_line_map) else None
+        return {
+            'total': self.total,
+            'pcs': [{'pc': pc, 'line': line_of(pc), 'count': count} for pc, count in self.pc_profile()],
+            'lines': [{'line': line, 'count': count} for line, count in self.line_profile(pc_to_source_line_map)],
+            'opcodes': [{'opcode': name, 'count': count} for name, count in self.opcode_profile()],
+            'branches': [{'pc': pc, 'line': line_of(pc), 'taken': taken, 'not_taken': not_taken}
+                         for pc, taken, not_taken in self.branch_profile()],
+        }
+
+    def write_json(self, path, pc_to_source_line_map=()):
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(self.to_dict(pc_to_source_line_map), f, ensure_ascii=False, indent=2)
+
+    def write_csv(self, path, pc_to_source_line_map=()):
+        # 每行一条统计：类别 (pc/line/opcode)、键、次数、跳转次数、不跳转次数
+        branches = self.branch_counts
+        with open(path, 'w', encoding='utf-8', newline='') as f:
+            writer = csv.writer(f)
+            writer.writerow(['kind', 'key', 'line', 'count', 'taken', 'not_taken'])
+            for pc, count in self.pc_profile():
+                line = pc_to_source_line_map[pc] if pc < len(pc_to_source_line_map) else ''
+                taken, not_taken = branches.get(pc, ('', ''))
+                writer.writerow(['pc', pc, line, count, taken, not_taken])
+            for line, count in self.line_profile(pc_to_source_line_map):
+                writer.writerow(['line', line, line, count, '', ''])
+            for name, count in self.opcode_profile():
+                writer.writerow(['opcode', name, '', count, '', ''])
+
+    def report(self, pc_to_source_line_map=(), source_lines=None, top=20):
+        # 热点报告 (文本)：执行最多的源码行/PC、各操作码占比、分支跳转情况
+        # source_lines 为源码文本行 (可选)，用于在报告中显示源码
+        total = self.total or 1
+        out = [f"共执行 {self.total} 条指令"]
+
+        def source_text(line):
+            if source_lines is not None and line is not None and 0 < line <= len(source_lines):
+                return source_lines[line - 1].strip()
+            return ''
+
+        lines = self.line_profile(pc_to_source_line_map)
+        if lines:
+            out.append(f"\n热点源码行 (前 {top}):")
+            for line, count in lines[:top]:
+                out.append(f"  {count:>10} {100 * count / total:6.2f}%  行 {line:<5} {source_text(line)}")
+        else:
+            out.append(f"\n热点PC (前 {top}):")
+            for pc, count in self.pc_profile()[:top]:
+                out.append(f"  {count:>10} {100 * count / total:6.2f}%  PC 0x{pc:04X}")
+
+        out.append("\n操作码:")
+        for name, count in self.opcode_profile():
+            out.append(f"  {count:>10} {100 * count / total:6.2f}%  {name}")
+
+        branches = self.branch_profile()
+        if branches:
+            out.append("\n分支 (跳转/不跳转):")
+            for pc, taken, not_taken in branches[:top]:
+                line = pc_to_source_line_map[pc] if pc < len(pc_to_source_line_map) else None
+                where = f"行 {line:<5} {source_text(line)}" if line is not None else ''
+                out.append(f"  PC 0x{pc:04X}  {taken:>8} / {not_taken:<8} {where}")
+        return '\n'.join(out)
+
+
+def main(argv=None):
+    import headless
+
+    parser = argparse.ArgumentParser(description="运行程序并统计各PC/源码行/操作码的执行次数，输出热点报告")
+    parser.add_argument('file', help="汇编源文件或机器码文件")
+    parser.add_argument('--max-steps', type=int, default=100000, help="最多执行的指令条数 (默认 100000)")
+    parser.add_argument('--top', type=int, default=20, help="报告中列出的热点条数 (默认 20)")
+    parser.add_argument('--csv', help="统计结果写入的 CSV 文件")
+    parser.add_argument('--json', help="统计结果写入的 JSON 文件")
+    args = parser.parse_args(argv)
+
+    simulator = headless.new_simulator()
+    with open(args.file, 'r', encoding='utf-8') as f:
+        source_lines = f.read().splitlines()
+    success, file_format, message = headless.load_lines(simulator, source_lines)
+    if not success:
+        print(message, file=sys.stderr)
+        return 1
+
+    profiler = simulator.enable_profiler()
+    steps, stop_reason = simulator.run(args.max_steps)
+    line_map = simulator.pc_to_source_line_map
+
+    print(profiler.report(line_map, source_lines if file_format == 'asm' else None, args.top))
+    print(f"\n停止原因: {stop_reason}")
+    if args.csv:
+        profiler.write_csv(args.csv, line_map)
+    if args.json:
+        profiler.write_json(args.json, line_map)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,6 +1,8 @@
-# 若想切换 单独使用 或 配合 windows.py 使用 ，调整 expand_pseudo_instructions(lines) 末尾
-
-import re
+# 汇编器与ISA定义 (不依赖 tkinter)：单独运行时汇编 program2.txt，也供 simulator.py / windows.py / headless.py 共用
+# 伪指令扩展 expand_pseudo_instructions (源码只在这里切分一次，得到 Instruction 列表) -> 标签解析 resolve_labels
+# (唯一的标签解析实现) -> 编码 encode (整数位运算)，build_image 把三步合在一起生成完整的内存映像，
+# 只在输出时才格式化为文本 (format_word)；assemble_line 保留为单条指令文本的汇编接口
+# 本模块会被每个工作进程导入，只用字符串方法处理文本，不导入 re 等较重的模块
 
 # 原始操作码表
 opcode_map = {
@@ -22,6 +24,27 @@ opcode_map = {
     #伪指令是li la j bge
 }
 
+# 指令格式表 (汇编器与模拟器共用同一份ISA定义)
+# R : rs2(4) rs1(4) rd(4) op(4)      I : imm(4) rs1(4) rd(4) op(4)
+# S/SB : rs2(4) rs1(4) imm(4) op(4)  U/UJ : imm(8) rd(4) op(4)
+instruction_format = {
+    'jal': 'UJ',
+    'jalr': 'I',
+    'beq': 'SB',
+    'ble': 'SB',
+    'lb': 'I',
+    'lw': 'I',
+    'sb': 'S',
+    'sw': 'S',
+    'add': 'R',
+    'sub': 'R',
+    'and': 'R',
+    'or': 'R',
+    'lui': 'U',
+    'addi': 'I',
+    'subi': 'I'
+}
+
 # 寄存器映射
 register_alias = {
     'r0': 0, 'ra': 1, 'sp': 2,
@@ -64,17 +87,214 @@ def strip_comments(line):
     return line_no_tab_comment.strip()
 
 
-# 伪指令扩展函数
-def expand_pseudo_instructions(lines):
-    expanded_instructions = []    # 存储指令字串 (lui, addi, add 等)
-    label_map = {}              # 存储指令标签的 "PC" (索引)
-    current_expanded_instruction_pc = 0  # 指令的程序计数器
+# 指令中间表示 (IR)：源码只在 parse_instruction 中切分一次，之后的标签解析和编码都在 Instruction 上进行
+# args 按指令格式的字段顺序存放 (寄存器为编号，立即数为整数，尚未解析的标签为字符串):
+#   R  : (rd, rs1, rs2)      I : (rd, rs1, imm)      lb/lw 也是 I，源码写作 "lb rd, imm(rs1)"
+#   S  : (rs2, rs1, imm)     源码写作 "sb rs2, imm(rs1)"
+#   SB : (rs1, rs2, imm)     U/UJ : (rd, imm)
+class Instruction:
+    __slots__ = ('op', 'args', 'line')
+
+    def __init__(self, op, args, line=None):
+        self.op = op        # 指令名 (真实指令，伪指令已展开)
+        self.args = args    # 操作数元组
+        self.line = line    # 源码行号 (1-based)
+
+    def __str__(self):
+        # 转换为汇编文本，只在需要显示时使用
+        op, args = self.op, self.args
+        if op in ('lb', 'lw', 'sb', 'sw'):
+            return f"{op} {reg_num_to_name[args[0]]}, {args[2]}({reg_num_to_name[args[1]]})"
+        parts = []
+        for kind, arg in zip(_OPERANDS[op], args):
+            if kind == 'r':
+                parts.append(reg_num_to_name[arg])
+            elif op == 'lui' and isinstance(arg, int):
+                parts.append(f'0x{arg:X}')
+            else:
+                parts.append(str(arg))
+        return f"{op} {', '.join(parts)}"
 
-    data_lma_values = []        # 专门存储 _data_lma 的原始数值
-    active_data_collection_label = None # 追踪当前是否在为 _data_lma 收集数据
+    def __repr__(self):
+        return f"Instruction({str(self)!r}, line={self.line})"
+
+
+# 每条真实指令的操作数：r 寄存器，i 立即数，t 立即数或标签；顺序为源码中的书写顺序
+_OPERANDS = {
+    'add': 'rrr', 'sub': 'rrr', 'and': 'rrr', 'or': 'rrr',
+    'addi': 'rri', 'subi': 'rri', 'jalr': 'rri',
+    'lb': 'rir', 'lw': 'rir', 'sb': 'rir', 'sw': 'rir',
+    'beq': 'rrt', 'ble': 'rrt',
+    'lui': 'rt', 'jal': 'rt',
+}
+
+_OPCODE_VALUES = {op: int(bits, 2) for op, bits in opcode_map.items()}
+
+_REGISTER_NUMBERS = dict(register_alias)
+_REGISTER_NUMBERS.update({f'r{i}': i for i in range(16)})
+_NUMBER_START = frozenset('0123456789+-')
+
+
+def parse_register(reg_name):
+    # 寄存器名 -> 编号，与 reg_bin 接受的写法相同
+    reg_num = _REGISTER_NUMBERS.get(reg_name)
+    if reg_num is None:
+        return int(reg_bin(reg_name), 2)
+    return reg_num
+
+
+def _where(line):
+    return f"Error on line {line}: " if line is not None else ''
+
+
+def parse_instruction(text, line=None):
+    # 把一条真实指令的文本 (已去掉注释和标签) 切分并解析为 Instruction
+    tokens = text.replace(',', ' ')
+    if '(' in tokens: # "imm(rs)" -> "imm rs"
+        tokens = tokens.replace('(', ' ').replace(')', ' ')
+    tokens = tokens.split()
+    op = tokens[0]
+    kinds = _OPERANDS.get(op)
+    if kinds is None:
+        raise ValueError(f"{_where(line)}Unknown instruction: {op} in line '{text}'")
+    if len(tokens) != len(kinds) + 1:
+        raise ValueError(f"{_where(line)}'{op}' requires {len(kinds)} operands. Got: '{text}'")
+
+    values = []
+    for kind, token in zip(kinds, tokens[1:]):
+        if kind == 'r':
+            reg_num = _REGISTER_NUMBERS.get(token)
+            values.append(reg_num if reg_num is not None else parse_register(token))
+        elif kind == 'i' or token[0] in _NUMBER_START: # 不以数字或符号开头的 t 操作数一定是标签，不必尝试 int()
+            try:
+                values.append(int(token, 0))
+            except ValueError:
+                if kind == 'i':
+                    raise ValueError(f"{_where(line)}Invalid immediate '{token}' in line '{text}'")
+                values.append(token)
+        else:
+            values.append(token) # 标签，由 resolve_labels 解析
 
-    # 存储每条扩展后指令对应的原始源代码行号 (1-based)
-    expanded_instr_source_lines = []
+    if op in ('lb', 'lw', 'sb', 'sw'): # "op r, imm(base)" -> (r, base, imm)
+        values = [values[0], values[2], values[1]]
+    return Instruction(op, tuple(values), line)
+
+
+# 解析 _data_lma 下一行 ".byte v1, v2, ..." 的数值列表
+def parse_byte_values(instruction_part, actual_source_line_number):
+    try:
+        args_content = instruction_part.split('.byte', 1)[1]
+    except IndexError:
+        raise ValueError(f"L{actual_source_line_number}: '.byte' for _data_lma needs args. Got: '{instruction_part}'")
+    if not args_content.strip():
+        raise ValueError(f"L{actual_source_line_number}: '.byte' for _data_lma needs args. Got: '{instruction_part}'")
+
+    byte_values_str = args_content.strip().split(',')
+    if not any(s.strip() for s in byte_values_str):
+        raise ValueError(f"L{actual_source_line_number}: '.byte' for _data_lma no values: '{instruction_part}'")
+
+    line_values = []
+    for val_str in byte_values_str:
+        val_str = val_str.strip()
+        if not val_str:
+            raise ValueError(f"L{actual_source_line_number}: Empty val in '.byte' for _data_lma: '{args_content}'")
+        try:
+            byte_val = int(val_str, 0)
+        except ValueError:
+            raise ValueError(f"L{actual_source_line_number}: Invalid num '{val_str}' in '.byte' for _data_lma.")
+        if not (0 <= byte_val <= 127):
+            raise ValueError(f"L{actual_source_line_number}: Byte '{val_str}' out of 0-255 for _data_lma.")
+
+        line_values.append(byte_val) # 存储原始数值
+    return line_values
+
+
+# 扩展一条指令或伪指令的文本 (已去掉注释和标签)，返回 Instruction 列表 (伪指令可能扩展为多条)
+# parse 为 False 时真实指令不做解析，以 None 代替
+def expand_instruction(instruction_part, line_no, parse=True):
+    tokens = instruction_part.replace(',', ' ').split()
+    new_instructions = []
+    if not tokens:
+        # 这一行在标签后可能是空的，或者 strip 后
+        return new_instructions
+
+    op = tokens[0]
+
+    if op == 'li':
+        if len(tokens) < 3:
+            raise ValueError(f"Error on line {line_no}: 'li' requires 2 args. Got: '{instruction_part}'")
+        rd = parse_register(tokens[1])
+        try:
+            imm = int(tokens[2], 0) # 解析立即数
+        except ValueError:
+            raise ValueError(f"Error on line {line_no}: Invalid immediate for 'li'.")
+
+        # 16位 (超出部分会被截断或按 Python 整数处理)
+        target_val = imm & 0xFFFF
+
+        # lui 负责处理前8位 (imm[15:8])
+        upper_8_bits = (target_val >> 8) & 0xFF
+        new_instructions.append(Instruction('lui', (rd, upper_8_bits), line_no))
+
+        #    addi 负责处理后8位 (imm[7:0])，可能需要两条 addi 指令
+        #       0010_0001_0011_1100
+        #       //imm   rs,  rd,  addi    (r3) = (r1) + 2     // 此时(r3) = 4, pc = 6
+        #    每条 addi 只能处理4位的立即数
+        #    rd 的当前值是 (upper_8_bits << 8)
+        #    需要 imm[7:0] 加到 rd 上。
+        #    imm[7:0] = (imm[7:4] << 4) + imm[3:0]
+        #    但 addi 是直接相加，所以直接加 imm[7:4] 的值和 imm[3:0] 的值。
+
+        middle_4_bits_value = (target_val >> 4) & 0xF  #  imm[7:4]
+        lower_4_bits_value = target_val & 0xF          #  imm[3:0]
+
+        # 只有当整个立即数不为0时，才考虑添加 addi
+        # （如果 imm 为0, `lui rd, 0x0` 足够）
+        if target_val != 0:
+            # 如果中间4位 (imm[7:4]) 非零，则添加第一条 addi
+            if middle_4_bits_value != 0:
+                new_instructions.append(Instruction('addi', (rd, rd, middle_4_bits_value), line_no))
+            # 如果最低4位 (imm[3:0]) 非零，则添加第二个 addi
+            # 或者，如果高12位都是0 (即 upper_8_bits 和 middle_4_bits_value 都是0)，
+            # 且这个最低4位本身就是整个数（例如 li rd, 5），那么也需要这个addi
+
+            if lower_4_bits_value != 0:
+                new_instructions.append(Instruction('addi', (rd, rd, lower_4_bits_value), line_no))
+            # 如果一个数是例如 0x0M0 (M非0)，例如 0x020，即0x0020
+            # lui rd, 0x0
+            # addi rd, rd, 2 (middle_4_bits_value)
+            # lower_4_bits_value 为0，不用第二个 addi
+
+    elif op == 'la':
+        if len(tokens) < 3: raise ValueError(f"L{line_no}: la needs 2 args.")
+        new_instructions.append(parse_instruction(f'lui {tokens[1]} {tokens[2]}', line_no))
+
+    elif op == 'j':
+        if len(tokens) < 2: raise ValueError(f"L{line_no}: j needs 1 arg.")
+        new_instructions.append(parse_instruction(f'jal r0 {tokens[1]}', line_no))
+
+    elif op == 'jal' and len(tokens) == 2: # 伪指令 jal (跳转，返回地址到r0)
+        new_instructions.append(parse_instruction(f'jal r0 {tokens[1]}', line_no))
+
+    elif op == 'bge':
+        if len(tokens) < 4: raise ValueError(f"L{line_no}: bge needs 3 args.")
+        rs1, rs2, label_ref = tokens[1], tokens[2], tokens[3]
+        new_instructions.append(parse_instruction(f'ble {rs2} {rs1} {label_ref}', line_no))
+
+    else: # 其他真实指令 (非伪指令，非.byte)
+        new_instructions.append(parse_instruction(instruction_part, line_no) if parse else None)
+
+    return new_instructions
+
+
+# 逐行扩展伪指令 (生成器)：按源码顺序产生 ('instr', Instruction, 源码行号) 和 ('data', 该行 .byte 的数值列表, 源码行号)，
+# 遇到的标签记入 label_map (标签 -> 指令的 "PC" 索引)；lines 可以是任意行迭代器 (如打开的文件)，不会整体读入
+# parse 为 False 时真实指令不做解析，产生 None 代替 Instruction (只需要标签位置和指令条数时使用)
+# cache: 可选的字典，按去掉注释和标签后的文本缓存每行的扩展结果，内容未变的行不再解析 (见 incremental.py)；
+#        缓存的 Instruction 为同一对象，其 line 为第一次解析时的行号，应以产生的源码行号为准；不能与 parse=False 同时使用
+def iter_expanded(lines, label_map, parse=True, cache=None):
+    current_expanded_instruction_pc = 0  # 指令的程序计数器
+    active_data_collection_label = None # 追踪当前是否在为 _data_lma 收集数据
 
     for actual_source_line_number, raw_line in enumerate(lines, 1):
         line_for_label_detection = strip_comments(raw_line)
@@ -116,29 +336,14 @@ def expand_pseudo_instructions(lines):
 
         # 检查是否为 _data_lma 活动标签下的 .byte 指令
         if active_data_collection_label == '_data_lma' and first_word == '.byte':
-            try:
-                args_content = instruction_part.split('.byte', 1)[1]
-            except IndexError:
-                raise ValueError(f"L{actual_source_line_number}: '.byte' for _data_lma needs args. Got: '{instruction_part}'")
-            if not args_content.strip():
-                raise ValueError(f"L{actual_source_line_number}: '.byte' for _data_lma needs args. Got: '{instruction_part}'")
-
-            byte_values_str = args_content.strip().split(',')
-            if not any(s.strip() for s in byte_values_str):
-                raise ValueError(f"L{actual_source_line_number}: '.byte' for _data_lma no values: '{instruction_part}'")
-
-            for val_str in byte_values_str:
-                val_str = val_str.strip()
-                if not val_str:
-                    raise ValueError(f"L{actual_source_line_number}: Empty val in '.byte' for _data_lma: '{args_content}'")
-                try:
-                    byte_val = int(val_str, 0)
-                except ValueError:
-                    raise ValueError(f"L{actual_source_line_number}: Invalid num '{val_str}' in '.byte' for _data_lma.")
-                if not (0 <= byte_val <= 127):
-                    raise ValueError(f"L{actual_source_line_number}: Byte '{val_str}' out of 0-255 for _data_lma.")
-
-                data_lma_values.append(byte_val) # 存储原始数值
+            if cache is None:
+                line_values = parse_byte_values(instruction_part, actual_source_line_number)
+            else:
+                key = ('.byte', instruction_part)
+                line_values = cache.get(key)
+                if line_values is None:
+                    line_values = cache[key] = parse_byte_values(instruction_part, actual_source_line_number)
+            yield 'data', line_values, actual_source_line_number
 
             # 如果 _data_lma: 和 .byte 在同一行，或 .byte 是紧跟 _data_lma: 后的第一个有效部分，那么处理完这一行 .byte 后，认为 _data_lma 的数据定义結束
             # 如果一个标签不是 _data_lma，或者指令不是 .byte，则 active_data_collection_label 会在下一轮循环开始时被新的标签覆盖，或者如果下一行没有标签，它将保持
@@ -160,282 +365,202 @@ def expand_pseudo_instructions(lines):
             if active_data_collection_label == '_data_lma': # 如果之前是_data_lma，但现在不是.byte了
                 active_data_collection_label = None # 重置状态
 
-            tokens = instruction_part.split()
-            if not tokens:
-                # 这一行在标签后可能是空的，或者 strip 后
-                continue
+            if cache is None:
+                new_instructions = expand_instruction(instruction_part, actual_source_line_number, parse)
+            else:
+                new_instructions = cache.get(instruction_part)
+                if new_instructions is None:
+                    new_instructions = cache[instruction_part] = expand_instruction(instruction_part, actual_source_line_number)
 
-            op = tokens[0]
-
-            if op == 'li':
-                if len(tokens) < 3:
-                    raise ValueError(f"Error on line {actual_source_line_number}: 'li' requires 2 args. Got: '{instruction_part}'")
-                rd = tokens[1].replace(',', '')
-                try:
-                    imm = int(tokens[2], 0) # 解析立即数
-                except ValueError:
-                    raise ValueError(f"Error on line {actual_source_line_number}: Invalid immediate for 'li'.")
-
-                # 16位 (超出部分会被截断或按 Python 整数处理)
-                target_val = imm & 0xFFFF
-
-                # lui 负责处理前8位 (imm[15:8])
-                upper_8_bits = (target_val >> 8) & 0xFF
-                expanded_instructions.append(f'lui {rd}, 0x{upper_8_bits:X}')
-                expanded_instr_source_lines.append(actual_source_line_number) # 记录行号
-                current_expanded_instruction_pc += 1
-
-                #    addi 负责处理后8位 (imm[7:0])，可能需要两条 addi 指令
-                #       0010_0001_0011_1100
-                #       //imm   rs,  rd,  addi    (r3) = (r1) + 2     // 此时(r3) = 4, pc = 6
-                #    每条 addi 只能处理4位的立即数
-                #    rd 的当前值是 (upper_8_bits << 8)
-                #    需要 imm[7:0] 加到 rd 上。
-                #    imm[7:0] = (imm[7:4] << 4) + imm[3:0]
-                #    但 addi 是直接相加，所以直接加 imm[7:4] 的值和 imm[3:0] 的值。
-
-                middle_4_bits_value = (target_val >> 4) & 0xF  #  imm[7:4]
-                lower_4_bits_value = target_val & 0xF          #  imm[3:0]
-
-                # 只有当整个立即数不为0时，才考虑添加 addi
-                # （如果 imm 为0, `lui rd, 0x0` 足够）
-                if target_val != 0:
-                    # 如果中间4位 (imm[7:4]) 非零，则添加第一条 addi
-                    if middle_4_bits_value != 0:
-                        expanded_instructions.append(f'addi {rd}, {rd}, {middle_4_bits_value}')
-                        expanded_instr_source_lines.append(actual_source_line_number) # 记录行号
-                        current_expanded_instruction_pc += 1
-                    # 如果最低4位 (imm[3:0]) 非零，则添加第二个 addi
-                    # 或者，如果高12位都是0 (即 upper_8_bits 和 middle_4_bits_value 都是0)，
-                    # 且这个最低4位本身就是整个数（例如 li rd, 5），那么也需要这个addi
-
-                    if lower_4_bits_value != 0:
-                        expanded_instructions.append(f'addi {rd}, {rd}, {lower_4_bits_value}')
-                        expanded_instr_source_lines.append(actual_source_line_number) # 记录行号
-                        current_expanded_instruction_pc += 1
-                    # 如果一个数是例如 0x0M0 (M非0)，例如 0x020，即0x0020
-                    # lui rd, 0x0
-                    # addi rd, rd, 2 (middle_4_bits_value)
-                    # lower_4_bits_value 为0，不用第二个 addi
-
-            elif op == 'la':
-                if len(tokens) < 3: raise ValueError(f"L{actual_source_line_number}: la needs 2 args.")
-                rd = tokens[1].replace(',', '')
-                label_ref = tokens[2]
-                expanded_instructions.append(f'lui {rd}, {label_ref}')
-                expanded_instr_source_lines.append(actual_source_line_number) # 记录行号
-                current_expanded_instruction_pc += 1
-
-            elif op == 'j':
-                if len(tokens) < 2: raise ValueError(f"L{actual_source_line_number}: j needs 1 arg.")
-                label_ref = tokens[1]
-                expanded_instructions.append(f'jal r0, {label_ref}')
-                expanded_instr_source_lines.append(actual_source_line_number) # 记录行号
-                current_expanded_instruction_pc += 1
-
-            elif op == 'jal' and len(tokens) == 2: # 伪指令 jal (跳转，返回地址到r0)
-                label_ref = tokens[1].replace(',', '')
-                expanded_instructions.append(f'jal r0, {label_ref}')
-                expanded_instr_source_lines.append(actual_source_line_number) # 记录行号
-                current_expanded_instruction_pc += 1
-
-            elif op == 'bge':
-                if len(tokens) < 4: raise ValueError(f"L{actual_source_line_number}: bge needs 3 args.")
-                rs1 = tokens[1].replace(',', ''); rs2 = tokens[2].replace(',', ''); label_ref = tokens[3]
-                expanded_instructions.append(f'ble {rs2}, {rs1}, {label_ref}')
-                expanded_instr_source_lines.append(actual_source_line_number) # 记录行号
-                current_expanded_instruction_pc += 1
-                
-            else: # 其他真实指令 (非伪指令，非.byte)
-                expanded_instructions.append(instruction_part)
-                expanded_instr_source_lines.append(actual_source_line_number) # 记录行号
-                current_expanded_instruction_pc += 1
+            for instr in new_instructions:
+                yield 'instr', instr, actual_source_line_number
+            current_expanded_instruction_pc += len(new_instructions)
 
-    """
-    开头提到的二选一
-    """
-    # # 1.单独使用
-    # return expanded_instructions, label_map, data_lma_values
 
-    # 2.配合 windows.py 使用
-    return expanded_instructions, label_map, data_lma_values, expanded_instr_source_lines
+# 伪指令扩展函数：源码行 -> (Instruction 列表, 标签表, _data_lma 数值列表, 每条指令的源码行号列表)
+def expand_pseudo_instructions(lines):
+    expanded_instructions = []    # 存储扩展后的指令 (Instruction)
+    label_map = {}              # 存储指令标签的 "PC" (索引)
+    data_lma_values = []        # 专门存储 _data_lma 的原始数值
+    expanded_instr_source_lines = [] # 存储每条扩展后指令对应的原始源代码行号 (1-based)
 
-# 标签解析函数
-def resolve_labels(expanded_lines, label_map):
-    resolved = []
-    for idx, line in enumerate(expanded_lines):
-        # 移除逗号并分割，与 assemble_line 的预处理方式保持一致
-        # ( "imm(rs)" 格式中的括号也在这里被处理 )
-        processed_line_for_tokens = line.replace(',', '').replace('(', ' ').replace(')', '')
-        tokens = processed_line_for_tokens.split()
+    for kind, value, line_no in iter_expanded(lines, label_map):
+        if kind == 'data':
+            data_lma_values.extend(value)
+        else:
+            expanded_instructions.append(value)
+            expanded_instr_source_lines.append(line_no)
+    return expanded_instructions, label_map, data_lma_values, expanded_instr_source_lines
 
-        if not tokens:
-            continue
+# 标签解析：把一条位于 idx 处的指令中的标签换成偏移或地址 (没有标签时原样返回)
+def resolve_instruction(instr, idx, label_map):
+    target = instr.args[-1]
+    if not isinstance(target, str): # 没有标签，直接使用
+        return instr
 
-        instr = tokens[0]
+    if target not in label_map:
+        raise KeyError(f"Error: Undefined label '{target}' used in instruction: '{instr}' at expanded index {idx}")
 
-        if instr in ['ble', 'beq', 'jal']:
-            if len(tokens) < (3 if instr == 'jal' else 4):
-                raise ValueError(f"Malformed branch/jump instruction: '{line}' at expanded index {idx}")
+    if instr.op == 'lui':
+        # la rd, label -> lui rd, label：label_map 中存储的值 (指令的PC索引) 直接作为 lui 的立即数，
+        # CPU 执行 lui 时将其左移8位，例如 mylabel 在 pc=20 (0x14)，lui rd, mylabel -> lui rd, 0x14
+        value = label_map[target]
+    else:
+        #如果标签 L 指向指令 I，那么跳转实际目标是指令 I 之后的下一条指令。
+        target_pc_index = label_map[target] + 1  #加1
+        # PC相对寻址偏移 = (新的目标地址索引) - 当前指令的地址索引 - 1
+        value = target_pc_index - idx - 1
+    return Instruction(instr.op, instr.args[:-1] + (value,), instr.line)
 
-            last_arg = tokens[-1]
-            try:
-                int(last_arg, 0)
-                resolved.append(line) # 如果已经偏移，则直接使用
-            except ValueError:
-                # 是标签，需要解析
-                label_name = last_arg
-                if label_name not in label_map:
-                    raise KeyError(f"Error: Undefined label '{label_name}' used in instruction: '{line}' at expanded index {idx}")
-                #如果标签 L 指向指令 I，那么跳转实际目标是指令 I 之后的下一条指令。
-                target_pc_index = label_map[label_name] + 1  #加1
-
-                current_pc_index = idx
-                # PC相对寻址偏移 = (新的目标地址索引) - 当前指令的地址索引 - 1
-                offset = target_pc_index - current_pc_index - 1
-
-                temp_tokens = tokens[:-1] + [str(offset)]
-                resolved.append(' '.join(temp_tokens))
-
-
-        elif instr == 'lui':
-            # lui rd, immediate_or_label
-            if len(tokens) < 3:
-                raise ValueError(f"Malformed LUI instruction: '{line}' at expanded index {idx}. Expected 'lui rd, immediate/label'")
-
-            immediate_or_label_arg = tokens[2]
-            if immediate_or_label_arg in label_map:
-                # 如果 lui 的第二个参数是一个已定义的标签 (通常来自 'la' 伪指令)
-                # 逻辑：label_map 中存储的值直接作为 lui 的立即数，CPU 执行 lui 时会将此立即数左移（如8位）
-                # 例：la a0, myData -> lui a0, myData_val_for_lui
-                # 其中 myData_val_for_lui 是 label_map['myData'] 的值
-
-                # 假设 label_map[label_name] 存储的是该标签对应的PC索引（或某种地址表示）
-                # 对于 `la` 展开成的 `lui rd, label`, 这个 `label` 应该被替换成该标签地址的高位部分。
-                # 如果 `la` 只生成 `lui`，那么 `lui` 加载的值（来自label_map）会被CPU左移。
-                # 若 `mylabel` 在 `pc=20 (0x14)`，那么 `lui rd, mylabel` 会变成 `lui rd, 0x14`。
-                # CPU 执行时 `rd = 0x14 << 8 = 0x1400`
-
-                label_value = label_map[immediate_or_label_arg]
-
-                temp_tokens = list(tokens)
-                # assemble_line 中的 lui 部分期望 tokens[2] 是一个十六进制字符串 "0xHH"
-                temp_tokens[2] = f'0x{label_value:X}'
-                resolved.append(' '.join(temp_tokens))
-            else:
-                # 如果不是标签，则假定它是普通的立即数（可能是 "0xHH" 或十进制数），让assemble_line 处理
-                resolved.append(line)
-        else:
-            # 其他指令直接通过
-            resolved.append(line)
+# 标签解析函数：返回标签已解析的 Instruction 列表 (也接受指令文本列表，先逐条解析)
+def resolve_labels(expanded_lines, label_map):
+    resolved = []
+    for idx, instr in enumerate(expanded_lines):
+        if isinstance(instr, str):
+            if not instr.strip():
+                continue
+            instr = parse_instruction(instr.strip())
+        resolved.append(resolve_instruction(instr, idx, label_map))
     return resolved
 
-# 指令汇编函数
+# 指令编码函数：已解析标签的 Instruction -> 16位整数
+# R : rs2(4) rs1(4) rd(4) op(4)      I : imm(4) rs1(4) rd(4) op(4)
+# S/SB : rs2(4) rs1(4) imm(4) op(4)  U/UJ : imm(8) rd(4) op(4)
+def encode(instr):
+    op, args = instr.op, instr.args
+    if isinstance(args[-1], str):
+        raise ValueError(f"Unresolved label '{args[-1]}' in instruction '{instr}'")
+    fmt = instruction_format[op]
+    opcode = _OPCODE_VALUES[op]
+
+    if fmt == 'R':
+        rd, rs1, rs2 = args
+        return rs2 << 12 | rs1 << 8 | rd << 4 | opcode
+    if fmt == 'I':
+        rd, rs1, imm = args
+        return (imm & 0xF) << 12 | rs1 << 8 | rd << 4 | opcode
+    if fmt == 'S':
+        rs2, rs1, imm = args
+        return rs2 << 12 | rs1 << 8 | (imm & 0xF) << 4 | opcode
+    if fmt == 'SB':
+        rs1, rs2, imm = args # 分支偏移是4位
+        return rs2 << 12 | rs1 << 8 | (imm & 0xF) << 4 | opcode
+    rd, imm = args # U / UJ (lui, jal)，立即数为8位
+    if op == 'lui' and not (0 <= imm <= 0xFF): # LUI的立即数通常是无符号的，表示高位
+        print(f"Warning: LUI immediate '{imm}' is outside the typical 8-bit unsigned range (0-255). It will be truncated/wrapped.")
+    return (imm & 0xFF) << 8 | rd << 4 | opcode
+
+# 指令汇编函数：一条 (标签已解析的) 指令文本 -> 16位二进制字符串
 def assemble_line(line):
 
     stripped_line = line.strip()
     # 检查这行是否已经是16位的二进制字符串 (由 .byte 生成)
-    if re.fullmatch(r'[01]{16}', stripped_line):
+    if len(stripped_line) == 16 and not stripped_line.strip('01'):
         return stripped_line # 如果是，直接返回
+    return format(encode(parse_instruction(stripped_line)), '016b')
 
-    # 移除逗号，并将 "imm(rs)" 格式转换为空格分隔的 "imm rs"
-    tokens = line.replace(',', '').replace('(', ' ').replace(')', '').split()
-    instr = tokens[0]
-
-    if instr == 'jal': # UJ-type: imm[11:0] rd opcode
-        rd = reg_bin(tokens[1])
-        imm_val = int(tokens[2], 0) # 支持各种进制的立即数
-        imm = imm_bin(imm_val, 8) # jal的立即数是8位
-        # format: imm(8) rd(4) opcode(4)
-        return imm + rd + opcode_map[instr]
-
-    elif instr == 'jalr': # I-type like: imm[7:0] rs1 rd opcode
-        rd = reg_bin(tokens[1])
-        rs = reg_bin(tokens[2]) # rs1
-        imm_val = int(tokens[3],0)
-        imm = imm_bin(imm_val, 4)
-        # imm(4) rs1(4) rd(4) opcode(4)
-        return imm + rs + rd + opcode_map[instr]
-
-    elif instr in ['addi', 'subi']: # I-type: imm[3:0] rs1 rd opcode
-        rd = reg_bin(tokens[1])
-        rs = reg_bin(tokens[2]) # rs1
-        imm_val = int(tokens[3],0)
-        imm = imm_bin(imm_val, 4)
-        return imm + rs + rd + opcode_map[instr]
-
-    elif instr in ['beq', 'ble']: # SB-type variant: rs2 rs1 imm[3:0] opcode
-        rs1 = reg_bin(tokens[1])
-        rs2 = reg_bin(tokens[2])
-        imm_val = int(tokens[3],0)
-        imm = imm_bin(imm_val, 4) # 分支偏移是4位
-        return rs2 + rs1 + imm + opcode_map[instr] # 顺序：rs2 rs1 imm op
-
-    elif instr in ['lb', 'lw']: # I-type (Load): imm[3:0] rs1 rd opcode
-        rd = reg_bin(tokens[1])
-        imm_val = int(tokens[2],0) # offset
-        rs = reg_bin(tokens[3])    # base register (rs1)
-        imm = imm_bin(imm_val, 4)  # 偏移是4位
-        return imm + rs + rd + opcode_map[instr]
-
-    elif instr in ['sb', 'sw']: # S-type (Store): imm[3:0] rs1 rs2 opcode （rs2 是源寄存器）
-        # format: imm rs rt opcode (rt is src)
-        rt = reg_bin(tokens[1])   # Source register
-        imm_val = int(tokens[2],0) # offset
-        rs = reg_bin(tokens[3])   # 基址寄存器
-        imm = imm_bin(imm_val, 4) # 偏移是4位
-        return rt + rs + imm + opcode_map[instr] # 顺序 base_reg src_reg imm op
-
-    elif instr in ['add', 'sub', 'and', 'or']: # R-type: rs2 rs1 rd opcode
-        rd = reg_bin(tokens[1])
-        rs1 = reg_bin(tokens[2])
-        rs2 = reg_bin(tokens[3])
-        return rs2 + rs1 + rd + opcode_map[instr] # 顺序：rs2 rs1 rd op
-
-    elif instr == 'lui': # U-type: imm[7:0] rd opcode
-        rd = reg_bin(tokens[1])
-        # LUI的立即数应该是直接给定的，例如 "0xAB" 或 "171"
-        imm_val = int(tokens[2], 0) # 支持各种进制
-        if not (0 <= imm_val <= 0xFF): # LUI的立即数通常是无符号的，表示高位
-            print(f"Warning: LUI immediate '{tokens[2]}' (value: {imm_val}) is outside the typical 8-bit unsigned range (0-255). It will be truncated/wrapped.")
-        imm = format(imm_val & 0xFF, '08b') # 取低8位作为lui的立即数
-        return imm + rd + opcode_map[instr] # 顺序：imm rd op
 
-    else:
-        raise ValueError(f"Unknown instruction: {instr} in line '{line}'")
+ROM_WORDS = 128 # ROM区为128个字，_data_lma 数据紧接其后 (字节地址 0x100)
+ASSEMBLER_VERSION = 1 # 汇编结果 (编码、映像布局) 改变时递增，使磁盘上的汇编缓存失效 (见 asm_cache.py)
+
+
+def data_words(data_lma_values):
+    # _data_lma 每两个字节组成一个字，前一个字节在高8位，奇数个时最后一个字低8位补0
+    words = []
+    for k in range(0, len(data_lma_values), 2):
+        byte1_val = data_lma_values[k]
+        byte2_val = data_lma_values[k + 1] if k + 1 < len(data_lma_values) else 0
+        words.append(((byte1_val & 0xFF) << 8) | (byte2_val & 0xFF))
+    return words
+
 
+def build_image(expanded_lines, label_map, data_lma_values):
+    # 解析标签并汇编，返回完整的内存映像 (16位整数列表)：ROM区 ROM_WORDS 个字 (不足补0) + _data_lma 数据字
+    code = [encode(instr) for instr in resolve_labels(expanded_lines, label_map)]
 
-# 主汇编程序
+    if len(code) > ROM_WORDS:
+        print(f"警告: 共 {len(code)} 条指令，ROM区限制为 {ROM_WORDS} 行，多出的指令被截断")
+    rom_words = code[:ROM_WORDS] + [0] * (ROM_WORDS - len(code))
+    return rom_words + data_words(data_lma_values)
+
+
+def format_word(word):
+    # 16位整数 -> "XXXX_XXXX_XXXX_XXXX"
+    bits = format(word & 0xFFFF, '016b')
+    return '_'.join(bits[i:i+4] for i in range(0, 16, 4))
+
+
+# 主汇编程序：源码行 -> machine_code_output.txt 格式的机器码行
 def assemble_program(lines):
-    expanded, label_map = expand_pseudo_instructions(lines)
-    # 调试部分，应该用不上了
-    # print("--- Expanded Instructions ---")
-    # for i, l in enumerate(expanded):
-    #     print(f"{i}: {l}")
-    # print("--- Label Map ---")
-    # for label, addr in label_map.items():
-    #     print(f"{label}: {addr}")
-    # print("---------------------------")
-
-    resolved = resolve_labels(expanded, label_map)
-    # 调试部分，应该用不上了
-    # print("--- Resolved Instructions ---")
-    # for i, l in enumerate(resolved):
-    #     print(f"{i}: {l}")
-    # print("---------------------------")
-
-    machine_code = []
-    for line_num, line_content in enumerate(resolved):
-        try:
-            bin_code = assemble_line(line_content.strip())
-            # 将16位二进制码格式化为 "XXXX_XXXX_XXXX_XXXX"
-            formatted_bin_code = '_'.join([bin_code[i:i+4] for i in range(0, len(bin_code), 4)])
-            machine_code.append(formatted_bin_code)
-        except Exception as e:
-            # 包含行号和内容的错误信息，便于调试
-            print(f"Error assembling line #{line_num + 1} (resolved content: '{line_content.strip()}'): {e}")
+    expanded, label_map, data_lma_values, _ = expand_pseudo_instructions(lines)
+    return [format_word(word) for word in build_image(expanded, label_map, data_lma_values)]
+
+# 流式汇编：按需读取源码，生成内存映像的各个字 (与 build_image 的结果相同)，内存占用只与标签表大小有关
+# open_source 为无参函数，每次调用返回一个新的源码行迭代器 (如 lambda: open(path, encoding='utf-8'))，源码被读取三遍:
+#   第一遍只记录标签位置；第二遍逐条解析、解析标签、编码并产生 ROM 区的字；第三遍产生 _data_lma 数据字
+def iter_assemble(open_source):
+    label_map = {}
+    for _ in _read_expanded(open_source, label_map, parse=False):
+        pass
+
+    pc = 0
+    for kind, instr, _ in _read_expanded(open_source, {}):
+        if kind != 'instr':
+            continue
+        word = encode(resolve_instruction(instr, pc, label_map)) # 超出ROM的指令也要汇编，以便报告其中的错误
+        if pc < ROM_WORDS:
+            yield word
+        pc += 1
+    if pc > ROM_WORDS:
+        print(f"警告: 共 {pc} 条指令，ROM区限制为 {ROM_WORDS} 行，多出的指令被截断")
+    for _ in range(pc, ROM_WORDS):
+        yield 0
+
+    high = None # _data_lma 每两个字节组成一个字 (见 data_words)
+    for kind, values, _ in _read_expanded(open_source, {}, parse=False):
+        if kind != 'data':
+            continue
+        for value in values:
+            if high is None:
+                high = value
+            else:
+                yield ((high & 0xFF) << 8) | (value & 0xFF)
+                high = None
+    if high is not None:
+        yield (high & 0xFF) << 8
+
 
-    return machine_code
+def iter_assemble_file(path):
+    # 流式汇编一个源文件
+    return iter_assemble(lambda: open(path, 'r', encoding='utf-8'))
+
+
+def _read_expanded(open_source, label_map, parse=True):
+    source = open_source()
+    try:
+        yield from iter_expanded(source, label_map, parse)
+    finally:
+        close = getattr(source, 'close', None)
+        if close is not None:
+            close()
+
+
+def write_machine_code_stream(words, output_filename="machine_code_output.txt"):
+    # 边生成边写入机器码 (words 为16位整数的迭代器)，返回写入的行数
+    # 先写临时文件，汇编中途出错时不会留下不完整的输出文件
+    import os
+    tmp_filename = output_filename + '.tmp'
+    count = 0
+    try:
+        with open(tmp_filename, 'w', encoding='utf-8') as f:
+            for word in words:
+                f.write(format_word(word) + '\n')
+                count += 1
+    except BaseException:
+        os.remove(tmp_filename)
+        raise
+    os.replace(tmp_filename, output_filename)
+    return count
 
 def write_machine_code_to_file(final_output_lines, output_filename="machine_code_output.txt"):
     # 将格式化后的机器码列表写入到指定文件中
@@ -450,78 +575,86 @@ def write_machine_code_to_file(final_output_lines, output_filename="machine_code
 
 
 # 主执行块
+# 用法 (在 编译程序 目录下):
+#   python pseudo.py                                   (汇编 program2.txt，输出到 machine_code_output_standalone.txt)
+#   python pseudo.py big.txt -o big_code.txt --stream  (流式汇编：边读边写，不把源码和机器码整体放入内存)
+#   python pseudo.py program2.txt -o code.txt --format bin --format memh  (输出 code.bin/code.memh，格式见 image_formats.py)
+#   python pseudo.py program2.txt --cache              (使用磁盘上的汇编缓存，同一份源码再次汇编时只读一个文件，见 asm_cache.py)
 if __name__ == '__main__':
     """
-    注意！！从 program.txt 文件读取汇编指令，若文件命名不同则及时更改
+    注意！！默认从 program2.txt 文件读取汇编指令，其他文件用命令行参数指定
     """
-    
+    import argparse
+
+    OUTPUT_FORMATS = ('txt', 'bin', 'hex', 'memh', 'memb')
+
+    parser = argparse.ArgumentParser(description="汇编程序，输出 machine_code_output.txt 格式的机器码")
+    parser.add_argument('source', nargs='?', default='program2.txt', help="汇编源文件 (默认 program2.txt)")
+    parser.add_argument('-o', '--output', default='machine_code_output_standalone.txt', help="输出的机器码文件")
+    parser.add_argument('--stream', action='store_true', help="流式汇编，适合脚本生成的超大源文件 (不在终端打印机器码)")
+    parser.add_argument('--format', action='append', choices=OUTPUT_FORMATS + ('all',),
+                        help="输出格式，可重复指定 (默认 txt)；其他格式的文件名为 -o 去掉扩展名后加 .bin/.hex/.memh/.memb")
+    parser.add_argument('--cache', nargs='?', const='', metavar='DIR',
+                        help="使用磁盘上的汇编缓存 (默认目录 .asm_cache)，不能与 --stream 同时使用")
+    args = parser.parse_args()
+    if args.stream and args.cache is not None:
+        parser.error("--cache 不能与 --stream 同时使用")
+
+    formats = args.format or ['txt']
+    if 'all' in formats:
+        formats = OUTPUT_FORMATS
+    image_formats = [name for name in OUTPUT_FORMATS[1:] if name in formats]
+
+    if args.stream and not image_formats:
+        try:
+            count = write_machine_code_stream(iter_assemble_file(args.source), args.output)
+        except FileNotFoundError:
+            print(f"Error: {args.source} not found.")
+            exit(1)
+        except Exception as e:
+            print(f"汇编错误: {e}")
+            exit(1)
+        print(f"机器码已成功写入到 {args.output} ({count} 行)")
+        exit(0)
+
     try:
-        with open('program2.txt', 'r', encoding='utf-8') as f:
-            lines = f.readlines()
+        if args.stream:
+            words = list(iter_assemble_file(args.source)) # 映像最多为整个内存，远小于源码
+        else:
+            with open(args.source, 'r', encoding='utf-8') as f:
+                lines = f.readlines()
+            if args.cache is not None:
+                import asm_cache
+                cache = asm_cache.AssemblyCache(args.cache or asm_cache.DEFAULT_DIR)
+                words = cache.assemble(lines)[0]
+                cache.save_stats()
+            else:
+                expanded, label_map, data_lma_values, _ = expand_pseudo_instructions(lines)
+                words = build_image(expanded, label_map, data_lma_values)
     except FileNotFoundError:
-        print("Error: program.txt not found. Please ensure the file exists in the same directory.")
+        print(f"Error: {args.source} not found. Please ensure the file exists in the same directory.")
+        exit(1)
+    except Exception as e:
+        print(f"汇编错误: {e}")
         exit(1)
 
-    expanded_instr_strings, label_map, data_lma_numeric_values = expand_pseudo_instructions(lines)
-
-    # 解析指令中的标签
-    resolved_instr_strings = resolve_labels(expanded_instr_strings, label_map)
-
-    instruction_machine_code_raw = [] # 存储纯16位二进制指令
-    # 调试部分，应该用不上了
-    #print("\n--- Assembling Instructions ---") #
-    for i, line_content in enumerate(resolved_instr_strings):
+    # 同一个内存映像一次写出所有格式
+    if image_formats:
+        import image_formats as imf
         try:
-            # 调试部分，应该用不上了
-            # print(f"Assembling instruction line {i}: {line_content.strip()}")
-            bin_code = assemble_line(line_content.strip()) # assemble_line 返回 "XXXXXXXXXXXXXXXX"
-            instruction_machine_code_raw.append(bin_code)
-        except Exception as e:
-            print(f"Error assembling instruction line #{i + 1} (resolved: '{line_content.strip()}'): {e}")
-            # exit(1) # 发生错误时可以选择退出
-
-    # 4.  ROM 输出部分 (前128行)
-    rom_output_lines = []
-    for i in range(len(instruction_machine_code_raw)):
-        if i < 128: # 最多取128条指令放入ROM
-            formatted_bin_code = '_'.join([instruction_machine_code_raw[i][j:j+4] for j in range(0, 16, 4)])
-            rom_output_lines.append(formatted_bin_code)
-
-    # 如果指令不足128行，用0填充
-    while len(rom_output_lines) < 128:
-        rom_output_lines.append("0000_0000_0000_0000")
-
-    if len(instruction_machine_code_raw) > 128:
-        print(f"Warning: {len(instruction_machine_code_raw)} instructions generated, but ROM section is limited to 128 lines. Truncating.")
-
-    # 5.  Data (_data_lma) 输出部分 (从第257行开始)
-    data_output_lines = []
-    # 调试部分，应该用不上了
-    #print(f"\n--- Formatting _data_lma ({len(data_lma_numeric_values)} bytes) ---")
-    i = 0
-    while i < len(data_lma_numeric_values):
-        byte1_val = data_lma_numeric_values[i]
-        byte1_bin = format(byte1_val, '08b')
-        byte1_formatted = f"{byte1_bin[0:4]}_{byte1_bin[4:8]}" # "XXXX_XXXX"
-
-        if i + 1 < len(data_lma_numeric_values): # 如果还有下一个数配对
-            byte2_val = data_lma_numeric_values[i+1]
-            byte2_bin = format(byte2_val, '08b')
-            byte2_formatted = f"{byte2_bin[0:4]}_{byte2_bin[4:8]}" # "YYYY_YYYY"
-        else: # 奇数个数字，最后一个后面全填0
-            byte2_formatted = "0000_0000"
-
-        data_output_lines.append(f"{byte1_formatted}_{byte2_formatted}")
-        i += 2
-
-    final_output_lines = rom_output_lines + data_output_lines
-
-    # 打印机器码到终端
-    #print("\n机器码输出 ：")
-    for line in final_output_lines:
-        print(line)
-
-    # 输出机器码到文件 machine_code_output.txt
-    write_machine_code_to_file(final_output_lines, "machine_code_output_standalone.txt")
-    # 调试部分，应该用不上了
-    #print(f"\nMachine code also written to {output_filename}")
\ No newline at end of file
+            paths = imf.write_image_files(words, imf.output_base(args.output), image_formats)
+        except (ValueError, OSError) as e:
+            print(f"错误: {e}")
+            exit(1)
+        for path in paths:
+            print(f"已写入 {path}")
+
+    if 'txt' in formats:
+        final_output_lines = [format_word(word) for word in words]
+        if not args.stream:
+            # 打印机器码到终端
+            for line in final_output_lines:
+                print(line)
+
+        # 输出机器码到文件 (默认 machine_code_output_standalone.txt)
+        write_machine_code_to_file(final_output_lines, args.output)
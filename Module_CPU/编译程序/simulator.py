@@ -0,0 +1,901 @@
+# 自定义ISA的16位RISC单周期CPU 模拟器 (不依赖 tkinter，可供 windows.py 和无界面的 headless.py 共用)
+# 剖析、外设总线、执行轨迹等可选功能的模块在第一次开启时才导入，只做汇编和运行时启动更快
+
+import time
+from array import array
+import pseudo as pse # 导入pseudo.py
+import block_jit
+import history as hist
+import watchpoints as wpt
+
+
+class Simulator16Bit:
+    MEMORY_WORDS = 16384
+
+    def __init__(self):
+        self.registers = [0] * 16  # r0 到 r15
+        # 内存按字存储为16位无符号整数 (array('H'))，大小16384字，即 0x4000 字 / 32 KiB
+        # 字节视图与 InstructionMemory.v 读取ROM数据一致：偶地址为高8位，奇地址为低8位
+        self.memory = array('H', bytes(2 * self.MEMORY_WORDS))
+        self.decode_cache = [None] * self.MEMORY_WORDS # 每个字对应的预解码指令记录，None 表示尚未解码
+        self.block_cache = {} # 基本块起始PC -> block_jit.CompiledBlock
+        # 基本块在起始PC被执行到 compile_threshold 次之后才翻译，之前由解释器执行；
+        # 只运行几百条指令的程序 (如 program2.txt) 翻译的开销比执行本身大得多
+        self.compile_threshold = 32
+        self.block_visits = {} # 尚未翻译的基本块起始PC -> 执行到的次数
+        self.code_flags = bytearray(self.MEMORY_WORDS) # 被已翻译基本块覆盖的字置1，写入时据此作废基本块
+        self.pc = 0
+        self.previous_pc = 0
+        self.halted = False
+        self.last_error = None # 最近一次停止运行的错误信息 (越界访存、非法指令等)，无界面运行时写入结果的 error 字段
+        self.machine_code = [] # 在加载到内存之前存储机器码 (16位整数)
+        self.label_map = {}
+        self.pc_to_source_line_map = [] # 存储PC到源码行的映射
+        self.verbose = True # 为 False 时不打印每条指令的调试信息 (无界面批量运行使用)
+        self.fast_forward = True # 按基本块执行时，计数循环 (延时循环) 直接算出结束状态，见 block_jit.CountedLoop
+
+        # 执行历史 (后退单步/跳到第K步)，见 history.py；为 None 时不记录，不影响执行速度
+        self.step_count = 0 # 自加载以来已执行的指令条数
+        self.history = None
+        self.last_snapshot = None # 最近一次生成或恢复的快照，dirty_pages 相对于它记录
+        self.dirty_pages = bytearray(b'\x01' * (self.MEMORY_WORDS // hist.PAGE_WORDS)) # 自最近快照以来被写过的内存页
+
+        # 执行剖析 (各PC/源码行/操作码的执行次数)，见 profiler.py；为 None 时不统计，执行循环不做任何检查
+        self.profiler = None
+
+        # 外设总线 (RAM/LED/数码管区域与脏集合)，见 bus.py；为 None 时内存是单纯的连续数组
+        self.bus = None
+
+        # 二进制执行轨迹，见 exec_trace.py；为 None 时不记录
+        self.tracer = None
+
+        # 内存监视点，见 watchpoints.py；被监视的字在 watch_flags 中置1，访存时只检查这一个标志
+        self.watchpoints = []
+        self.watch_flags = bytearray(self.MEMORY_WORDS)
+        self.watch_hit = None # 最近一次命中的监视点 (watchpoints.WatchHit)
+
+        self.OPCODE_MAP = pse.opcode_map
+        self.REGISTER_ALIAS = pse.register_alias
+        self.dispatch_table = self._build_dispatch_table() # 按数值操作码索引的16项分发表
+
+        # 将 r0 初始化为 0
+        self.registers[self.REGISTER_ALIAS['r0']] = 0
+
+    def reset(self):
+        self.registers = [0] * 16
+        self.pc = 0
+        self.previous_pc = 0
+        self.halted = False
+        # 可以从 self.machine_code 清除或重新加载 self.memory
+        self.load_machine_code_to_memory() # 重新加载机器代码
+        print("Simulator Reset.")
+        self.print_regs()
+
+    def get_reg_value(self, reg_idx):
+        if not (0 <= reg_idx <= 15):
+            raise ValueError(f"Invalid register index: {reg_idx}")
+
+        if reg_idx == self.REGISTER_ALIAS['r0']: # 确保 r0 为 0
+            return 0
+
+        return self.registers[reg_idx]
+
+    def set_reg_value(self, reg_idx, value):
+        if not (0 <= reg_idx <= 15):
+            raise ValueError(f"Invalid register index: {reg_idx}")
+
+        if reg_idx != self.REGISTER_ALIAS['r0']: # r0 恒 0
+            # 值为 16 位，必要时模拟溢出
+            self.registers[reg_idx] = value & 0xFFFF # 确保 16 位
+
+        else:
+            self.registers[reg_idx] = 0 # r0 恒 0
+
+    def load_program_from_source(self, expanded_instr, label_map, data_lma_values, source_lines_for_expanded):
+        # 将汇编代码转换为机器码，并将其存储在内部
+        self.pc_to_source_line_map = [] # 重置映射
+        self.machine_code = []      # 重置机器码存储
+
+        try:
+            # 解析标签、汇编并排布 ROM/_data_lma (与写入 machine_code_output.txt 相同，使用 pseudo.build_image)
+            self.pc_to_source_line_map = source_lines_for_expanded
+            # self.machine_code 存储的是模拟器将要使用的机器码 (整数)，需要文本时用 format_word 转换
+            self.machine_code = pse.build_image(expanded_instr, label_map, data_lma_values)
+            self.load_machine_code_to_memory()
+
+            self.pc = 0
+            self.halted = False
+            return True, "汇编成功 (模拟器已加载代码)."
+
+        except Exception as e:
+            self.machine_code = []
+            self.pc_to_source_line_map = []
+            import traceback; traceback.print_exc()
+            return False, f"加载到模拟器时出错: {e}"
+
+    def load_machine_code_image(self, image_lines):
+        # 加载 machine_code_output.txt 格式的机器码文本 (每行 "XXXX_XXXX_XXXX_XXXX")，忽略空行和 // # 注释
+        words = []
+        for line_num, line in enumerate(image_lines, 1):
+            code = line.split('//')[0].split('#')[0].strip()
+            if not code:
+                continue
+            word = self.parse_word(code)
+            if word is None:
+                return False, f"第 {line_num} 行不是有效的16位机器码: '{line.strip()}'"
+            words.append(word)
+
+        self.machine_code = words
+        self.pc_to_source_line_map = [] # 机器码文件没有源码行信息
+        self.load_machine_code_to_memory()
+        self.pc = 0
+        self.previous_pc = 0
+        self.halted = False
+        return True, f"已加载 {len(words)} 条机器码."
+
+    def load_machine_code_to_memory(self):
+        # 先清除内存和预解码缓存，再将机器码整体拷贝进内存
+        self.load_memory_image(array('H', bytes(2 * self.MEMORY_WORDS)))
+
+        words = self.machine_code
+        if len(words) > len(self.memory):
+            print(f"警告: 机器码数量 ({len(words)}) 超出内存容量 ({len(self.memory)})。部分代码未加载。")
+            words = words[:len(self.memory)]
+
+        for i, word in enumerate(words):
+            if isinstance(word, str): # 兼容 "XXXX_XXXX_XXXX_XXXX" 格式的文本机器码
+                word = self.parse_word(word)
+                if word is None:
+                    print(f"警告: 机器码 \"{words[i]}\" 格式不正确，跳过加载到内存地址 {i}")
+                    continue
+            self.memory[i] = word & 0xFFFF
+            if word:
+                self.decode_cache[i] = self.decode_word(self.memory[i]) # 加载时预解码
+
+    def load_memory_image(self, memory):
+        # 直接使用给定的内存映像 (array('H') 或 'H' 格式的 memoryview，MEMORY_WORDS 个字)，不复制，
+        # 例如检查点文件的 mmap 视图；预解码缓存、基本块、步数、执行历史等与内存相关的状态全部重置
+        if len(memory) != self.MEMORY_WORDS:
+            raise ValueError(f"内存映像大小 ({len(memory)} 字) 与模拟器 ({self.MEMORY_WORDS} 字) 不一致")
+        self.memory = memory
+        self.decode_cache = [None] * self.MEMORY_WORDS # 取指时按需解码
+        self.invalidate_code()
+        self.step_count = 0
+        self.last_snapshot = None
+        self.dirty_pages[:] = b'\x01' * len(self.dirty_pages)
+        self.last_error = None
+        self.watch_hit = None # 监视点本身保留 (与断点一样跨程序重新加载)
+        if self.history is not None:
+            self.history.clear()
+        if self.profiler is not None: # 重新加载程序后重新统计
+            self.profiler = type(self.profiler)(self.MEMORY_WORDS)
+        if self.bus is not None:
+            self.bus.reset()
+
+    @staticmethod
+    def parse_word(formatted_code_word):
+        # 将 "XXXX_XXXX_XXXX_XXXX" 格式的文本转换为16位整数，格式不正确时返回 None
+        raw_binary_word = formatted_code_word.replace('_', '').strip()
+        if len(raw_binary_word) == 16 and all(c in '01' for c in raw_binary_word):
+            return int(raw_binary_word, 2)
+        return None
+
+    @staticmethod
+    def format_word(word, sep='_'):
+        # 将16位整数转换为 "XXXX_XXXX_XXXX_XXXX" 格式，只在UI显示或写文件时使用
+        bits = format(word & 0xFFFF, '016b')
+        return sep.join([bits[i:i+4] for i in range(0, 16, 4)])
+
+    def machine_code_lines(self):
+        # 以文本形式返回当前机器码，用于写入 machine_code_output.txt 等文件
+        return [self.format_word(word) for word in self.machine_code]
+
+    def read_byte(self, byte_addr):
+        # 按字节读取内存：偶地址取高8位，奇地址取低8位
+        word = self.memory[byte_addr >> 1]
+        return (word >> 8) & 0xFF if (byte_addr & 1) == 0 else word & 0xFF
+
+    def write_byte(self, byte_addr, value):
+        # 按字节写入内存 (运行前写入输入数据等)，与 sb 指令相同的字节序
+        word_addr = byte_addr >> 1
+        current_word = self.memory[word_addr]
+        if (byte_addr & 1) == 0:
+            self.memory[word_addr] = ((value & 0xFF) << 8) | (current_word & 0x00FF)
+        else:
+            self.memory[word_addr] = (current_word & 0xFF00) | (value & 0xFF)
+        self.dirty_pages[word_addr >> 8] = 1
+        self.decode_cache[word_addr] = None
+        if self.code_flags[word_addr]:
+            self.invalidate_code(word_addr)
+        if self.bus is not None:
+            self.bus.on_store(byte_addr, value & 0xFF, 1)
+
+    def patch_words(self, updates):
+        # 原地改写若干个内存字 (边写边汇编时只改动变化了的指令/数据字)，updates 为 (字地址, 值) 的迭代器
+        # 寄存器、PC 和其余内存保持不变；被改写的字重新预解码，已翻译的基本块作废
+        count = 0
+        for word_addr, word in updates:
+            word &= 0xFFFF
+            self.memory[word_addr] = word
+            self.dirty_pages[word_addr >> 8] = 1
+            self.decode_cache[word_addr] = self.decode_word(word) if word else None
+            if self.bus is not None:
+                self.bus.on_store(word_addr << 1, word, 2)
+            count += 1
+        if count:
+            self.invalidate_code()
+            if self.history is not None: # 旧的快照中是改写前的代码，从当前状态重新开始记录历史
+                self.history.clear()
+                self.history.add_snapshot(self)
+        return count
+
+    def invalidate_code(self, word_addr=None):
+        # 作废已翻译的基本块 (代码被改写或重新加载时调用)
+        # 自修改代码很少见，直接清空全部基本块；code_flags 原地清零，已生成的函数仍引用同一对象
+        self.block_cache.clear()
+        self.block_visits.clear()
+        self.code_flags[:] = bytes(len(self.code_flags))
+
+    def _compile_block(self, start_pc):
+        # 翻译并缓存从 start_pc 开始的基本块，标记它覆盖的字
+        block = block_jit.compile_block(self, start_pc)
+        if block is not None:
+            self.block_cache[start_pc] = block
+            for addr in range(block.start_pc, block.last_pc + 1):
+                self.code_flags[addr] = 1
+        return block
+
+    def fetch(self):
+        if not (0 <= self.pc < len(self.memory)):
+            print(f"PC out of bounds: {self.pc}")
+            self.halted = True
+            return None
+        instruction_word = self.memory[self.pc]
+
+        # print(f"Fetched PC={self.pc}: {self.format_word(instruction_word)}")
+        return instruction_word # 16位整数
+
+    def _build_dispatch_table(self):
+        # 由 pseudo.opcode_map / pseudo.instruction_format 一次性构建16项分发表，按数值操作码索引
+        # 表项为 (执行函数, 字段解码函数)；新增指令只需在 pseudo.py 增加表项并实现 _exec_<指令名>
+        table = [None] * 16
+        self.store_handlers = set() # 写内存的指令 (S-type) 的执行函数，撤销日志据此记录内存旧值
+        for name, code in self.OPCODE_MAP.items():
+            handler = getattr(self, f'_exec_{name}')
+            field_decoder = self.FIELD_DECODERS[pse.instruction_format[name]]
+            table[int(code, 2)] = (handler, field_decoder)
+            if pse.instruction_format[name] == 'S':
+                self.store_handlers.add(handler)
+        return table
+
+    # 各指令格式的字段解码，返回 (rd, rs1, rs2, imm)，imm 已完成符号扩展
+    # 字段解析顺序与 pseudo.encode 的位运算顺序相反，[15:12] 是最高4位, [3:0] 是 opcode
+    @staticmethod
+    def _fields_r(w):
+        return (w >> 4) & 0xF, (w >> 8) & 0xF, (w >> 12) & 0xF, 0
+
+    @staticmethod
+    def _fields_i(w):
+        imm = (w >> 12) & 0xF
+        return (w >> 4) & 0xF, (w >> 8) & 0xF, 0, imm - 16 if imm & 0x8 else imm
+
+    @staticmethod
+    def _fields_s(w):
+        imm = (w >> 4) & 0xF
+        return 0, (w >> 8) & 0xF, (w >> 12) & 0xF, imm - 16 if imm & 0x8 else imm
+
+    @staticmethod
+    def _fields_u(w):
+        return (w >> 4) & 0xF, 0, 0, (w >> 8) << 8 # lui 的无符号立即数预先左移8位
+
+    @staticmethod
+    def _fields_uj(w):
+        imm = (w >> 8) & 0xFF
+        return (w >> 4) & 0xF, 0, 0, imm - 256 if imm & 0x80 else imm
+
+    FIELD_DECODERS = {
+        'R': _fields_r.__func__,
+        'I': _fields_i.__func__,
+        'S': _fields_s.__func__,
+        'SB': _fields_s.__func__,
+        'U': _fields_u.__func__,
+        'UJ': _fields_uj.__func__,
+    }
+
+    def fetch_decoded(self):
+        # 取出当前PC处已预解码的指令记录，缓存未命中时现场解码并写回缓存
+        decoded = self.decode_cache[self.pc]
+        if decoded is None:
+            decoded = self.decode_word(self.memory[self.pc])
+            self.decode_cache[self.pc] = decoded
+        return decoded
+
+    def decode_word(self, instruction_word):
+        # 将16位指令字预解码为记录 (执行函数, rd, rs1, rs2, imm)
+        entry = self.dispatch_table[instruction_word & 0xF]
+        if entry is None:
+            return (None, 0, 0, 0, 0) # 未知操作码，执行时报错
+        handler, field_decoder = entry
+        return (handler, *field_decoder(instruction_word))
+
+    def decode_and_execute(self, instruction_word, decoded=None):
+    # 执行单条16位指令字 (16位整数)。decoded 为预解码记录，未提供时现场解码。
+
+        if instruction_word is None or not (0 <= instruction_word <= 0xFFFF):
+            self.halted = True
+            print(f"错误: 无效的指令字 '{instruction_word}' 在 PC={self.pc}")
+            return
+
+        if decoded is None:
+            decoded = self.decode_word(instruction_word)
+        handler, rd, rs1, rs2, imm = decoded
+
+        if handler is None:
+            print(f"错误: 未知或未实现的操作码 '{instruction_word & 0xF:04b}' 在 PC={self.pc:04X}, 指令={self.format_word(instruction_word)}")
+            self.halted = True
+            return
+
+        try:
+            # 执行函数返回下一条指令的PC
+            next_pc = handler(rd, rs1, rs2, imm)
+            if next_pc is not None:
+                self.pc = next_pc # 更新PC
+
+        except wpt.WatchpointHit: # 访存已完成，命中信息见 self.watch_hit
+            self.pc += 1
+
+        except Exception as e:
+            print(f"执行错误: PC={self.pc:04X}, 指令={self.format_word(instruction_word)}, 错误={e}")
+            import traceback
+            traceback.print_exc()
+            self.halted = True
+
+        # 确保r0始终为0
+        self.registers[0] = 0
+
+    # 各指令的执行函数：参数为预解码字段，返回下一条指令的PC；返回 None 表示已停止 (halted)
+    # 寄存器直接写 self.registers，r0 在每条指令执行后统一清零
+
+    #  R-type: add, sub, and, or
+    def _exec_add(self, rd, rs1, rs2, imm):
+        regs = self.registers
+        regs[rd] = (regs[rs1] + regs[rs2]) & 0xFFFF
+        return self.pc + 1
+
+    def _exec_sub(self, rd, rs1, rs2, imm):
+        regs = self.registers
+        regs[rd] = (regs[rs1] - regs[rs2]) & 0xFFFF
+        return self.pc + 1
+
+    def _exec_and(self, rd, rs1, rs2, imm):
+        regs = self.registers
+        regs[rd] = regs[rs1] & regs[rs2]
+        return self.pc + 1
+
+    def _exec_or(self, rd, rs1, rs2, imm):
+        regs = self.registers
+        regs[rd] = regs[rs1] | regs[rs2]
+        return self.pc + 1
+
+    #  I-type (算术): addi, subi
+    def _exec_addi(self, rd, rs1, rs2, imm):
+        regs = self.registers
+        regs[rd] = (regs[rs1] + imm) & 0xFFFF
+        return self.pc + 1
+
+    def _exec_subi(self, rd, rs1, rs2, imm):
+        regs = self.registers
+        regs[rd] = (regs[rs1] - imm) & 0xFFFF
+        return self.pc + 1
+
+    def _fail(self, message):
+        # 执行出错：记录错误信息并停止运行 (verbose 时才打印，不污染无界面运行的 JSON 输出)，返回 None 作为下一条PC
+        self.last_error = message
+        if self.verbose:
+            print(f"  错误: {message}")
+        self.halted = True
+        return None
+
+    #  I-type (加载): lw, lb
+    def _exec_lw(self, rd, rs1, rs2, imm):
+        mem_addr = (self.registers[rs1] + imm) & 0xFFFF
+        word_addr = mem_addr >> 1
+
+        if word_addr >= len(self.memory):
+            return self._fail(f"源地址 0x{word_addr:04X} 超出内存范围！")
+
+        if self.bus is not None: # 检查地址映射 (读外设/未映射的地址)
+            self.bus.on_load(mem_addr, 2, self.pc, self.step_count)
+        self.registers[rd] = self.memory[word_addr]
+        if self.watch_flags[word_addr]:
+            wpt.check_access(self, mem_addr, 2, False, self.memory[word_addr], self.memory[word_addr])
+        return self.pc + 1
+
+    def _exec_lb(self, rd, rs1, rs2, imm):
+        mem_addr = (self.registers[rs1] + imm) & 0xFFFF
+        word_addr = mem_addr >> 1
+
+        if word_addr >= len(self.memory):
+            return self._fail(f"源地址 0x{word_addr:04X} 超出内存范围！")
+
+        if self.bus is not None:
+            self.bus.on_load(mem_addr, 1, self.pc, self.step_count)
+        word_data = self.memory[word_addr]
+        byte_val = (word_data >> 8) if (mem_addr & 1) == 0 else (word_data & 0xFF)
+        self.registers[rd] = (byte_val - 256 if byte_val & 0x80 else byte_val) & 0xFFFF # 符号扩展
+        if self.watch_flags[word_addr]:
+            wpt.check_access(self, mem_addr, 1, False, word_data, word_data)
+        return self.pc + 1
+
+    # S-type 指令 (存储): sb, sw
+    def _exec_sw(self, rd, rs1, rs2, imm):
+        mem_addr = (self.registers[rs1] + imm) & 0xFFFF
+        word_addr = mem_addr >> 1
+
+        if word_addr >= len(self.memory):
+            return self._fail(f"目标地址 0x{word_addr:04X} 超出内存范围！")
+
+        old_word = self.memory[word_addr]
+        self.memory[word_addr] = self.registers[rs2]
+        self.dirty_pages[word_addr >> 8] = 1 # 每页 256 字
+        # 写入的字可能是代码 (自修改代码)，作废该地址的预解码记录和覆盖它的基本块
+        self.decode_cache[word_addr] = None
+        if self.code_flags[word_addr]:
+            self.invalidate_code(word_addr)
+        if self.bus is not None: # 外设地址的写入交给总线上的设备
+            self.bus.on_store(mem_addr, self.registers[rs2], 2, self.pc, self.step_count)
+        if self.watch_flags[word_addr]:
+            wpt.check_access(self, mem_addr, 2, True, old_word, self.memory[word_addr])
+        return self.pc + 1
+
+    def _exec_sb(self, rd, rs1, rs2, imm):
+        mem_addr = (self.registers[rs1] + imm) & 0xFFFF
+        word_addr = mem_addr >> 1
+
+        if word_addr >= len(self.memory):
+            return self._fail(f"目标地址 0x{word_addr:04X} 超出内存范围！")
+
+        rt_val = self.registers[rs2] & 0xFF
+        current_word = self.memory[word_addr]
+        if (mem_addr & 1) == 0:
+            self.memory[word_addr] = (rt_val << 8) | (current_word & 0x00FF)
+        else:
+            self.memory[word_addr] = (current_word & 0xFF00) | rt_val
+        self.dirty_pages[word_addr >> 8] = 1
+        self.decode_cache[word_addr] = None
+        if self.code_flags[word_addr]:
+            self.invalidate_code(word_addr)
+        if self.bus is not None:
+            self.bus.on_store(mem_addr, rt_val, 1, self.pc, self.step_count)
+        if self.watch_flags[word_addr]:
+            wpt.check_access(self, mem_addr, 1, True, current_word, self.memory[word_addr])
+        return self.pc + 1
+
+    #  SB-type (分支): beq, ble
+    # 与 SingleCPU.v 一致，跳转目标为 当前PC + 偏移 (pseudo.resolve_labels 按此计算偏移)
+    def _exec_beq(self, rd, rs1, rs2, imm):
+        if self.registers[rs1] == self.registers[rs2]:
+            return (self.pc + imm) & 0xFFFF
+        return self.pc + 1
+
+    def _exec_ble(self, rd, rs1, rs2, imm):
+        if self.registers[rs1] <= self.registers[rs2]:
+            return (self.pc + imm) & 0xFFFF
+        return self.pc + 1
+
+    #  U-type: lui
+    def _exec_lui(self, rd, rs1, rs2, imm):
+        self.registers[rd] = imm
+        return self.pc + 1
+
+    #  UJ-type: jal
+    def _exec_jal(self, rd, rs1, rs2, imm):
+        if rd != 0:
+            self.registers[rd] = (self.pc + 1) & 0xFFFF
+
+        # `resolve_labels` 中计算偏移的逻辑是 offset = (label_map[label_name] + 1) - current_pc - 1
+        # 即 offset = 目标PC - 当前PC，与 SingleCPU.v 的 currentAddress + immExt 一致
+        return (self.pc + imm) & 0xFFFF
+
+    #  I-type: jalr
+    def _exec_jalr(self, rd, rs1, rs2, imm):
+        rs1_val = self.registers[rs1]
+
+        if rd != 0:
+            self.registers[rd] = (self.pc + 1) & 0xFFFF
+
+        return (rs1_val + imm) & 0xFFFF
+
+
+    def signed_int(self, val, bits):
+        # 二进制补码转换为有符号整数 (val 为 bits 位无符号整数)
+        if (val & (1 << (bits - 1))) != 0: # 若设置了符号位
+            val = val - (1 << bits)        # 计算负值
+        return val
+
+    def step(self):
+        # 执行单步操作
+        # 如果成功执行一条指令，则返回 True;如果模拟器已停止或无法执行，则返回 False
+
+        # 1. 执行前检查状态
+        if self.halted:
+            if self.verbose:
+                print("模拟器已停止，无法单步执行。")
+            return False
+
+        # 检查PC是否越界或指向了全0的无效指令区域
+        # (假设程序结束或无效区域用全0指令表示)
+        if not (0 <= self.pc < len(self.memory) and self.memory[self.pc] != 0):
+            self.halted = True
+            if self.verbose:
+                print(f"模拟器在 PC={self.pc} 处停止 (PC越界或遇到无效指令).")
+            return False
+        # 2. 获取并执行指令 (使用预解码缓存，避免每步重新解码)
+        instruction = self.fetch()
+
+        if instruction is not None:
+            decoded = self.fetch_decoded()
+            if self.history is not None:
+                self.history.record(self, decoded, self.step_count)
+            if self.profiler is not None and decoded[0] is not None:
+                self.profiler.record(self, decoded)
+            if self.tracer is not None and decoded[0] is not None:
+                self.tracer.record(self, decoded)
+            self.previous_pc = self.pc
+            # decode_and_execute 会在内部处理执行，并可能在出错时设置 self.halted = True
+            self.decode_and_execute(instruction, decoded)
+            self.step_count += 1
+
+            # 3. 返回正确的状态
+            # 只要 fetch 成功，就认为这一步是“尝试过”的
+            # simulator 是否继续，取决于执行后 self.halted 的状态
+            # step() 的返回值表明“本次step是否成功启动”
+            # decode_and_execute 出错会设置 halted，但本次 step 本身是成功发起的
+            # 为了让主循环的逻辑更清晰，这里直接检查 halted 状态
+            if self.halted:
+                return False # 如果 decode_and_execute 内部导致了停止，则返回 False
+
+            else:
+                return True # 否则，成功执行一步，返回 True
+        else:
+            # Fetch 失败说明着PC有问题
+            self.halted = True
+            return False
+
+    def run(self, max_steps=100000, jit=True):
+        # 无打印、无延时地连续执行，直到停止或达到步数上限 (供无界面批量运行使用)
+        # jit 为 True 时按基本块执行翻译后的 Python 函数 (见 block_jit.py)，结果与逐条执行一致
+        # 返回 (执行步数, 停止原因)，停止原因见 run_until
+        return self.run_until(max_steps, jit=jit)
+
+    def run_until(self, max_steps=100000, pc_breakpoints=None, watch=None, jit=True):
+        # 在模拟器内部的紧凑循环中连续执行，直到停止、命中断点或达到步数上限
+        # pc_breakpoints: 断点PC集合 (字地址)，在执行该PC处的指令之前停下 (包括第一条指令)
+        #                 也可以是字典 {PC: breakpoints.Breakpoint 或 None}，条件断点只在条件成立时停下
+        # watch: 可选的回调 watch(simulator)，每条指令执行后调用，返回 True 时停下 (提供时逐条解释执行)
+        # 返回 (执行步数, 停止原因)，停止原因为:
+        #   'halt'        PC越界或遇到全0指令 (程序结束)
+        #   'self_loop'   jal/beq/ble 跳转到自身 (如 end: jal r0, end)，机器状态不会再改变
+        #   'breakpoint'  下一条要执行的指令位于断点PC
+        #   'watch'       watch 回调返回 True
+        #   'watchpoint'  访存命中内存监视点 (该条指令已执行完)，命中信息见 self.watch_hit
+        #   'max_steps'   达到步数上限
+        #   'error'       非法指令或执行出错
+        if pc_breakpoints and not isinstance(pc_breakpoints, (set, frozenset, dict)):
+            pc_breakpoints = set(pc_breakpoints)
+        if self.profiler is not None or self.tracer is not None: # 剖析/记录轨迹时使用单独的循环，其余时候执行循环保持不变
+            return self._run_instrumented(max_steps, pc_breakpoints or None, watch)
+        if jit and watch is None and self.history is None: # 记录执行历史时需要逐条执行
+            return self._run_blocks(max_steps, pc_breakpoints or None)
+        return self._run_interpreted(max_steps, pc_breakpoints or None, watch)
+
+    def _should_break(self, breakpoints, pc):
+        # pc 在断点集合/字典中时调用：集合或值为 None 时无条件停下，否则由条件断点 (breakpoints.Breakpoint) 判断
+        if isinstance(breakpoints, dict):
+            breakpoint = breakpoints[pc]
+            if breakpoint is not None:
+                return breakpoint.should_stop(self)
+        return True
+
+    def _run_interpreted(self, max_steps, breakpoints=None, watch=None):
+        # 逐条解释执行 (预解码记录 + 分发表)
+        memory = self.memory
+        cache = self.decode_cache
+        regs = self.registers
+        exec_jalr = self._exec_jalr
+        history = self.history
+        steps = 0
+
+        if self.halted:
+            return steps, 'halt'
+
+        try:
+            while steps < max_steps:
+                pc = self.pc
+                if not (0 <= pc < len(memory)) or memory[pc] == 0:
+                    self.halted = True
+                    return steps, 'halt'
+                if breakpoints is not None and pc in breakpoints and self._should_break(breakpoints, pc):
+                    return steps, 'breakpoint'
+
+                decoded = cache[pc]
+                if decoded is None:
+                    decoded = self.fetch_decoded()
+                handler, rd, rs1, rs2, imm = decoded
+                if handler is None:
+                    self._fail(f"未知或未实现的操作码 '{memory[pc] & 0xF:04b}' 在 PC={pc:04X}")
+                    return steps, 'error'
+
+                if history is not None:
+                    history.record(self, decoded, self.step_count)
+                self.previous_pc = pc
+                next_pc = handler(rd, rs1, rs2, imm)
+                regs[0] = 0 # 确保r0始终为0
+                steps += 1
+                self.step_count += 1
+
+                if next_pc is None: # 执行函数内部已设置 halted
+                    return steps, 'error'
+                self.pc = next_pc
+
+                if next_pc == pc and handler != exec_jalr:
+                    return steps, 'self_loop'
+                if watch is not None and watch(self):
+                    return steps, 'watch'
+
+        except wpt.WatchpointHit: # 访存类指令执行完后抛出，下一条指令顺序执行
+            regs[0] = 0
+            steps += 1
+            self.step_count += 1
+            self.pc = pc + 1
+            return steps, 'watchpoint'
+
+        except Exception as e:
+            self._fail(f"PC={self.pc:04X} 执行出错: {e}")
+            return steps, 'error'
+
+        return steps, 'max_steps'
+
+    def _run_instrumented(self, max_steps, breakpoints=None, watch=None):
+        # 剖析/轨迹模式：每条指令执行前交给 profiler 和 tracer 记录，再由解释器执行这一条
+        memory = self.memory
+        profiler = self.profiler
+        tracer = self.tracer
+        history = self.history
+        steps = 0
+
+        while steps < max_steps:
+            pc = self.pc
+            if not self.halted and 0 <= pc < len(memory) and memory[pc] != 0:
+                # 断点在这里判断 (条件断点的命中次数只加一次)，不停下时这一条一定会执行
+                if breakpoints is not None and pc in breakpoints and self._should_break(breakpoints, pc):
+                    return steps, 'breakpoint'
+                decoded = self.fetch_decoded()
+                if decoded[0] is not None:
+                    if history is not None and self.step_count % history.snapshot_interval == 0:
+                        history.add_snapshot(self) # 快照先于剖析计数，快照中的计数不含这一条 (与 step() 的顺序相同)
+                    if profiler is not None:
+                        profiler.record(self, decoded)
+                    if tracer is not None:
+                        tracer.record(self, decoded)
+
+            n, reason = self._run_interpreted(1, None, watch)
+            steps += n
+            if reason != 'max_steps':
+                return steps, reason
+
+        return steps, 'max_steps'
+
+    def _run_blocks(self, max_steps, breakpoints=None):
+        # 按基本块执行；块还不够热、无法翻译、剩余步数不足一个块、块内含断点或块提前退出时，由解释器执行一条指令
+        memory = self.memory
+        regs = self.registers
+        blocks = self.block_cache
+        visits = self.block_visits
+        threshold = self.compile_threshold
+        steps = 0
+        interpret_next = False
+        fast_forward = self.fast_forward
+        blocks_with_breakpoint = {} # 基本块 -> 块内 (除第一条外) 是否有断点，每次调用只计算一次
+
+        if self.halted:
+            return steps, 'halt'
+
+        while steps < max_steps:
+            pc = self.pc
+            if not (0 <= pc < len(memory)) or memory[pc] == 0:
+                self.halted = True
+                return steps, 'halt'
+            if breakpoints is not None and pc in breakpoints and self._should_break(breakpoints, pc):
+                return steps, 'breakpoint'
+
+            block = None
+            if not interpret_next:
+                block = blocks.get(pc)
+                if block is None:
+                    count = visits.get(pc, 0) + 1
+                    if count >= threshold:
+                        block = self._compile_block(pc)
+                        visits.pop(pc, None)
+                    else:
+                        visits[pc] = count
+                if block is not None and breakpoints is not None:
+                    has_breakpoint = blocks_with_breakpoint.get(block)
+                    if has_breakpoint is None:
+                        has_breakpoint = any(addr in breakpoints for addr in range(pc + 1, block.last_pc + 1))
+                        blocks_with_breakpoint[block] = has_breakpoint
+                    if has_breakpoint:
+                        block = None
+
+            if block is None or block.length > max_steps - steps:
+                interpret_next = False
+                n, reason = self._run_interpreted(1)
+                steps += n
+                if reason != 'max_steps':
+                    return steps, reason
+                continue
+
+            if block.loop is not None and fast_forward and not (isinstance(breakpoints, dict) and breakpoints.get(pc) is not None):
+                # 计数循环：一次执行多轮，步数按实际执行的指令条数累加
+                # 循环头有条件断点时不快进，逐轮执行块，使每次到达循环头都计算条件 (命中次数与逐条执行相同)
+                total = block.loop.iterations(regs)
+                rounds = min(total, (max_steps - steps) // block.length) if total is not None else 0
+                if rounds > 1:
+                    for reg, delta in block.loop.deltas:
+                        regs[reg] = (regs[reg] + rounds * delta) & 0xFFFF
+                    regs[0] = 0
+                    n = rounds * block.length
+                    steps += n
+                    self.step_count += n
+                    self.previous_pc = block.last_pc
+                    # 执行完全部轮数时落到循环之后；剩余步数不足时停在块首 (分支仍跳转)
+                    self.pc = block.last_pc + 1 if rounds == total else pc
+                    continue
+
+            next_pc, n = block.fn(regs, memory, self)
+            steps += n
+            self.step_count += n
+            if n:
+                self.previous_pc = pc + n - 1
+            self.pc = next_pc
+
+            if n < block.length: # 块提前退出 (访存越界、访问被监视的字或改写了代码)，下一条指令交给解释器
+                interpret_next = True
+                continue
+
+            if block.self_loop and next_pc == block.last_pc:
+                return steps, 'self_loop'
+
+        return steps, 'max_steps'
+
+    def attach_bus(self, bus=None):
+        # 接入外设总线 (默认为与 DataMemory.v 一致的 bus.board_bus())，返回该总线
+        if bus is None:
+            import bus as membus
+            bus = membus.board_bus()
+        self.bus = bus
+        self.bus.reset()
+        return self.bus
+
+    def detach_bus(self):
+        self.bus = None
+
+    def add_watchpoint(self, start, length=1, read=False, write=True, change=False):
+        # 添加内存监视点：start 为字节地址，length 为字节数 (监视一个字用 length=2)，返回 watchpoints.Watchpoint
+        # start 也可以是已构造的 watchpoints.Watchpoint (如 watchpoints.parse_watch_spec() 的结果)
+        if isinstance(start, wpt.Watchpoint):
+            watchpoint = start
+        else:
+            watchpoint = wpt.Watchpoint(start, length, read, write, change)
+        if watchpoint.length < 1 or not 0 <= watchpoint.start < 2 * self.MEMORY_WORDS:
+            raise ValueError(f"无效的监视范围: 0x{watchpoint.start:04X} (+{watchpoint.length})")
+        self.watchpoints.append(watchpoint)
+        wpt.rebuild_flags(self)
+        return watchpoint
+
+    def remove_watchpoint(self, watchpoint):
+        self.watchpoints.remove(watchpoint)
+        wpt.rebuild_flags(self)
+
+    def clear_watchpoints(self):
+        self.watchpoints = []
+        self.watch_hit = None
+        wpt.rebuild_flags(self)
+
+    def save_checkpoint(self, path):
+        # 把完整的机器状态保存为检查点文件 (见 checkpoint.py)
+        import checkpoint
+        checkpoint.save(self, path)
+
+    def load_checkpoint(self, path):
+        # 从检查点文件恢复机器状态 (内存映像直接映射文件，不复制)，返回 checkpoint.Checkpoint
+        import checkpoint
+        return checkpoint.load(self, path)
+
+    def start_trace(self, path, chunk_records=65536):
+        # 开始把执行轨迹写入 path (定长二进制记录，见 exec_trace.py)，文件头中保存当前的寄存器和内存
+        self.stop_trace()
+        import exec_trace
+        self.tracer = exec_trace.TraceWriter(path, self, chunk_records)
+        return self.tracer
+
+    def stop_trace(self):
+        # 结束记录并写完轨迹文件
+        if self.tracer is not None:
+            self.tracer.close(self)
+            self.tracer = None
+
+    def enable_profiler(self):
+        # 开始统计执行次数，返回 profiler.Profiler；之后的 step/run/run_until 都会记录
+        import profiler as prof
+        self.profiler = prof.Profiler(self.MEMORY_WORDS, self.step_count)
+        return self.profiler
+
+    def disable_profiler(self):
+        self.profiler = None
+
+    def enable_history(self, snapshot_interval=10000, max_journal=1000000):
+        # 开始记录执行历史 (撤销日志 + 每 snapshot_interval 步一个快照)，之后可后退单步或跳到第K步
+        # 记录历史时 run_until 逐条解释执行，不使用基本块翻译
+        self.history = hist.ExecutionHistory(snapshot_interval, max_journal)
+        self.history.add_snapshot(self)
+
+    def disable_history(self):
+        self.history = None
+
+    def take_snapshot(self):
+        # 生成当前机器状态 (寄存器、PC、内存) 的快照，内存页与上一个快照按页共享
+        snapshot = hist.take_snapshot(self, self.last_snapshot)
+        self.last_snapshot = snapshot
+        return snapshot
+
+    def restore_snapshot(self, snapshot):
+        # 恢复到快照时的机器状态，只写回改动过的内存页
+        hist.restore_snapshot(self, snapshot, self.last_snapshot)
+        self.last_snapshot = snapshot
+        if self.history is not None: # 日志与恢复后的状态不再连续
+            self.history.journal.clear()
+
+    def step_back(self, n=1):
+        # 后退 n 步，返回实际后退的步数 (需要先 enable_history)
+        if self.history is None:
+            return 0
+        return self.history.step_back(self, n)
+
+    def go_to_step(self, target_step):
+        # 跳到第 target_step 步，返回实际到达的步数 (需要先 enable_history)
+        if self.history is None:
+            return self.step_count
+        return self.history.go_to_step(self, target_step)
+
+    def run_program(self, max_steps=1000): # max_steps 防无限循环
+        print("Running program...")
+
+        time.sleep(0.3) # 延迟0.3s
+
+        steps = 0
+        while not self.halted and steps < max_steps:
+            if not self.step(): # 返回 False，如果步骤停止
+                break
+            steps += 1
+
+        if steps >= max_steps:
+            print(f"Halted: Reached max execution steps ({max_steps}).")
+            self.halted = True
+        self.print_regs()
+
+    def print_regs(self):
+        print("--- Registers ---")
+
+        time.sleep(0.3)  # 延迟0.3s
+
+        for i in range(0, 16, 4):
+            row = []
+            for j in range(4):
+                reg_idx = i + j
+                reg_name = pse.reg_num_to_name.get(reg_idx, f'r{reg_idx}')
+                val = self.get_reg_value(reg_idx)
+                row.append(f"{reg_name:>3}: {val:<5} (0x{val:04X})")
+            print(" | ".join(row))
+        print(f"PC: {self.pc} (0x{self.pc:04X})")
+        print("-----------------")
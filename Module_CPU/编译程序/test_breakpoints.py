@@ -0,0 +1,42 @@
+# 条件断点：按基本块执行 (jit=True) 与逐条解释执行 (jit=False) 的结果必须相同
+#
+# 用法 (在 编译程序 目录下):
+#   python -m unittest test_breakpoints
+
+import unittest
+
+import headless
+from breakpoints import Breakpoint
+
+LOOP_HEAD_PC = 6 # program.txt 中计数循环的循环头
+
+
+def _run(condition, pc, jit, max_steps=2000000):
+    simulator = headless.new_simulator()
+    headless.load_program(simulator, 'program.txt')
+    breakpoint = Breakpoint(condition)
+    steps, reason = simulator.run_until(max_steps, {pc: breakpoint}, jit=jit)
+    return steps, reason, list(simulator.registers), simulator.pc, simulator.halted, breakpoint.hits, breakpoint.error
+
+
+class ConditionalBreakpointTest(unittest.TestCase):
+    def test_loop_head_matches_interpreter(self):
+        # 循环头上的条件断点不能被计数循环快进跳过
+        for condition in ('hits >= 100', 'a5 == 50'):
+            with self.subTest(condition=condition):
+                blocks = _run(condition, LOOP_HEAD_PC, jit=True)
+                interpreted = _run(condition, LOOP_HEAD_PC, jit=False)
+                self.assertEqual(blocks[1], 'breakpoint')
+                self.assertEqual(blocks, interpreted)
+
+    def test_condition_error_stops_without_halting(self):
+        # 条件计算出错时停在断点处并给出错误信息，不抛出异常，也不停止程序
+        for jit in (True, False):
+            with self.subTest(jit=jit):
+                steps, reason, _, pc, halted, hits, error = _run('1 // r0 == 0', 0, jit)
+                self.assertEqual((steps, reason, pc, halted, hits), (0, 'breakpoint', 0, False, 1))
+                self.assertIn('ZeroDivisionError', error)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,127 @@
+# 外设总线的地址映射检查：写 ROM、读写 RAM 之后的地址、读外设地址和未映射的地址记为 BusFault
+# 接入总线不能改变执行结果；按基本块执行 (翻译阈值为1和默认值) 与逐条解释执行记录的越界访问必须相同，
+# 执行历史回退后重新执行不能重复记录
+#
+# 用法 (在 编译程序 目录下):
+#   python -m unittest test_bus
+
+import contextlib
+import io
+import unittest
+
+import headless
+
+# 地址放在寄存器初值中 (li 不能直接得到这些地址)；ROM 地址 0x00F0 在代码之外，写入不会改动程序
+REGISTERS = {'a1': 0x1040, 'a2': 0x00F0, 'a3': 0x2000, 'a5': 0x3000, 'a7': 0x5000, 'a10': 0x1000, 'a12': 40}
+PROGRAM = [
+    'loop:',
+    '    sw a1, 0(a1)',   # RAM 之后的地址 (0x1040)
+    '    lw a4, 0(a1)',
+    '    sw a1, 0(a2)',   # ROM
+    '    lw a4, 0(a3)',   # LED 只能写
+    '    lb a4, 0(a5)',   # 数码管只能写
+    '    lw a4, 0(a7)',   # 未映射的地址
+    '    sb a1, 0(a7)',
+    '    sw a1, 0(a10)',  # 以下都在地址映射之内
+    '    lw a4, 0(a10)',
+    '    sw a1, 0(a3)',
+    '    sb a1, 0(a5)',
+    '    addi a11, a11, 1',
+    '    ble a12, a11, done', # 分支偏移只有4位，用 jal 跳回循环头
+    '    jal loop',
+    'done:',
+]
+ITERATIONS = 40
+STEPS_PER_ITERATION = 14
+EXPECTED_FAULTS = [  # (kind, byte_addr, width, pc, region)
+    ('store', 0x1040, 2, 0, None),
+    ('load', 0x1040, 2, 1, None),
+    ('store', 0x00F0, 2, 2, 'rom'),
+    ('load', 0x2000, 2, 3, 'led'),
+    ('load', 0x3000, 1, 4, 'digits'),
+    ('load', 0x5000, 2, 5, None),
+    ('store', 0x5000, 1, 6, None),
+]
+
+
+def _load(with_bus, threshold=None):
+    simulator = headless.new_simulator()
+    if with_bus:
+        simulator.attach_bus()
+    if threshold is not None:
+        simulator.compile_threshold = threshold
+    headless.load_lines(simulator, PROGRAM)
+    for name, value in REGISTERS.items():
+        simulator.registers[headless.pse.register_alias[name]] = value
+    return simulator
+
+
+def _state(simulator, result):
+    return (result, list(simulator.registers), simulator.memory.tobytes(), simulator.pc, simulator.halted,
+            simulator.step_count)
+
+
+def _faults(simulator):
+    return [(f.kind, f.byte_addr, f.width, f.pc, f.step, f.region) for f in simulator.bus.faults]
+
+
+def _expected_faults(iterations):
+    return [(kind, addr, width, pc, i * STEPS_PER_ITERATION + pc, region)
+            for i in range(iterations) for kind, addr, width, pc, region in EXPECTED_FAULTS]
+
+
+class BusFaultTest(unittest.TestCase):
+    def test_faults_match_interpreter(self):
+        expected = _load(False)
+        expected_state = _state(expected, expected.run_until(100000, jit=False))
+        self.assertTrue(expected.halted)
+        for jit in (False, True):
+            for threshold in (1, None):
+                with self.subTest(jit=jit, threshold=threshold):
+                    simulator = _load(True, threshold)
+                    self.assertEqual(_state(simulator, simulator.run_until(100000, jit=jit)), expected_state)
+                    self.assertEqual(simulator.bus.fault_count, ITERATIONS * len(EXPECTED_FAULTS))
+                    self.assertEqual(_faults(simulator), _expected_faults(ITERATIONS)[:len(simulator.bus.faults)])
+
+    def test_repository_programs_have_no_faults(self):
+        for path in ('program.txt', 'program2.txt'):
+            with self.subTest(path=path):
+                simulator = headless.new_simulator()
+                simulator.attach_bus()
+                headless.load_program(simulator, path)
+                simulator.run_until(1000000) # program.txt 不会结束，只运行前 1000000 步
+                self.assertEqual(simulator.bus.fault_count, 0)
+
+    def test_history_replay_does_not_repeat_faults(self):
+        simulator = _load(True)
+        simulator.enable_history(16, 10) # 日志很短：向后跳转要恢复快照后重新执行
+        simulator.run_until(3 * STEPS_PER_ITERATION, jit=False)
+        for target in (5, 0, 2 * STEPS_PER_ITERATION, 3 * STEPS_PER_ITERATION):
+            simulator.history.go_to_step(simulator, target)
+        self.assertEqual(simulator.step_back(5), 5) # 逐条撤销日志
+        simulator.run_until(5, jit=False)
+        self.assertEqual(simulator.step_count, 3 * STEPS_PER_ITERATION)
+        self.assertEqual(_faults(simulator), _expected_faults(3))
+
+    def test_reset_clears_faults(self):
+        simulator = _load(True)
+        simulator.run_until(STEPS_PER_ITERATION)
+        headless.load_lines(simulator, PROGRAM)
+        self.assertEqual((simulator.bus.fault_count, simulator.bus.faults), (0, []))
+
+    def test_headless_reports_faults(self):
+        lines = ['addi a1, r0, 1', 'sw a1, 0(r0)'] # 写 ROM 的地址0
+        with contextlib.redirect_stdout(io.StringIO()):
+            plain = headless.run_file('rom', lines=lines)
+            simulator = headless.new_simulator()
+            simulator.attach_bus()
+            result = headless.run_file('rom', lines=lines, simulator=simulator)
+        self.assertNotIn('bus_faults', plain)
+        self.assertEqual(result['bus_faults'], {'count': 1, 'faults': [
+            {'kind': 'store', 'byte_addr': 0, 'width': 2, 'pc': 1, 'step': 1, 'region': 'rom'}]})
+        del result['bus_faults']
+        self.assertEqual(result, plain)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,43 @@
+# 无界面运行：越界访存等执行错误写入结果的 error 字段，不能打印到标准输出 (会破坏 JSON 输出)
+#
+# 用法 (在 编译程序 目录下):
+#   python -m unittest test_headless
+
+import contextlib
+import io
+import unittest
+
+import headless
+
+OUT_OF_RANGE = {
+    'sw': ['addi a1, r0, -2', 'sw a1, 0(a1)'],
+    'sb': ['addi a1, r0, -2', 'sb a1, 0(a1)'],
+    'lw': ['addi a1, r0, -2', 'lw a2, 0(a1)'],
+    'lb': ['addi a1, r0, -2', 'lb a2, 0(a1)'],
+}
+
+
+class HeadlessErrorTest(unittest.TestCase):
+    def test_out_of_range_access(self):
+        for name, lines in OUT_OF_RANGE.items():
+            with self.subTest(instruction=name):
+                stdout = io.StringIO()
+                with contextlib.redirect_stdout(stdout):
+                    result = headless.run_file(name, lines=lines)
+                self.assertEqual(stdout.getvalue(), '')
+                self.assertEqual((result['steps'], result['stop_reason']), (2, 'error'))
+                self.assertIn('0x7FFF 超出内存范围', result['error'])
+
+    def test_error_cleared_on_reload(self):
+        # 复用模拟器运行下一个程序时不能带上一次的错误
+        simulator = headless.new_simulator()
+        with contextlib.redirect_stdout(io.StringIO()):
+            headless.run_file('sw', lines=OUT_OF_RANGE['sw'], simulator=simulator)
+            result = headless.run_file('program2.txt', simulator=simulator)
+        self.assertEqual(result['stop_reason'], 'halt')
+        self.assertNotIn('error', result)
+        self.assertIsNone(simulator.last_error)
+
+
+if __name__ == '__main__':
+    unittest.main()
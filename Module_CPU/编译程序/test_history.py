@@ -0,0 +1,149 @@
+# 执行历史：go_to_step / step_back 之后的机器状态必须与重新加载后直接执行 K 步的结果完全相同
+# 使用很小的快照间隔，日志较短时向后跳转要经过快照恢复；接入外设总线时同时比较 LED/数码管状态
+# 开启剖析/轨迹时，回退后重新执行不能重复计数：剖析结果和周期数对应当前步数，轨迹与直接运行的相同
+#
+# 用法 (在 编译程序 目录下):
+#   python -m unittest test_history
+
+import os
+import tempfile
+import unittest
+
+import exec_trace
+import headless
+import timing
+
+PROGRAM = 'program2.txt'
+PROGRAM_STEPS = 181 # program2.txt 执行 181 条指令后结束
+SNAPSHOT_INTERVAL = 16
+TARGETS = (181, 120, 5, 150, 0, 181, 33, 100, 64, 48, 47, 170, 16, 181)
+MULTI_CYCLE = {'lw': 3, 'lb': 3, 'sw': 2, 'sb': 2, 'beq': 2, 'ble': 2} # 周期数按操作码统计，依赖剖析计数
+
+
+def _load(with_bus):
+    simulator = headless.new_simulator()
+    if with_bus:
+        simulator.attach_bus()
+    headless.load_program(simulator, PROGRAM)
+    return simulator
+
+
+def _state(simulator):
+    devices = simulator.bus.state() if simulator.bus is not None else None
+    return (list(simulator.registers), simulator.pc, simulator.previous_pc, simulator.halted,
+            simulator.step_count, simulator.memory.tobytes(), devices)
+
+
+def _fresh_state(steps, with_bus):
+    simulator = _load(with_bus)
+    simulator.run_until(steps, jit=False)
+    return _state(simulator)
+
+
+class ExecutionHistoryTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.expected = {(k, with_bus): _fresh_state(k, with_bus)
+                        for k in range(PROGRAM_STEPS + 1) for with_bus in (False, True)}
+
+    def _assert_at(self, simulator, step, with_bus):
+        self.assertEqual(simulator.step_count, step)
+        self.assertEqual(_state(simulator), self.expected[step, with_bus])
+
+    def test_go_to_step(self):
+        # 日志足够长 (逐条撤销) 和日志很短 (恢复快照后重新执行) 两种情况，向前、向后跳转交替
+        for with_bus in (False, True):
+            for max_journal in (1000000, 10):
+                simulator = _load(with_bus)
+                simulator.enable_history(SNAPSHOT_INTERVAL, max_journal)
+                for target in TARGETS:
+                    with self.subTest(with_bus=with_bus, max_journal=max_journal, target=target):
+                        self.assertEqual(simulator.go_to_step(target), target)
+                        self._assert_at(simulator, target, with_bus)
+
+    def test_go_past_end(self):
+        simulator = _load(False)
+        simulator.enable_history(SNAPSHOT_INTERVAL)
+        # 执行到程序结束时停下 (与直接运行到结束相同，halted 为 True)
+        self.assertEqual(simulator.go_to_step(PROGRAM_STEPS + 50), PROGRAM_STEPS)
+        self.assertEqual(_state(simulator), _fresh_state(PROGRAM_STEPS + 50, False))
+
+    def test_step_back_across_snapshot(self):
+        # 从快照之后几步后退到快照之前，包括向后跳转 (恢复快照) 之后再单步后退
+        for with_bus in (False, True):
+            simulator = _load(with_bus)
+            simulator.enable_history(SNAPSHOT_INTERVAL)
+            simulator.run_until(PROGRAM_STEPS, jit=False)
+            for start, back in ((3 * SNAPSHOT_INTERVAL + 2, 5), (SNAPSHOT_INTERVAL, 1), (PROGRAM_STEPS, 40)):
+                with self.subTest(with_bus=with_bus, start=start, back=back):
+                    simulator.go_to_step(start)
+                    self.assertEqual(simulator.step_back(back), back)
+                    self._assert_at(simulator, start - back, with_bus)
+
+            simulator = _load(with_bus)
+            simulator.enable_history(SNAPSHOT_INTERVAL, max_journal=10)
+            simulator.run_until(PROGRAM_STEPS, jit=False)
+            simulator.go_to_step(5 * SNAPSHOT_INTERVAL + 3) # 日志不够，从第 80 步的快照重新执行 3 步
+            with self.subTest(with_bus=with_bus, max_journal=10):
+                self.assertEqual(simulator.step_back(5), 3) # 恢复快照后只有之后 3 步的日志
+                self._assert_at(simulator, 5 * SNAPSHOT_INTERVAL, with_bus)
+                simulator.run_until(4, jit=False)
+                self.assertEqual(simulator.step_back(4), 4)
+                self._assert_at(simulator, 5 * SNAPSHOT_INTERVAL, with_bus)
+
+    def test_profiler_follows_current_step(self):
+        # 运行到结束、跳回第120步再运行到结束：计数与直接运行 181 步相同 (之前回放会重复计数)
+        timing_model = timing.TimingModel(cycles_per_instruction=MULTI_CYCLE)
+        expected = {}
+        for k in (0, 5, 60, 120, PROGRAM_STEPS):
+            simulator = _load(False)
+            profiler = simulator.enable_profiler()
+            simulator.run_until(k)
+            expected[k] = profiler.to_dict(), timing_model.cycles(simulator)
+
+        for max_journal in (1000000, 10):
+            simulator = _load(False)
+            simulator.enable_history(SNAPSHOT_INTERVAL, max_journal)
+            profiler = simulator.enable_profiler()
+            simulator.run_until(PROGRAM_STEPS)
+            simulator.go_to_step(120)
+            simulator.run_until(1000)
+            for k in (PROGRAM_STEPS, 120, 5, 60, PROGRAM_STEPS, 0):
+                with self.subTest(max_journal=max_journal, step=k):
+                    simulator.go_to_step(k)
+                    self.assertEqual(profiler.total, k)
+                    self.assertEqual((profiler.to_dict(), timing_model.cycles(simulator)), expected[k])
+            simulator.go_to_step(60)
+            simulator.step_back(7)
+            simulator.run_until(7)
+            self.assertEqual(profiler.to_dict(), expected[60][0])
+
+    def test_trace_records_each_step_once(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            direct = os.path.join(tmp, 'direct.trc')
+            simulator = _load(False)
+            simulator.start_trace(direct)
+            simulator.run_until(1000)
+            simulator.stop_trace()
+
+            for max_journal in (1000000, 10):
+                path = os.path.join(tmp, f'history{max_journal}.trc')
+                simulator = _load(False)
+                simulator.enable_history(SNAPSHOT_INTERVAL, max_journal)
+                simulator.start_trace(path, chunk_records=8)
+                simulator.run_until(100)
+                simulator.go_to_step(40)
+                simulator.run_until(30)
+                simulator.step_back(3)
+                simulator.run_until(1000)
+                simulator.go_to_step(150)
+                simulator.go_to_step(PROGRAM_STEPS)
+                simulator.stop_trace()
+                with self.subTest(max_journal=max_journal):
+                    with open(direct, 'rb') as f, open(path, 'rb') as g:
+                        self.assertEqual(f.read(), g.read())
+                    self.assertEqual(exec_trace.TraceReader(path, use_mmap=False).count, PROGRAM_STEPS)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,128 @@
+# 增量汇编：对 program2.txt 做编辑后，patch_simulator 改写后的内存和 pc_to_source_line_map
+# 必须与完整汇编 (expand_pseudo_instructions + build_image) 后重新加载的结果完全相同
+#
+# 用法 (在 编译程序 目录下):
+#   python -m unittest test_incremental
+
+import unittest
+
+import headless
+import pseudo as pse # 导入pseudo.py
+from incremental import IncrementalAssembler
+
+with open('program2.txt', 'r', encoding='utf-8') as f:
+    PROGRAM = f.read().splitlines()
+
+
+def _line(text):
+    # program2.txt 中内容为 text 的行的下标 (唯一)
+    matches = [i for i, line in enumerate(PROGRAM) if line.strip().startswith(text)]
+    assert len(matches) == 1, text
+    return matches[0]
+
+
+def insert_line(lines):
+    # 在外层循环开始前插入一条指令，之后的所有标签地址加1
+    lines = list(lines)
+    lines.insert(_line('addi a6, a1, 0'), '    addi a0, a0, 1')
+    return lines
+
+
+def move_label(lines):
+    # no_swap 标签前移一条指令：引用它的 ble a8, a9, no_swap (在别处) 必须重新编码，程序仍然会结束
+    lines = list(lines)
+    i = _line('no_swap:')
+    lines[i - 1], lines[i] = lines[i], lines[i - 1]
+    return lines
+
+
+def change_immediate(lines):
+    lines = list(lines)
+    i = _line('addi a7, a7, 1')
+    lines[i] = lines[i].replace('addi a7, a7, 1', 'addi a7, a7, 2')
+    return lines
+
+
+EDITS = {'insert_line': insert_line, 'move_label': move_label, 'change_immediate': change_immediate}
+
+
+def _full(lines):
+    # 完整汇编并重新加载
+    expanded, label_map, data_lma_values, source_lines = pse.expand_pseudo_instructions(lines)
+    image = pse.build_image(expanded, label_map, data_lma_values)
+    simulator = headless.new_simulator()
+    success, message = simulator.load_program_from_source(expanded, label_map, data_lma_values, source_lines)
+    assert success, message
+    return image, simulator
+
+
+def _restart(simulator):
+    simulator.registers[:] = [0] * 16
+    simulator.pc = 0
+    simulator.previous_pc = 0
+    simulator.halted = False
+
+
+class IncrementalAssemblerTest(unittest.TestCase):
+    def _check_patch(self, assembler, simulator, lines, ran):
+        # ran: 模拟器在改写前运行过 (RAM 中有数据，基本块已翻译)，此时只比较 ROM 部分的内存
+        result = assembler.assemble(lines)
+        assembler.patch_simulator(simulator, result)
+        image, fresh = _full(lines)
+        self.assertEqual(result.image, image)
+        if ran:
+            self.assertEqual(simulator.memory[:pse.ROM_WORDS], fresh.memory[:pse.ROM_WORDS])
+        else:
+            self.assertEqual(simulator.memory, fresh.memory)
+        self.assertEqual(simulator.pc_to_source_line_map, fresh.pc_to_source_line_map)
+
+        # 从头运行 (程序先把数据从 ROM 搬到 RAM，之前留下的 RAM 内容不影响结果)：预解码缓存和基本块必须已随改写作废
+        _restart(simulator)
+        expected = fresh.run_until(1000)
+        self.assertEqual(expected[1], 'halt') # 编辑后的程序能运行到结束，RAM/数码管区域都被重新写过
+        self.assertEqual(simulator.run_until(1000), expected)
+        self.assertEqual((simulator.registers, simulator.memory), (fresh.registers, fresh.memory))
+
+    def _loaded(self, lines):
+        assembler = IncrementalAssembler()
+        simulator = headless.new_simulator()
+        simulator.compile_threshold = 1
+        assembler.load_simulator(simulator, assembler.assemble(lines))
+        return assembler, simulator
+
+    def test_single_edits(self):
+        for name, edit in EDITS.items():
+            for ran in (False, True):
+                with self.subTest(edit=name, ran=ran):
+                    assembler, simulator = self._loaded(PROGRAM)
+                    if ran:
+                        simulator.run_until(1000)
+                    self._check_patch(assembler, simulator, edit(PROGRAM), ran)
+
+    def test_moved_label_reencodes_branch(self):
+        assembler, _ = self._loaded(PROGRAM)
+        branch_pc = _full(PROGRAM)[1].pc_to_source_line_map.index(_line('ble a8, a9, no_swap') + 1)
+        result = assembler.assemble(move_label(PROGRAM))
+        self.assertIn(branch_pc, result.changed)
+        self.assertEqual(result.image, _full(move_label(PROGRAM))[0])
+
+    def test_edit_sequence(self):
+        # 编辑依次叠加，最后撤销回原程序；每一步都从上一次的结果增量汇编
+        assembler, simulator = self._loaded(PROGRAM)
+        lines = PROGRAM
+        for name in ('insert_line', 'move_label', 'change_immediate', 'insert_line', None):
+            lines = EDITS[name](lines) if name is not None else PROGRAM
+            with self.subTest(edit=name or 'revert'):
+                self._check_patch(assembler, simulator, lines, ran=True)
+
+    def test_patch_keeps_registers_and_pc(self):
+        assembler, simulator = self._loaded(PROGRAM)
+        simulator.run_until(50)
+        registers, pc, ram = list(simulator.registers), simulator.pc, simulator.memory[0x800:0x803]
+        count = assembler.patch_simulator(simulator, assembler.assemble(change_immediate(PROGRAM)))
+        self.assertEqual(count, 1)
+        self.assertEqual((list(simulator.registers), simulator.pc, simulator.memory[0x800:0x803]), (registers, pc, ram))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,64 @@
+# 基本块翻译：按基本块执行 (jit=True) 与逐条解释执行 (jit=False) 的结果必须完全相同
+# 翻译阈值设为1 (第一次执行到就翻译) 和默认值各比较一次，随机程序使用固定种子
+#
+# 用法 (在 编译程序 目录下):
+#   python -m unittest test_jit
+
+import random
+import unittest
+
+import headless
+from simulator import Simulator16Bit
+
+RANDOM_PROGRAMS = 1000
+RANDOM_STEPS = 500
+
+
+def _state(simulator, result):
+    return (result, list(simulator.registers), simulator.memory.tobytes(), simulator.pc,
+            simulator.previous_pc, simulator.halted, simulator.step_count)
+
+
+def _run_file(path, max_steps, jit, threshold=None):
+    simulator = headless.new_simulator()
+    if threshold is not None:
+        simulator.compile_threshold = threshold
+    headless.load_program(simulator, path)
+    return _state(simulator, simulator.run_until(max_steps, jit=jit))
+
+
+def _run_words(words, registers, max_steps, jit, threshold=None):
+    simulator = Simulator16Bit()
+    simulator.verbose = False
+    if threshold is not None:
+        simulator.compile_threshold = threshold
+    simulator.machine_code = list(words)
+    simulator.load_machine_code_to_memory()
+    simulator.registers[:] = registers
+    return _state(simulator, simulator.run_until(max_steps, jit=jit))
+
+
+class BlockJitTest(unittest.TestCase):
+    def test_repository_programs(self):
+        # 各种步数上限：在块中间、恰好在块尾、程序结束之后
+        for path in ('program.txt', 'program2.txt'):
+            for max_steps in (1, 7, 100, 181, 5000, 1000000):
+                expected = _run_file(path, max_steps, jit=False)
+                for threshold in (1, None):
+                    with self.subTest(path=path, max_steps=max_steps, threshold=threshold):
+                        self.assertEqual(_run_file(path, max_steps, jit=True, threshold=threshold), expected)
+
+    def test_random_programs(self):
+        # 随机机器码 (含越界访存、改写代码、跳转到自身等) 和随机寄存器初值
+        for seed in range(RANDOM_PROGRAMS):
+            rng = random.Random(seed)
+            words = [rng.randrange(1, 0x10000) for _ in range(rng.randrange(2, 40))]
+            registers = [0] + [rng.randrange(64) for _ in range(15)]
+            expected = _run_words(words, registers, RANDOM_STEPS, jit=False)
+            for threshold in (1, None):
+                with self.subTest(seed=seed, threshold=threshold):
+                    self.assertEqual(_run_words(words, registers, RANDOM_STEPS, jit=True, threshold=threshold), expected)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,115 @@
+# NumPy 同步模拟：VectorSimulator.step / run 的每个实例必须与 Simulator16Bit.run_until 单独运行的结果完全相同
+# 比较停止原因、步数、PC、寄存器和全部内存；随机程序使用固定种子，部分寄存器初值很大以覆盖越界访存
+# 未安装 numpy 时跳过
+#
+# 用法 (在 编译程序 目录下):
+#   python -m unittest test_vector_sim
+
+import random
+import unittest
+
+import headless
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+else:
+    import vector_sim as vs
+
+RANDOM_PROGRAMS = 200
+INSTANCES = 8
+MAX_STEPS = 300
+
+# 固定的边界情况：越界读写 (error) 和跳转到自身 (self_loop)，值为 run_until 的停止原因
+EDGE_PROGRAMS = {
+    'lw': (['addi a1, r0, -2', 'lw a2, 0(a1)', 'addi a3, r0, 1'], 'error'),
+    'sb': (['addi a1, r0, -1', 'sb a1, 0(a1)', 'addi a3, r0, 1'], 'error'),
+    'self_loop': (['addi a1, r0, 3', 'end:', 'jal ra, end'], 'self_loop'), # jal r0 偏移0 编码为全0字 (halt)
+    'loop_then_self_loop': (['addi a1, r0, 5', 'loop:', 'subi a1, a1, 1', 'beq a1, r0, end', 'jal r0, loop',
+                             'end:', 'beq r0, r0, end'], 'self_loop'),
+}
+
+
+def _words_loader(words):
+    def load():
+        simulator = headless.new_simulator()
+        simulator.machine_code = list(words)
+        simulator.load_machine_code_to_memory()
+        return simulator
+    return load
+
+
+def _lines_loader(lines):
+    def load():
+        simulator = headless.new_simulator()
+        headless.load_lines(simulator, lines)
+        return simulator
+    return load
+
+
+def _scalar(load, registers, max_steps):
+    simulator = load()
+    simulator.registers[:] = registers
+    steps, reason = simulator.run_until(max_steps)
+    return reason, steps, simulator.pc, simulator.previous_pc, list(simulator.registers), simulator.memory.tobytes()
+
+
+def _vector(vector, index):
+    reason = vs.STOP_REASONS[vector.stop_reason[index]] or 'max_steps' # 只调用 step() 时未停止的实例
+    return (reason, int(vector.steps[index]), int(vector.pc[index]), int(vector.previous_pc[index]),
+            [int(r) for r in vector.registers[index]], vector.memory[index].tobytes())
+
+
+def _random_registers(rng):
+    # 大多数寄存器取小值 (访问 ROM/RAM)，少数取接近 0xFFFF 的值 (字地址超出内存，越界访存)
+    return [0] + [rng.randrange(0xF000, 0x10000) if rng.random() < 0.1 else rng.randrange(64) for _ in range(15)]
+
+
+@unittest.skipIf(np is None, "需要 numpy")
+class VectorSimulatorTest(unittest.TestCase):
+    def _check(self, load, register_sets, max_steps):
+        expected = [_scalar(load, registers, max_steps) for registers in register_sets]
+
+        vector = vs.VectorSimulator(load(), len(register_sets))
+        vector.registers[:] = np.array(register_sets)
+        vector.run(max_steps)
+        for index, state in enumerate(expected):
+            with self.subTest(method='run', instance=index):
+                self.assertEqual(_vector(vector, index), state)
+
+        vector = vs.VectorSimulator(load(), len(register_sets))
+        vector.registers[:] = np.array(register_sets)
+        for _ in range(max_steps):
+            vector.step()
+        for index, state in enumerate(expected):
+            with self.subTest(method='step', instance=index):
+                self.assertEqual(_vector(vector, index), state)
+        return [state[0] for state in expected]
+
+    def test_random_programs(self):
+        reasons = set()
+        for seed in range(RANDOM_PROGRAMS):
+            rng = random.Random(seed)
+            words = [rng.randrange(1, 0x10000) for _ in range(rng.randrange(2, 40))]
+            register_sets = [_random_registers(rng) for _ in range(INSTANCES)]
+            max_steps = rng.randrange(1, MAX_STEPS)
+            with self.subTest(seed=seed):
+                reasons.update(self._check(_words_loader(words), register_sets, max_steps))
+        self.assertEqual(reasons, {'halt', 'self_loop', 'error', 'max_steps'}) # 随机程序覆盖了全部停止原因
+
+    def test_edge_programs(self):
+        for name, (lines, reason) in EDGE_PROGRAMS.items():
+            with self.subTest(program=name):
+                self.assertEqual(self._check(_lines_loader(lines), [[0] * 16], MAX_STEPS), [reason])
+
+    def test_repository_program(self):
+        with open('program2.txt', 'r', encoding='utf-8') as f:
+            load = _lines_loader(f.read().splitlines())
+        for max_steps in (1, 50, 181, 1000):
+            with self.subTest(max_steps=max_steps):
+                self._check(load, [[0] * 16], max_steps)
+
+
+if __name__ == '__main__':
+    unittest.main()
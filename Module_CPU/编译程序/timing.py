@@ -0,0 +1,106 @@
+# 时序模型：按 SingleCPU.v 的数据通路统计周期数，按开发板时钟换算为实际运行时间
+# 以及实时节拍模式 (按开发板时钟限制模拟速度，便于观察 LED/数码管的变化节奏)
+#
+# SingleCPU.v 是单周期 CPU：PC、寄存器堆、数据存储器都在同一个时钟上升沿更新，每条指令 1 个周期
+# 开发板时钟见 XDC/CPU.XDC: create_clock -period 20.000 (50 MHz)
+
+import time
+
+import pseudo as pse # 导入pseudo.py
+
+DEFAULT_CLOCK_HZ = 50_000_000
+
+SINGLE_CYCLE_CPI = {name: 1 for name in pse.opcode_map} # 各指令的周期数
+
+OPCODE_NAMES = {int(code, 2): name for name, code in pse.opcode_map.items()}
+
+
+class TimingModel:
+
+    def __init__(self, clock_hz=DEFAULT_CLOCK_HZ, cycles_per_instruction=None):
+        # cycles_per_instruction: {指令名: 周期数}，覆盖单周期的默认值 (用于评估改成多周期/流水线后的情况)
+        if clock_hz <= 0:
+            raise ValueError(f"时钟频率必须为正数: {clock_hz}")
+        self.clock_hz = clock_hz
+        self.cpi = dict(SINGLE_CYCLE_CPI)
+        if cycles_per_instruction:
+            self.cpi.update(cycles_per_instruction)
+        values = set(self.cpi.values())
+        self.uniform_cpi = values.pop() if len(values) == 1 else None # 所有指令周期数相同时，周期数 = 步数 * CPI
+        self.max_cpi = max(self.cpi.values())
+
+    def cycles(self, simulator):
+        # 模拟器自加载程序以来执行的周期数
+        if self.uniform_cpi is not None:
+            return simulator.step_count * self.uniform_cpi
+        profiler = simulator.profiler
+        if profiler is None:
+            raise ValueError("各指令周期数不同时，需要先 enable_profiler() 统计各操作码的执行次数")
+        return sum(count * self.cpi[OPCODE_NAMES[op]] for op, count in enumerate(profiler.opcode_counts) if count)
+
+    def seconds(self, cycles):
+        return cycles / self.clock_hz
+
+    def board_time(self, simulator):
+        # 程序在开发板上运行到当前状态所需的时间 (秒)
+        return self.seconds(self.cycles(simulator))
+
+    def steps_for(self, seconds):
+        # 开发板上 seconds 秒内最少执行的指令条数 (按最慢的指令计算)，可用于 run_until 的步数上限
+        return int(seconds * self.clock_hz) // self.max_cpi
+
+
+def format_duration(seconds):
+    # 按合适的单位显示时间，如 "20 ns"、"1.536 ms"、"2.000 s"
+    if seconds >= 1:
+        return f"{seconds:.3f} s"
+    if seconds >= 1e-3:
+        return f"{seconds * 1e3:.3f} ms"
+    if seconds >= 1e-6:
+        return f"{seconds * 1e6:.3f} us"
+    return f"{seconds * 1e9:.0f} ns"
+
+
+class RealTimePacer:
+    # 实时节拍：让模拟执行的速度不超过开发板时钟 (speed 为倍速，1.0 即与开发板相同)
+    # 模拟本身比开发板慢时不做限制，尽可能快地执行
+
+    def __init__(self, simulator, timing=None, speed=1.0, tick_seconds=0.01):
+        self.simulator = simulator
+        self.timing = timing if timing is not None else TimingModel()
+        self.speed = speed
+        self.tick_seconds = tick_seconds # 每次最多执行的开发板时间，也是等待时的休眠间隔
+        self.start_wall = None
+        self.start_cycles = 0
+
+    def start(self):
+        # 以当前时刻和当前周期数为起点开始计时
+        self.start_wall = time.perf_counter()
+        self.start_cycles = self.timing.cycles(self.simulator)
+
+    def budget(self):
+        # 按已经过去的真实时间，现在还允许执行的指令条数 (最多一个 tick 的量)
+        if self.start_wall is None:
+            self.start()
+        elapsed = time.perf_counter() - self.start_wall
+        target_cycles = self.start_cycles + elapsed * self.timing.clock_hz * self.speed
+        ahead = int(target_cycles) - self.timing.cycles(self.simulator)
+        tick_steps = max(1, self.timing.steps_for(self.tick_seconds * self.speed))
+        return max(0, min(ahead // self.timing.max_cpi, tick_steps))
+
+    def run(self, max_steps=None, pc_breakpoints=None):
+        # 按实时节拍连续执行，直到停止、命中断点或执行了 max_steps 条指令，返回值与 run_until 相同
+        self.start()
+        steps = 0
+        while max_steps is None or steps < max_steps:
+            budget = self.budget()
+            if budget == 0:
+                time.sleep(self.tick_seconds)
+                continue
+            if max_steps is not None:
+                budget = min(budget, max_steps - steps)
+            n, reason = self.simulator.run_until(budget, pc_breakpoints)
+            steps += n
+            if reason != 'max_steps':
+                return steps, reason
+        return steps, 'max_steps'
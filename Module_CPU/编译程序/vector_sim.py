@@ -0,0 +1,238 @@
+# NumPy 同步 (lockstep) 模拟：N 个相互独立的机器实例，寄存器、PC、内存都保存在 NumPy 数组中
+# 每一步对所有未停止的实例各执行一条指令，按操作码分组做带掩码的批量更新
+# 结果与 Simulator16Bit 逐条执行 (decode_and_execute / run_until) 完全一致，适合对输入数据做大规模扫描
+#
+# 用法 (在 编译程序 目录下，需要安装 numpy):
+#   python -m vector_sim program2.txt --permute 0x100:6 --mem 0x3000:6
+#   对 program2.txt 中 _data_lma 的6个字节的所有排列 (720 个实例) 同步运行，每个实例输出一行 JSON
+#
+# 每个实例占用 MEMORY_WORDS * 2 字节内存 (默认 32 KB)，4096 个实例约 128 MB
+
+import argparse
+import itertools
+import json
+import sys
+
+import numpy as np
+
+import pseudo as pse # 导入pseudo.py
+from simulator import Simulator16Bit
+
+# 停止原因，与 Simulator16Bit.run_until 的返回值相同；RUNNING 表示尚未停止
+RUNNING, HALT, SELF_LOOP, ERROR, MAX_STEPS = range(5)
+STOP_REASONS = (None, 'halt', 'self_loop', 'error', 'max_steps')
+
+OPCODES = {name: int(code, 2) for name, code in pse.opcode_map.items()}
+
+
+def _build_decode_tables():
+    # 对全部 65536 个指令字预先解码，得到 操作码/rd/rs1/rs2/imm 查找表，执行时按指令字直接索引
+    # 字段解码复用 Simulator16Bit.FIELD_DECODERS，保证与标量模拟器一致
+    words = np.arange(1 << 16, dtype=np.int64)
+    opcode = (words & 0xF).astype(np.int8)
+    rd = np.zeros(1 << 16, dtype=np.int64)
+    rs1 = np.zeros(1 << 16, dtype=np.int64)
+    rs2 = np.zeros(1 << 16, dtype=np.int64)
+    imm = np.zeros(1 << 16, dtype=np.int64)
+    known = np.zeros(1 << 16, dtype=bool)
+
+    for name, op in OPCODES.items():
+        decoder = Simulator16Bit.FIELD_DECODERS[pse.instruction_format[name]]
+        for w in range(op, 1 << 16, 16):
+            rd[w], rs1[w], rs2[w], imm[w] = decoder(w)
+        known[op::16] = True
+    return opcode, rd, rs1, rs2, imm, known
+
+
+_DECODE_TABLES = None
+
+
+class VectorSimulator:
+
+    def __init__(self, simulator, count):
+        # 以已加载程序的 Simulator16Bit 的当前状态为模板，复制出 count 个实例
+        global _DECODE_TABLES
+        if _DECODE_TABLES is None:
+            _DECODE_TABLES = _build_decode_tables()
+
+        self.count = count
+        self.memory = np.tile(np.frombuffer(simulator.memory.tobytes(), dtype=np.uint16), (count, 1))
+        self.registers = np.tile(np.array(simulator.registers, dtype=np.int64), (count, 1))
+        self.pc = np.full(count, simulator.pc, dtype=np.int64)
+        self.previous_pc = np.full(count, simulator.previous_pc, dtype=np.int64)
+        self.steps = np.zeros(count, dtype=np.int64)         # 每个实例已执行的指令条数 (停止时即为停止步数)
+        self.stop_reason = np.full(count, HALT if simulator.halted else RUNNING, dtype=np.int8)
+
+    def write_bytes(self, byte_addr, data):
+        # 按字节写入各实例的内存 (输入数据)，字节序与 sb 指令相同
+        # data 形状为 (字节数,) 时写入所有实例，为 (实例数, 字节数) 时每个实例写入各自的一行
+        data = np.asarray(data, dtype=np.uint16) & 0xFF
+        if data.ndim == 1:
+            data = np.broadcast_to(data, (self.count, data.shape[0]))
+        for offset in range(data.shape[1]):
+            addr = byte_addr + offset
+            column = self.memory[:, addr >> 1]
+            if addr & 1:
+                self.memory[:, addr >> 1] = (column & 0xFF00) | data[:, offset]
+            else:
+                self.memory[:, addr >> 1] = (data[:, offset] << 8) | (column & 0x00FF)
+
+    def read_bytes(self, byte_addr, length):
+        # 读取各实例的内存字节，返回形状为 (实例数, length) 的数组
+        addrs = np.arange(byte_addr, byte_addr + length)
+        words = self.memory[:, addrs >> 1].astype(np.int64)
+        return np.where(addrs & 1, words & 0xFF, words >> 8)
+
+    def step(self):
+        # 所有未停止的实例各执行一条指令，返回本步执行的实例数
+        rows = np.flatnonzero(self.stop_reason == RUNNING)
+        if rows.size == 0:
+            return 0
+
+        memory = self.memory
+        regs = self.registers
+        nwords = memory.shape[1]
+
+        # PC越界或遇到全0指令时停止 (程序结束)
+        pc = self.pc[rows]
+        in_range = pc < nwords
+        word = np.zeros(rows.size, dtype=np.int64)
+        word[in_range] = memory[rows[in_range], pc[in_range]]
+        ended = word == 0
+        self.stop_reason[rows[ended]] = HALT
+
+        opcode_table, rd_table, rs1_table, rs2_table, imm_table, known_table = _DECODE_TABLES
+        unknown = ~ended & ~known_table[word]
+        self.stop_reason[rows[unknown]] = ERROR # 非法指令，不计入执行步数
+
+        live = ~(ended | unknown)
+        rows, pc, word = rows[live], pc[live], word[live]
+        if rows.size == 0:
+            return 0
+
+        opcode = opcode_table[word]
+        rd, rs1, rs2, imm = rd_table[word], rs1_table[word], rs2_table[word], imm_table[word]
+        v1 = regs[rows, rs1]
+        v2 = regs[rows, rs2]
+        next_pc = pc + 1
+        write_reg = np.zeros(rows.size, dtype=bool)
+        result = np.zeros(rows.size, dtype=np.int64)
+
+        def select(name):
+            return opcode == OPCODES[name]
+
+        m = select('add'); result[m] = (v1[m] + v2[m]) & 0xFFFF; write_reg |= m
+        m = select('sub'); result[m] = (v1[m] - v2[m]) & 0xFFFF; write_reg |= m
+        m = select('and'); result[m] = v1[m] & v2[m]; write_reg |= m
+        m = select('or'); result[m] = v1[m] | v2[m]; write_reg |= m
+        m = select('addi'); result[m] = (v1[m] + imm[m]) & 0xFFFF; write_reg |= m
+        m = select('subi'); result[m] = (v1[m] - imm[m]) & 0xFFFF; write_reg |= m
+        m = select('lui'); result[m] = imm[m]; write_reg |= m
+
+        # 访存：地址越界时停止 (error)，该条指令计入步数但不写寄存器/内存，PC 不变
+        mem_ops = select('lw') | select('lb') | select('sw') | select('sb')
+        addr = (v1 + imm) & 0xFFFF
+        word_addr = addr >> 1
+        failed = mem_ops & (word_addr >= nwords)
+        ok = mem_ops & ~failed
+        data = np.zeros(rows.size, dtype=np.int64)
+        data[ok] = memory[rows[ok], word_addr[ok]]
+
+        m = select('lw') & ok; result[m] = data[m]; write_reg |= m
+        m = select('lb') & ok
+        byte_val = np.where(addr & 1, data & 0xFF, data >> 8)
+        result[m] = np.where(byte_val[m] & 0x80, (byte_val[m] - 256) & 0xFFFF, byte_val[m]) # 符号扩展
+        write_reg |= m
+
+        m = select('sw') & ok
+        memory[rows[m], word_addr[m]] = v2[m]
+        m = select('sb') & ok
+        low = v2 & 0xFF
+        memory[rows[m], word_addr[m]] = np.where(addr[m] & 1, (data[m] & 0xFF00) | low[m], (low[m] << 8) | (data[m] & 0x00FF))
+
+        # 跳转/分支：目标为 当前PC + 偏移 (与 Simulator16Bit._exec_* 一致)
+        m = select('beq') & (v1 == v2); next_pc[m] = (pc[m] + imm[m]) & 0xFFFF
+        m = select('ble') & (v1 <= v2); next_pc[m] = (pc[m] + imm[m]) & 0xFFFF
+        m = select('jal'); next_pc[m] = (pc[m] + imm[m]) & 0xFFFF
+        result[m] = (pc[m] + 1) & 0xFFFF; write_reg |= m
+        jalr = select('jalr'); next_pc[jalr] = (v1[jalr] + imm[jalr]) & 0xFFFF
+        result[jalr] = (pc[jalr] + 1) & 0xFFFF; write_reg |= jalr
+
+        regs[rows[write_reg], rd[write_reg]] = result[write_reg]
+        regs[:, 0] = 0 # 确保r0始终为0
+
+        self.previous_pc[rows] = pc
+        self.steps[rows] += 1
+        self.stop_reason[rows[failed]] = ERROR
+        moved = ~failed
+        self.pc[rows[moved]] = next_pc[moved]
+        self.stop_reason[rows[moved & (next_pc == pc) & ~jalr]] = SELF_LOOP # 跳转到自身，状态不再改变
+        return rows.size
+
+    def run(self, max_steps=100000):
+        # 同步执行，直到所有实例停止或达到步数上限 (每个实例最多执行 max_steps 条)，返回执行的步数
+        for n in range(max_steps):
+            if self.step() == 0:
+                return n
+        self.stop_reason[self.stop_reason == RUNNING] = MAX_STEPS
+        return max_steps
+
+    def stop_reasons(self):
+        return [STOP_REASONS[r] for r in self.stop_reason]
+
+    def instance_result(self, index, mem_ranges=()):
+        # 单个实例的结果，格式与 headless.run_file 相同
+        return {
+            'instance': index,
+            'steps': int(self.steps[index]),
+            'stop_reason': STOP_REASONS[self.stop_reason[index]],
+            'pc': int(self.pc[index]),
+            'registers': {pse.reg_num_to_name[i]: int(self.registers[index, i]) for i in range(16)},
+            'memory': {
+                f"0x{start:04X}": [int(b) for b in self.read_bytes(start, length)[index]]
+                for start, length in mem_ranges
+            },
+        }
+
+
+def sweep(simulator, byte_addr, datasets, max_steps=100000):
+    # 对每组输入数据各运行一个实例：datasets 的每一行写入 byte_addr 开始的内存
+    datasets = np.asarray(datasets)
+    vector = VectorSimulator(simulator, len(datasets))
+    vector.write_bytes(byte_addr, datasets)
+    vector.run(max_steps)
+    return vector
+
+
+def main(argv=None):
+    import headless
+
+    parser = argparse.ArgumentParser(description="对同一程序的多组输入数据同步运行 (NumPy)，每个实例输出一行 JSON")
+    parser.add_argument('file', help="汇编源文件或机器码文件")
+    parser.add_argument('--permute', type=headless.parse_mem_range, required=True, metavar='START:LEN',
+                        help="对该内存区间内字节的所有排列各运行一个实例")
+    parser.add_argument('--max-steps', type=int, default=100000, help="每个实例最多执行的指令条数")
+    parser.add_argument('--mem', type=headless.parse_mem_range, action='append', default=[],
+                        metavar='START:LEN', help="要输出的内存区间，可重复指定")
+    args = parser.parse_args(argv)
+
+    simulator = headless.new_simulator()
+    success, _, message = headless.load_program(simulator, args.file)
+    if not success:
+        print(message, file=sys.stderr)
+        return 1
+
+    start, length = args.permute
+    original = [simulator.read_byte(addr) for addr in range(start, start + length)]
+    datasets = list(itertools.permutations(original))
+    vector = sweep(simulator, start, datasets, args.max_steps)
+
+    for i, data in enumerate(datasets):
+        result = vector.instance_result(i, args.mem)
+        result['input'] = list(data)
+        sys.stdout.write(json.dumps(result, ensure_ascii=False) + '\n')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
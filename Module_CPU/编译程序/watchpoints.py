@@ -0,0 +1,115 @@
+# 内存监视点：对字节/字地址或地址区间的读、写、值改变进行监视
+#
+# Simulator16Bit.watch_flags 为每个内存字一个标志字节，被任一监视点覆盖的字置1；
+# lw/lb/sw/sb 的执行路径每次访存只多检查一次该标志，没有监视点的地址不受影响。
+# 命中时由 check_access() 记录命中信息并抛出 WatchpointHit，执行循环在该指令执行完之后停下，
+# run_until 返回停止原因 'watchpoint'，命中信息保存在 simulator.watch_hit
+
+READ, WRITE, CHANGE = 'read', 'write', 'change'
+
+
+class WatchpointHit(Exception):
+    # 访存命中监视点：指令已执行完 (读/写已生效)，由执行循环捕获后停下
+    pass
+
+
+class Watchpoint:
+    __slots__ = ('start', 'length', 'read', 'write', 'change', 'hits')
+
+    def __init__(self, start, length=1, read=False, write=True, change=False):
+        self.start = start      # 起始字节地址
+        self.length = length    # 字节数 (字为2)
+        self.read = read        # 读取时命中 (lw/lb)
+        self.write = write      # 写入时命中 (sw/sb)，不论值是否改变
+        self.change = change    # 写入且值发生改变时命中
+        self.hits = 0
+
+    def overlaps(self, first, last):
+        # 与字节区间 [first, last] 是否相交
+        return first < self.start + self.length and self.start <= last
+
+    def kinds(self):
+        return '/'.join(name for name, on in ((READ, self.read), (WRITE, self.write), (CHANGE, self.change)) if on)
+
+    def __repr__(self):
+        return f"Watchpoint(0x{self.start:04X}, {self.length}, {self.kinds()})"
+
+
+class WatchHit:
+    __slots__ = ('watchpoint', 'kind', 'byte_addr', 'old', 'new', 'pc')
+
+    def __init__(self, watchpoint, kind, byte_addr, old, new, pc):
+        self.watchpoint = watchpoint
+        self.kind = kind            # READ / WRITE / CHANGE
+        self.byte_addr = byte_addr  # 访存的字节地址
+        self.old = old              # 访存前的值 (字节或字)
+        self.new = new              # 访存后的值 (读取时与 old 相同)
+        self.pc = pc                # 访存指令的PC
+
+    def to_dict(self):
+        return {
+            'start': self.watchpoint.start, 'length': self.watchpoint.length, 'kind': self.kind,
+            'byte_addr': self.byte_addr, 'old': self.old, 'new': self.new, 'pc': self.pc,
+        }
+
+    def describe(self):
+        action = {READ: '读取', WRITE: '写入', CHANGE: '改变'}[self.kind]
+        text = f"监视点 0x{self.watchpoint.start:04X} (+{self.watchpoint.length}) 被{action}: PC={self.pc}, 地址 0x{self.byte_addr:04X}"
+        if self.kind == READ:
+            return text + f", 值 {self.old}"
+        return text + f", {self.old} -> {self.new}"
+
+
+def rebuild_flags(simulator):
+    # 按当前的监视点重新设置 simulator.watch_flags
+    flags = simulator.watch_flags
+    flags[:] = bytes(len(flags))
+    for wp in simulator.watchpoints:
+        for word_addr in range(wp.start >> 1, min((wp.start + wp.length - 1) >> 1, len(flags) - 1) + 1):
+            flags[word_addr] = 1
+
+
+def _byte_of(word, byte_addr):
+    # 字中某个字节地址的值：偶地址为高8位，奇地址为低8位
+    return word & 0xFF if byte_addr & 1 else word >> 8
+
+
+def check_access(simulator, byte_addr, width, is_write, old_word, new_word):
+    # 在 watch_flags 置位的字上访存之后调用：找出命中的监视点，记录并抛出 WatchpointHit
+    # width 为访问的字节数 (lb/sb 为1，lw/sw 为2)；old_word/new_word 为访存前后该字的值
+    if width == 2:
+        first, last = byte_addr & ~1, byte_addr | 1
+        old, new = old_word, new_word
+    else:
+        first = last = byte_addr
+        old, new = _byte_of(old_word, byte_addr), _byte_of(new_word, byte_addr)
+
+    for wp in simulator.watchpoints:
+        if not wp.overlaps(first, last):
+            continue
+        if is_write:
+            if wp.write:
+                kind = WRITE
+            elif wp.change and any(_byte_of(old_word, b) != _byte_of(new_word, b)
+                                   for b in range(max(first, wp.start), min(last, wp.start + wp.length - 1) + 1)):
+                kind = CHANGE # 只比较监视范围内的字节
+            else:
+                continue
+        elif wp.read:
+            kind = READ
+        else:
+            continue
+        wp.hits += 1
+        simulator.watch_hit = WatchHit(wp, kind, byte_addr, old, new, simulator.pc)
+        raise WatchpointHit()
+
+
+def parse_watch_spec(text):
+    # 解析命令行的监视点 "类型:起始地址[:字节数]"，类型为 r/w/c 的组合，如 "w:0x1000:6"、"rc:0x3000"
+    kinds, _, rest = text.partition(':')
+    start_str, _, length_str = rest.partition(':')
+    if not kinds or not set(kinds) <= set('rwc') or not start_str:
+        raise ValueError(f"无效的监视点: '{text}' (格式为 类型:起始地址[:字节数]，类型为 r/w/c)")
+    start = int(start_str, 0)
+    length = int(length_str, 0) if length_str else 1
+    return Watchpoint(start, length, read='r' in kinds, write='w' in kinds, change='c' in kinds)
@@ -1,502 +1,14 @@
 import tkinter as tk
-from tkinter import filedialog, scrolledtext, ttk
+from tkinter import filedialog, scrolledtext, simpledialog, ttk
 import re
-import time
 import pseudo as pse # 导入pseudo.py
+from simulator import Simulator16Bit
+import bus
+import timing
+import breakpoints as brk
+from incremental import IncrementalAssembler
 
-def resolve_labels(expanded_lines, label_map):
-    resolved = []
-    for idx, line in enumerate(expanded_lines):
-        processed_line_for_tokens = line.replace(',', '').replace('(', ' ').replace(')', '')
-        tokens = processed_line_for_tokens.split()
-
-        if not tokens:
-            continue
-        instr = tokens[0]
-
-        # 只关心跳转和分支指令中的标签解析
-        if instr in ['ble', 'beq', 'jal']:
-            if len(tokens) < 2: # 至少需要指令和1个参数
-                resolved.append(line)
-                continue
-
-            last_arg = tokens[-1]
-
-            try:
-                # 如果最后一个参数已经是数字，则不是标签，直接使用
-                int(last_arg, 0)
-                resolved.append(line)
-
-            except ValueError:
-                # 最后一个参数不是数字，是需要解析的标签
-                label_name = last_arg
-                if label_name not in label_map:
-                    raise KeyError(f"错误: 未定义的标签 '{label_name}' 在指令中被使用: '{line}' (在扩展后指令列表的索引 {idx})")
-
-                # 使用标签映射中正确的PC地址，不再加1
-                target_pc_index = label_map[label_name]
-
-                current_pc_index = idx
-                offset = target_pc_index - current_pc_index - 1
-
-                temp_tokens = tokens[:-1] + [str(offset)]
-                resolved.append(' '.join(temp_tokens))
-
-        # 伪指令`la` 展开成的 `lui` 指令也需要解析标签
-        elif instr == 'lui':
-            if len(tokens) < 3:
-                raise ValueError(f"格式错误的 LUI 指令: '{line}' at expanded index {idx}")
-
-            immediate_or_label_arg = tokens[2]
-            if immediate_or_label_arg in label_map:
-                label_value = label_map[immediate_or_label_arg]
-                temp_tokens = list(tokens)
-                temp_tokens[2] = f'0x{label_value:X}' # 替换为十六进制地址
-                resolved.append(' '.join(temp_tokens))
-
-            else:
-                resolved.append(line) # 如果不是标签，直接通过
-
-        else:
-            # 其他所有指令直接通过
-            resolved.append(line)
-
-    return resolved
-
-
-class Simulator16Bit:
-    def __init__(self):
-        self.registers = [0] * 16  # r0 到 r15
-        self.memory = ["0000_0000_0000_0000"] * 16384 # 内存大小,16384,即 0x4000
-        self.pc = 0
-        self.previous_pc = 0
-        self.halted = False
-        self.machine_code = [] # 在加载到内存之前存储汇编代码
-        self.label_map = {}
-        self.pc_to_source_line_map = [] # 存储PC到源码行的映射
-
-        self.OPCODE_MAP = pse.opcode_map
-        self.REGISTER_ALIAS = pse.register_alias
-
-        # 将 r0 初始化为 0
-        self.registers[register_alias['r0']] = 0
-
-    def reset(self):
-        self.registers = [0] * 16
-        self.pc = 0
-        self.previous_pc = 0
-        self.halted = False
-        # 可以从 self.machine_code 清除或重新加载 self.memory
-        self.load_machine_code_to_memory() # 重新加载机器代码
-        print("Simulator Reset.")
-        self.print_regs()
-
-    def get_reg_value(self, reg_idx):
-        if not (0 <= reg_idx <= 15):
-            raise ValueError(f"Invalid register index: {reg_idx}")
-
-        if reg_idx == register_alias['r0']: # 确保 r0 为 0
-            return 0
-
-        return self.registers[reg_idx]
-
-    def set_reg_value(self, reg_idx, value):
-        if not (0 <= reg_idx <= 15):
-            raise ValueError(f"Invalid register index: {reg_idx}")
-
-        if reg_idx != register_alias['r0']: # r0 恒 0
-            # 值为 16 位，必要时模拟溢出
-            self.registers[reg_idx] = value & 0xFFFF # 确保 16 位
-
-        else:
-            self.registers[reg_idx] = 0 # r0 恒 0
-
-    def load_program_from_source(self, expanded_instr, label_map, data_lma_values, source_lines_for_expanded):
-        # 将汇编代码转换为机器码，并将其存储在内部
-        self.pc_to_source_line_map = [] # 重置映射
-        self.machine_code = []      # 重置机器码存储
-
-        try:
-            # 1. 解析标签 (使用 resolve_labels)
-            resolved_instr_for_sim = resolve_labels(expanded_instr, label_map)
-
-            self.pc_to_source_line_map = source_lines_for_expanded
-
-            # 2. 组装 (使用 pseudo.py 的 assemble_line)
-            raw_machine_code_for_sim = []
-
-            for line_content in resolved_instr_for_sim:
-
-                if line_content.strip():
-                    bin_code = pse.assemble_line(line_content.strip())
-                    raw_machine_code_for_sim.append(bin_code)
-
-            # 3. 准备并加载到模拟器内存
-            rom_output_lines = []
-            for i, code in enumerate(raw_machine_code_for_sim):
-
-                if i < 128: # 假设ROM大小为256
-                    rom_output_lines.append('_'.join([code[j:j+4] for j in range(0, 16, 4)]))
-
-            while len(rom_output_lines) < 128:
-                rom_output_lines.append("0000_0000_0000_0000")
-
-            if len(raw_machine_code_for_sim) > 128:
-                print(f"警告: ... ROM区限制为128行...")
-
-            data_output_lines = []
-            k = 0
-            while k < len(data_lma_values):
-                byte1_val = data_lma_values[k]; byte1_bin = format(byte1_val, '08b')
-                byte1_formatted = f"{byte1_bin[0:4]}_{byte1_bin[4:8]}"
-
-                if k + 1 < len(data_lma_values):
-                    byte2_val = data_lma_values[k+1]; byte2_bin = format(byte2_val, '08b')
-                    byte2_formatted = f"{byte2_bin[0:4]}_{byte2_bin[4:8]}"
-
-                else:
-                    byte2_formatted = "0000_0000"
-                data_output_lines.append(f"{byte1_formatted}_{byte2_formatted}")
-                k += 2
-
-            # self.machine_code 存储的是模拟器将要使用的、格式化后的机器码
-            self.machine_code = rom_output_lines + data_output_lines
-            self.load_machine_code_to_memory()
-
-            self.pc = 0
-            self.halted = False
-            return True, "汇编成功 (模拟器已加载代码)."
-
-        except Exception as e:
-            self.machine_code = []
-            self.pc_to_source_line_map = []
-            import traceback; traceback.print_exc()
-            return False, f"加载到模拟器时出错: {e}"
-
-    def load_machine_code_to_memory(self):
-        self.memory = ["0000_0000_0000_0000"] * len(self.memory) # 先清除内存
-        # 将汇编程序加载到内存中
-        for i, formatted_code_word in enumerate(self.machine_code):
-            if i < len(self.memory): # 防止超出预设的 self.memory 大小
-                # 移除下划线，得到纯二进制字符串
-                raw_binary_word = formatted_code_word.replace('_', '')
-
-                if len(raw_binary_word) == 16 and all(c in '01' for c in raw_binary_word):
-                    self.memory[i] = raw_binary_word
-
-                else:
-                    print(f"警告: 机器码 \"{formatted_code_word}\" 格式不正确，跳过加载到内存地址 {i}")
-                    self.memory[i] = "0000000000000000" # 或者其他错误标记
-
-            else:
-                print(f"警告: 机器码数量 ({len(self.machine_code)}) 超出内存容量 ({len(self.memory)})。部分代码未加载。")
-                break
-        # print(f"Loaded to memory: {self.memory[:5]}")
-
-        # 如果 self.machine_code 比 self.memory 短，内存中剩余部分将保持其旧值或初始值
-        # 如果需要用0填充剩余内存
-        for i in range(len(self.machine_code), len(self.memory)):
-            self.memory[i] = "0000000000000000"
-
-
-    def fetch(self):
-        if not (0 <= self.pc < len(self.memory)):
-            print(f"PC out of bounds: {self.pc}")
-            self.halted = True
-            return None
-        instruction_word = self.memory[self.pc]
-
-        # print(f"Fetched PC={self.pc}: {instruction_word}")
-        return instruction_word # 形式:"XXXXXXXXXXXXXXXX"
-
-    def decode_and_execute(self, instruction_word):
-    # 解码并执行单条16位指令字 (字符串格式 "XXXXXXXXXXXXXXXX")。
-
-        if instruction_word is None or len(instruction_word) != 16 or \
-        not all(c in '01' for c in instruction_word):
-            self.halted = True
-            print(f"错误: 无效的指令字 '{instruction_word}' 在 PC={self.pc}")
-            return
-
-        # 默认情况下，PC指向下一条指令
-        next_pc = self.pc + 1
-
-        try:
-            # 字段解析顺序与 assemble_line 的拼接顺序相反
-            # instr[0:...] 是高位, instr[...:16] 是低位
-            # Opcode 总是最后4位 (bits 3-0)
-            opcode = instruction_word[12:16]
-
-            #  R-type: add, sub, and, or
-            # 格式: rs2(4) + rs1(4) + rd(4) + opcode(4)
-            if opcode in [self.OPCODE_MAP['add'], self.OPCODE_MAP['sub'], self.OPCODE_MAP['and'], self.OPCODE_MAP['or']]:
-                rs2_bin = instruction_word[0:4]
-                rs1_bin = instruction_word[4:8]
-                rd_bin  = instruction_word[8:12]
-                rd = int(rd_bin, 2)
-                rs1_val = self.get_reg_value(int(rs1_bin, 2))
-                rs2_val = self.get_reg_value(int(rs2_bin, 2))
-
-                result = 0
-                if opcode == self.OPCODE_MAP['add']: result = rs1_val + rs2_val
-                elif opcode == self.OPCODE_MAP['sub']: result = rs1_val - rs2_val
-                elif opcode == self.OPCODE_MAP['and']: result = rs1_val & rs2_val
-                elif opcode == self.OPCODE_MAP['or']:  result = rs1_val | rs2_val
-                self.set_reg_value(rd, result)
-
-            #  I-type (算术): addi, subi
-            # 格式: imm(4) + rs1(4) + rd(4) + opcode(4)
-            elif opcode in [self.OPCODE_MAP['addi'], self.OPCODE_MAP['subi']]:
-                imm_bin = instruction_word[0:4]
-                rs1_bin = instruction_word[4:8]
-                rd_bin  = instruction_word[8:12]
-                rd = int(rd_bin, 2)
-                rs1_val = self.get_reg_value(int(rs1_bin, 2))
-                imm_val = self.signed_int(imm_bin, 4) # 4位有符号立即数
-
-                result = 0
-                if opcode == self.OPCODE_MAP['addi']: result = rs1_val + imm_val
-                elif opcode == self.OPCODE_MAP['subi']: result = rs1_val - imm_val
-                self.set_reg_value(rd, result)
-
-            #  I-type (加载): lw, lb
-            # 格式: imm(4) + rs1(4) + rd(4) + opcode(4)
-            elif opcode in [self.OPCODE_MAP['lb'], self.OPCODE_MAP['lw']]:
-                imm_bin = instruction_word[0:4]
-                rs1_bin = instruction_word[4:8]
-                rd_bin  = instruction_word[8:12]
-                rd = int(rd_bin, 2)
-                base_addr = self.get_reg_value(int(rs1_bin, 2))
-                offset = self.signed_int(imm_bin, 4)
-                mem_addr = (base_addr + offset) & 0xFFFF
-
-                # # 调试
-                # print("\n--- DEBUG: 执行加载指令 ---")
-                # print(f"  指令类型: {'LB' if opcode == self.OPCODE_MAP['lb'] else 'LW'}")
-                # print(f"  目标寄存器(rd): r{rd}")
-                # print(f"  基址寄存器(rs1)值: {base_addr} (0x{base_addr:04X})")
-                # print(f"  偏移量(imm): {offset}")
-                # print(f"  计算出的源内存地址: 0x{mem_addr:04X}")
-
-                word_addr = mem_addr // 2
-
-                if not (0 <= word_addr < len(self.memory)):
-                    print(f"  错误: 源地址 0x{word_addr:04X} 超出内存范围！")
-                    self.halted = True; return
-
-                word_data_str = self.memory[word_addr]
-                # print(f"  从内存字地址 0x{word_addr:04X} 读取到内容: '{word_data_str}'")
-
-                if opcode == self.OPCODE_MAP['lw']:
-                    loaded_val = int(word_data_str, 2)
-                    print(f"  LW: 准备将值 {loaded_val} (0x{loaded_val:04X}) 存入 r{rd}")
-                    self.set_reg_value(rd, loaded_val)
-
-                elif opcode == self.OPCODE_MAP['lb']:
-                    byte_offset_in_word = mem_addr % 2
-                    byte_str = word_data_str[0:8] if byte_offset_in_word == 0 else word_data_str[8:16]
-                    loaded_byte_signed = self.signed_int(byte_str, 8)
-                    # print(f"  LB: 从字中提取的字节为 '{byte_str}', 符号扩展后值为 {loaded_byte_signed}")
-                    # print(f"  LB: 准备将值 {loaded_byte_signed} (0x{loaded_byte_signed & 0xFFFF:04X}) 存入 r{rd}")
-                    self.set_reg_value(rd, loaded_byte_signed)
-
-                # print(f"  加载后, r{rd} 的值是: {self.get_reg_value(rd)}")
-                # print("--- DEBUG: 加载指令执行完毕 ---\n")
-
-            # S-type 指令 (存储): sb, sw
-            elif opcode in [self.OPCODE_MAP['sb'], self.OPCODE_MAP['sw']]:
-                rt_bin  = instruction_word[0:4] # 源寄存器 (rs2)
-                rs1_bin = instruction_word[4:8] # 基址寄存器
-                imm_bin = instruction_word[8:12] # 偏移量
-
-                rt_val = self.get_reg_value(int(rt_bin, 2))
-                base_addr = self.get_reg_value(int(rs1_bin, 2))
-                offset = self.signed_int(imm_bin, 4)
-                mem_addr = (base_addr + offset) & 0xFFFF
-
-                # # 调试
-                # print("\n--- DEBUG: 执行存储指令 ---")
-                # print(f"  指令类型: {'SB' if opcode == self.OPCODE_MAP['sb'] else 'SW'}")
-                # print(f"  源寄存器(rt) r{int(rt_bin,2)} 的值: {rt_val} (0x{rt_val:04X})")
-                # print(f"  基址寄存器(rs1) r{int(rs1_bin,2)} 的值: {base_addr} (0x{base_addr:04X})")
-                # print(f"  偏移量(imm): {offset}")
-                # print(f"  计算出的目标内存地址: 0x{mem_addr:04X}")
-
-                word_addr = mem_addr // 2
-
-                if not (0 <= word_addr < len(self.memory)):
-                    print(f"  错误: 目标地址 0x{word_addr:04X} 超出内存范围！")
-                    self.halted = True; return
-
-                current_word_str = self.memory[word_addr]
-                # print(f"  写入前，内存字地址 0x{word_addr:04X} 的内容: '{current_word_str}'")
-
-                if opcode == self.OPCODE_MAP['sw']:
-                    word_to_store_str = format(rt_val & 0xFFFF, '016b')
-                    self.memory[word_addr] = word_to_store_str
-
-                elif opcode == self.OPCODE_MAP['sb']:
-                    byte_offset_in_word = mem_addr % 2
-                    byte_to_store_str = format(rt_val & 0xFF, '08b')
-                    new_word_str = byte_to_store_str + current_word_str[8:16] if byte_offset_in_word == 0 else current_word_str[0:8] + byte_to_store_str
-                    self.memory[word_addr] = new_word_str
-
-                # print(f"  写入后，内存字地址 0x{word_addr:04X} 的内容: '{self.memory[word_addr]}'")
-                # print("--- DEBUG: 存储指令执行完毕 ---\n")
-
-            #  SB-type (分支): beq, ble
-            # 格式: rs2(4) + rs1(4) + imm(4) + opcode(4)
-            elif opcode in [self.OPCODE_MAP['beq'], self.OPCODE_MAP['ble']]:
-                rs2_bin = instruction_word[0:4]
-                rs1_bin = instruction_word[4:8]
-                imm_bin = instruction_word[8:12]
-                rs1_val = self.get_reg_value(int(rs1_bin, 2))
-                rs2_val = self.get_reg_value(int(rs2_bin, 2))
-                offset = self.signed_int(imm_bin, 4) # 4位有符号指令偏移
-
-                branch_taken = False
-
-                if opcode == self.OPCODE_MAP['beq'] and rs1_val == rs2_val: branch_taken = True
-                elif opcode == self.OPCODE_MAP['ble'] and rs1_val <= rs2_val: branch_taken = True
-
-                if branch_taken:
-                    next_pc = (self.pc + 1 + offset) & 0xFFFF
-
-            #  U-type: lui
-            # 格式: imm(8) + rd(4) + opcode(4)
-            elif opcode == self.OPCODE_MAP['lui']:
-                imm_bin = instruction_word[0:8]
-                rd_bin  = instruction_word[8:12]
-                rd = int(rd_bin, 2)
-                imm_val = int(imm_bin, 2) # 无符号立即数
-                self.set_reg_value(rd, imm_val << 8)
-
-            #  UJ-type: jal
-            # 格式: imm(8) + rd(4) + opcode(4)
-            elif opcode == self.OPCODE_MAP['jal']:
-                imm_bin = instruction_word[0:8]
-                rd_bin  = instruction_word[8:12]
-                rd = int(rd_bin, 2)
-                offset = self.signed_int(imm_bin, 8)
-
-                if rd != 0:
-                    self.set_reg_value(rd, (self.pc + 1) & 0xFFFF)
-
-                # `resolve_labels` 中计算偏移的逻辑是 offset = target_pc - current_pc - 1
-                # （其中 target_pc 被特殊处理为 label_map[label_name] + 1）
-                # 模拟器中执行时，只需应用该偏移： next_pc = current_pc + 1 + offset
-                next_pc = (self.pc + 1 + offset) & 0xFFFF
-
-            #  I-type: jalr
-            # 格式: imm(4) + rs1(4) + rd(4) + opcode(4)
-            elif opcode == self.OPCODE_MAP['jalr']:
-                imm_bin = instruction_word[0:4]
-                rs1_bin = instruction_word[4:8]
-                rd_bin  = instruction_word[8:12]
-                rd = int(rd_bin, 2)
-                rs1_val = self.get_reg_value(int(rs1_bin, 2))
-                offset = self.signed_int(imm_bin, 4)
-
-                if rd != 0:
-                    self.set_reg_value(rd, (self.pc + 1) & 0xFFFF)
-
-                next_pc = (rs1_val + offset) & 0xFFFF
-
-            else:
-                print(f"错误: 未知或未实现的操作码 '{opcode}' 在 PC={self.pc:04X}, 指令={instruction_word}")
-                self.halted = True
-                return
-
-            self.pc = next_pc # 更新PC
-
-        except Exception as e:
-            print(f"执行错误: PC={self.pc:04X}, 指令={instruction_word}, 错误={e}")
-            import traceback
-            traceback.print_exc()
-            self.halted = True
-
-        # 确保r0始终为0
-        self.set_reg_value(0, 0) # 调用set_reg_value，它内部有对r0的保护逻辑
-
-
-    def signed_int(self, binary_string, bits):
-        # 二进制补码转换为有符号整数
-        val = int(binary_string, 2)
-
-        if (val & (1 << (bits - 1))) != 0: # 若设置了符号位
-            val = val - (1 << bits)        # 计算负值
-        return val
-
-    def step(self):
-        # 执行单步操作
-        # 如果成功执行一条指令，则返回 True;如果模拟器已停止或无法执行，则返回 False
-
-        # 1. 执行前检查状态
-        if self.halted:
-            print("模拟器已停止，无法单步执行。")
-            return False
-
-        # 检查PC是否越界或指向了全0的无效指令区域
-        # (假设程序结束或无效区域用全0指令表示)
-        if not (0 <= self.pc < len(self.memory) and self.memory[self.pc] != "0000000000000000"):
-            self.halted = True
-            print(f"模拟器在 PC={self.pc} 处停止 (PC越界或遇到无效指令).")
-            return False
-        self.previous_pc = self.pc
-        # 2. 获取并执行指令
-        instruction = self.fetch()
-
-        if instruction:
-            # decode_and_execute 会在内部处理执行，并可能在出错时设置 self.halted = True
-            self.decode_and_execute(instruction)
-
-            # 3. 返回正确的状态
-            # 只要 fetch 成功，就认为这一步是“尝试过”的
-            # simulator 是否继续，取决于执行后 self.halted 的状态
-            # step() 的返回值表明“本次step是否成功启动”
-            # decode_and_execute 出错会设置 halted，但本次 step 本身是成功发起的
-            # 为了让主循环的逻辑更清晰，这里直接检查 halted 状态
-            if self.halted:
-                return False # 如果 decode_and_execute 内部导致了停止，则返回 False
-
-            else:
-                return True # 否则，成功执行一步，返回 True
-        else:
-            # Fetch 失败说明着PC有问题
-            self.halted = True
-            return False
-
-    def run_program(self, max_steps=1000): # max_steps 防无限循环
-        print("Running program...")
-
-        time.sleep(0.3) # 延迟0.3s
-
-        steps = 0
-        while not self.halted and steps < max_steps:
-            if not self.step(): # 返回 False，如果步骤停止
-                break
-            steps += 1
-
-        if steps >= max_steps:
-            print(f"Halted: Reached max execution steps ({max_steps}).")
-            self.halted = True
-        self.print_regs()
-
-    def print_regs(self):
-        print("--- Registers ---")
-
-        time.sleep(0.3)  # 延迟0.3s
-
-        for i in range(0, 16, 4):
-            row = []
-            for j in range(4):
-                reg_idx = i + j
-                reg_name = pse.reg_num_to_name.get(reg_idx, f'r{reg_idx}')
-                val = self.get_reg_value(reg_idx)
-                row.append(f"{reg_name:>3}: {val:<5} (0x{val:04X})")
-            print(" | ".join(row))
-        print(f"PC: {self.pc} (0x{self.pc:04X})")
-        print("-----------------")
+BUS_FAULT_MARK = "  [警告: " # 状态栏中越界访存警告的开头，更新警告时据此去掉上一次的警告
 
 
 class App:
@@ -523,6 +35,10 @@ class App:
         self.ui_font = (self.ui_font_family, self.ui_font_size)
 
         self.simulator = Simulator16Bit()
+        self.simulator.attach_bus() # 外设总线：LED/数码管状态，以及只重绘改动过的内存行
+        self.assembler = IncrementalAssembler() # 增量汇编：只重新解析/编码改动的行 (见 incremental.py)
+        self._written_image = None # 最近一次写入 machine_code_output.txt 的映像，未改变时不重写文件
+        self._live_assemble_job = None
 
         if hasattr(pse, 'reg_num_to_name'):
             self.reg_num_to_name = pse.reg_num_to_name
@@ -532,6 +48,7 @@ class App:
         self.is_running_continuously = False # 追踪是否处于连续执行状态
         self._continuous_run_job = None      # 用于 after 方法的ID
         self.run_step_counter = 0
+        self._run_fault_start = 0            # 开始连续执行时总线的越界访存计数
 
         #  语法高亮：定义标签名称列表
         self.highlight_tags = [
@@ -543,6 +60,12 @@ class App:
 
         # 断点初始化
         self.breakpoints = set() # 存储设置了断点的源文件行号 (1-based)
+        self.breakpoint_conditions = {} # 条件断点: 源文件行号 -> breakpoints.Breakpoint (行号同时在 self.breakpoints 中)
+        self._breakpoint_pcs_cache = None # 由断点行号转换得到的断点PC集合，断点或代码变化时置 None
+        self.run_batch_steps = 2000 # 连续执行时每次 after() 回调执行的指令条数
+        self.timing = timing.TimingModel() # 按开发板时钟 (50 MHz) 换算运行时间
+        self.pacer = timing.RealTimePacer(self.simulator, self.timing)
+        self.realtime_max_batch = 200000 # 实时模式下每次回调最多执行的指令条数，避免界面卡顿
 
         main_frame = ttk.Frame(root, padding=(5, 2, 5, 5))
         main_frame.grid(row=0, column=0, sticky=(tk.W, tk.E, tk.N, tk.S))
@@ -570,6 +93,7 @@ class App:
 
         # 行号区绑定点击事件
         self.line_numbers_text.bind("<Button-1>", self.on_line_number_click)
+        self.line_numbers_text.bind("<Button-3>", self.on_line_number_right_click) # 右键设置条件断点
         # 行号区的断点标记配置一个tag
         self.line_numbers_text.tag_configure("breakpoint_set_marker", foreground="red", font=self.actual_code_font)
 
@@ -628,12 +152,39 @@ class App:
         self.run_btn = ttk.Button(controls_frame, text="执行", command=self.run_code, state=tk.DISABLED)
         self.run_btn.pack(side=tk.LEFT, padx=2)
 
+        # 后退单步 / 跳到第K步 (依赖模拟器的执行历史)
+        self.step_back_btn = ttk.Button(controls_frame, text="后退", command=self.step_back_code, state=tk.DISABLED)
+        self.step_back_btn.pack(side=tk.LEFT, padx=2)
+
+        self.goto_step_entry = ttk.Entry(controls_frame, width=7)
+        self.goto_step_entry.pack(side=tk.LEFT, padx=2)
+        self.goto_step_btn = ttk.Button(controls_frame, text="跳到第K步", command=self.go_to_step_code, state=tk.DISABLED)
+        self.goto_step_btn.pack(side=tk.LEFT, padx=2)
+
         self.stop_btn = ttk.Button(controls_frame, text="停止", command=self.stop_continuous_run, state=tk.DISABLED)
         self.stop_btn.pack(side=tk.LEFT, padx=2)
 
         self.reset_btn = ttk.Button(controls_frame, text="重置", command=self.reset_simulator, state=tk.DISABLED)
         self.reset_btn.pack(side=tk.LEFT, padx=2)
 
+        # 检查点：保存/恢复完整的机器状态 (见 checkpoint.py)
+        self.save_checkpoint_btn = ttk.Button(controls_frame, text="保存检查点", command=self.save_checkpoint, state=tk.DISABLED)
+        self.save_checkpoint_btn.pack(side=tk.LEFT, padx=2)
+        self.load_checkpoint_btn = ttk.Button(controls_frame, text="载入检查点", command=self.load_checkpoint)
+        self.load_checkpoint_btn.pack(side=tk.LEFT, padx=2)
+
+        # 实时模式：连续执行时按开发板时钟的速度运行
+        self.realtime_var = tk.BooleanVar(value=False)
+        ttk.Checkbutton(controls_frame, text="实时", variable=self.realtime_var).pack(side=tk.LEFT, padx=2)
+
+        # 边写边汇编：编辑后自动增量汇编，原地改写模拟器中变化了的指令字
+        self.live_assemble_var = tk.BooleanVar(value=False)
+        ttk.Checkbutton(controls_frame, text="边写边汇编", variable=self.live_assemble_var).pack(side=tk.LEFT, padx=2)
+
+        # 已执行的周期数和对应的开发板运行时间
+        self.board_time_label = ttk.Label(controls_frame, text="")
+        self.board_time_label.pack(side=tk.LEFT, padx=(8,2))
+
         # self.debug_btn = ttk.Button(controls_frame, text="内存调试", command=self.debug_print_memory)
         # self.debug_btn.pack(side=tk.LEFT, padx=2)
 
@@ -716,17 +267,33 @@ class App:
         self.mem_addr_entry.insert(0, "1000") # 默认显示地址 0x1000
         ttk.Button(mem_nav_frame, text="跳转", command=self.go_to_memory_address).pack(side=tk.LEFT, padx=2)
 
+        # 内存监视点：监视从上面的地址开始的若干字节，命中时暂停执行
+        ttk.Label(mem_nav_frame, text="字节数:").pack(side=tk.LEFT, padx=(8,2))
+        self.watch_length_entry = ttk.Entry(mem_nav_frame, width=4)
+        self.watch_length_entry.pack(side=tk.LEFT, padx=2)
+        self.watch_length_entry.insert(0, "2")
+        self.watch_kind_var = tk.StringVar(value="写")
+        ttk.Combobox(mem_nav_frame, textvariable=self.watch_kind_var, values=list(self.WATCH_KINDS),
+                     width=5, state='readonly').pack(side=tk.LEFT, padx=2)
+        ttk.Button(mem_nav_frame, text="监视", command=self.add_watchpoint).pack(side=tk.LEFT, padx=2)
+        ttk.Button(mem_nav_frame, text="清除监视", command=self.clear_watchpoints).pack(side=tk.LEFT, padx=2)
+
         # 内存显示文本区 (tk.Text)
         self.memory_display_text = tk.Text(self.mem_frame, wrap='none', undo=False, # undo通常对显示区不需要
                                            font=self.actual_code_font, # 使用之前定义的字体
                                            width=27) # 宽度
         self.memory_display_text.grid(row=1, column=0, sticky='nsew')
+        self.memory_display_text.tag_configure("watched_byte", background="#FFE4B5") # 被监视的字节
 
         # 内存显示区的垂直滚动条
         mem_v_scrollbar = ttk.Scrollbar(self.mem_frame, orient="vertical", command=self.memory_display_text.yview)
         mem_v_scrollbar.grid(row=1, column=1, sticky='ns')
         self.memory_display_text.config(yscrollcommand=mem_v_scrollbar.set)
 
+        # 外设显示 (LED1-4、六个数码管)，只在对应外设被写入后重绘
+        self.peripherals_label = ttk.Label(self.mem_frame, text="", relief=tk.GROOVE, anchor=tk.W, font=self.actual_code_font)
+        self.peripherals_label.grid(row=2, column=0, columnspan=2, sticky='ew', pady=(5,0))
+
         # self.mem_labels = []
         # mem_frame = ttk.Frame(right_pane)
         # mem_frame.grid(row=3, column=0, sticky=(tk.W, tk.E, tk.N, tk.S))
@@ -817,11 +384,13 @@ class App:
             if 1 <= clicked_line_num <= code_lines: # 确保行号有效
                 if clicked_line_num in self.breakpoints:
                     self.breakpoints.remove(clicked_line_num)
+                    self.breakpoint_conditions.pop(clicked_line_num, None)
                     print(f"断点已移除: 第 {clicked_line_num} 行")
 
                 else:
                     self.breakpoints.add(clicked_line_num)
                     print(f"断点已设置: 第 {clicked_line_num} 行")
+                self._breakpoint_pcs_cache = None # 断点变化，下次执行时重新转换为PC
                 self._redraw_line_numbers() # 更新行号区的显示以反映断点变化
 
             else:
@@ -837,6 +406,42 @@ class App:
             pass
         return "break" # 阻止 Text 组件的默认点击行为（例如移动光标）
 
+    def on_line_number_right_click(self, event):
+        # 为点击的行设置条件断点 (条件为空时为普通断点)，条件在这里编译一次
+        try:
+            line_start_index = self.line_numbers_text.index(f"@{event.x},{event.y} linestart")
+            clicked_line_num = int(line_start_index.split('.')[0])
+        except (ValueError, tk.TclError):
+            return "break"
+
+        code_lines = int(self.code_text.index('end-1c').split('.')[0]) if self.code_text.get("1.0", "end-1c").strip() else 0
+        if not 1 <= clicked_line_num <= code_lines:
+            return "break"
+
+        current = self.breakpoint_conditions.get(clicked_line_num)
+        condition = simpledialog.askstring(
+            "条件断点", f"第 {clicked_line_num} 行的断点条件 (留空为普通断点)\n例如: a4 == 0x1005、mem8[0x1000] > mem8[0x1001]、hits >= 100",
+            initialvalue=current.condition if current is not None else "", parent=self.root)
+        if condition is None: # 取消
+            return "break"
+
+        try:
+            breakpoint = brk.Breakpoint(condition)
+        except ValueError as e:
+            self.status_label.config(text=f"错误: {e}")
+            return "break"
+
+        self.breakpoints.add(clicked_line_num)
+        if breakpoint.condition is None:
+            self.breakpoint_conditions.pop(clicked_line_num, None)
+            self.status_label.config(text=f"断点已设置: 第 {clicked_line_num} 行")
+        else:
+            self.breakpoint_conditions[clicked_line_num] = breakpoint
+            self.status_label.config(text=f"条件断点已设置: 第 {clicked_line_num} 行 ({breakpoint.condition})")
+        self._breakpoint_pcs_cache = None
+        self._redraw_line_numbers()
+        return "break"
+
     def _redraw_line_numbers(self, event=None):
         # 更新行号区域的显示，并标记断点
 
@@ -865,8 +470,8 @@ class App:
                 apply_breakpoint_tag = False
 
                 if i in self.breakpoints:
-                    # 用 "●" 代替数字，并用空格使其右对齐，占据 max_digits 宽度
-                    line_display_content = "●".rjust(max_digits)
+                    # 用 "●" (条件断点为 "◆") 代替数字，并用空格使其右对齐，占据 max_digits 宽度
+                    line_display_content = ("◆" if i in self.breakpoint_conditions else "●").rjust(max_digits)
                     apply_breakpoint_tag = True
 
                 else:
@@ -931,6 +536,7 @@ class App:
             # 更新高亮
             if hasattr(self, '_schedule_highlighting'):
                 self._schedule_highlighting()
+            self._schedule_live_assemble()
             self.code_text.edit_modified(False) # 重置修改标志
 
     def on_text_change(self, event=None):
@@ -942,6 +548,34 @@ class App:
 
         if hasattr(self, '_schedule_highlighting'):
             self._schedule_highlighting() # 更新高亮
+        self._schedule_live_assemble()
+
+    def _schedule_live_assemble(self):
+        # 边写边汇编打开时，停止输入 300ms 后增量汇编一次
+        if not self.live_assemble_var.get():
+            return
+        if self._live_assemble_job:
+            self.root.after_cancel(self._live_assemble_job)
+        self._live_assemble_job = self.root.after(300, self.live_assemble)
+
+    def live_assemble(self):
+        # 增量汇编当前代码，只改写模拟器内存中变化了的字 (寄存器、PC 和 RAM 保持不变)，不写输出文件
+        self._live_assemble_job = None
+        if not self.live_assemble_var.get() or self.is_running_continuously:
+            return
+        try:
+            result = self.assembler.assemble(self.code_text.get('1.0', tk.END).splitlines())
+        except Exception as e:
+            self.status_label.config(text=f"边写边汇编: {e}")
+            return
+
+        count = self.assembler.patch_simulator(self.simulator, result)
+        if count is None:
+            self.status_label.config(text="边写边汇编: 请先点击“汇编”加载程序")
+            return
+        self._breakpoint_pcs_cache = None # PC与源码行的对应关系可能已改变
+        self.status_label.config(text=f"边写边汇编: 改写了 {count} 个字 (重新编码 {result.encoded} 条指令)")
+        self.update_ui_state()
 
     # def print_line_metrics_debug(self):
     #     print("\n--- 开始行度量信息调试 (当前版本代码) ---")
@@ -1058,6 +692,10 @@ class App:
             self.load_btn.config(state=tk.DISABLED)
             self.reset_btn.config(state=tk.DISABLED)
             self.stop_btn.config(state=tk.NORMAL)
+            self.step_back_btn.config(state=tk.DISABLED)
+            self.goto_step_btn.config(state=tk.DISABLED)
+            self.save_checkpoint_btn.config(state=tk.DISABLED)
+            self.load_checkpoint_btn.config(state=tk.DISABLED)
 
         else: # 已停止、暂停、或未开始
             # 检查是否有已加载的机器码并且模拟器没有因为错误而永久停止
@@ -1072,6 +710,14 @@ class App:
             self.reset_btn.config(state=tk.NORMAL)
             self.stop_btn.config(state=tk.DISABLED)
 
+            # 程序停止后仍可后退查看
+            has_history = self.simulator.history is not None and bool(self.simulator.machine_code)
+            can_step_back = has_history and self.simulator.step_count > 0
+            self.step_back_btn.config(state=tk.NORMAL if can_step_back else tk.DISABLED)
+            self.goto_step_btn.config(state=tk.NORMAL if has_history else tk.DISABLED)
+            self.save_checkpoint_btn.config(state=tk.NORMAL if self.simulator.machine_code else tk.DISABLED)
+            self.load_checkpoint_btn.config(state=tk.NORMAL)
+
 
     def assemble_code(self):
         self.status_label.config(text="正在汇编...")
@@ -1079,57 +725,30 @@ class App:
         self.update_line_numbers()
         self.apply_syntax_highlighting() # 汇编前确保高亮
 
-        # 1. 扩展伪指令 (只做一次)
+        # 1. 增量汇编：只重新解析/编码改动过的行
         asm_code = self.code_text.get('1.0', tk.END)
         asm_lines = asm_code.splitlines()
 
         try:
-            expanded_instr, label_map, data_lma_values, source_lines_for_expanded = \
-                pse.expand_pseudo_instructions(asm_lines)
-
+            result = self.assembler.assemble(asm_lines)
         except Exception as e:
-            self.status_label.config(text=f"汇编错误 (扩展阶段): {e}")
+            self.status_label.config(text=f"汇编错误: {e}")
             return
 
-        # 2. 生成用于输出文件的机器码 (使用 pseudo.py 的 +1 逻辑)
-        try:
-            resolved_for_file = pse.resolve_labels(expanded_instr, label_map)
-            raw_mc_for_file = [pse.assemble_line(line.strip()) for line in resolved_for_file if line.strip()]
-
-            # 格式化并写入文件 (这段来自 pseudo.py 的 if __name__ 块)
-            rom_lines = ['_'.join([c[j:j+4] for j in range(0,16,4)]) for c in raw_mc_for_file[:128]]
-            while len(rom_lines) < 128: rom_lines.append("0000_0000_0000_0000") # 假设ROM为128
-
-            data_lines = []
-            k=0
-            while k < len(data_lma_values):
-                b1 = data_lma_values[k]; b1_f = f"{format(b1,'08b')[0:4]}_{format(b1,'08b')[4:8]}"
-                b2_f = "0000_0000"
-
-                if k + 1 < len(data_lma_values):
-                    b2 = data_lma_values[k+1]; b2_f = f"{format(b2,'08b')[0:4]}_{format(b2,'08b')[4:8]}"
-                data_lines.append(f"{b1_f}_{b2_f}"); k+=2
-
-            final_output_for_file = rom_lines + data_lines
-            pse.write_machine_code_to_file(final_output_for_file, "machine_code_output.txt")
-            print("--- 文件 machine_code_output.txt 已使用 pseudo.py 的原始逻辑生成 ---")
+        # 2. 写入输出文件 (与模拟器加载的内存映像相同)，映像没有变化时不重写
+        if result.image != self._written_image:
+            try:
+                pse.write_machine_code_to_file([pse.format_word(word) for word in result.image], "machine_code_output.txt")
+                self._written_image = result.image
+            except Exception as e:
+                self.status_label.config(text=f"生成输出文件时出错: {e}")
+                # 即使文件生成失败，我们仍然可以尝试加载模拟器
 
-        except Exception as e:
-            self.status_label.config(text=f"生成输出文件时出错: {e}")
-            # 即使文件生成失败，我们仍然可以尝试加载模拟器
-
-        # 3. 加载代码到模拟器
-        success, message = self.simulator.load_program_from_source(
-            expanded_instr, label_map, data_lma_values, source_lines_for_expanded
-        )
-
-        if success:
-            # 优先显示模拟器加载成功的消息
-            self.status_label.config(text=message)
-            self.simulator.halted = False
-        else:
-            self.status_label.config(text=f"汇编失败: {message}")
-            self.simulator.halted = True
+        # 3. 加载代码到模拟器 (清空内存、PC 置0)
+        self.assembler.load_simulator(self.simulator, result)
+        self._breakpoint_pcs_cache = None # PC与源码行的对应关系已改变
+        self.status_label.config(text="汇编成功 (模拟器已加载代码).")
+        self.simulator.enable_history()
 
         self.update_ui_state()
 
@@ -1154,6 +773,29 @@ class App:
             self.status_label.config(text=f"错误: 无效的十六进制地址 '{addr_str}'")
 
 
+    # 监视类型 -> (读, 写, 值改变)
+    WATCH_KINDS = {"写": (False, True, False), "读": (True, False, False),
+                   "读写": (True, True, False), "值改变": (False, False, True)}
+
+    def add_watchpoint(self):
+        # 监视地址输入框中的地址开始的若干字节
+        try:
+            start = int(self.mem_addr_entry.get().strip(), 16)
+            length = int(self.watch_length_entry.get().strip(), 0)
+            read, write, change = self.WATCH_KINDS[self.watch_kind_var.get()]
+            watchpoint = self.simulator.add_watchpoint(start, length, read, write, change)
+        except (ValueError, KeyError) as e:
+            self.status_label.config(text=f"错误: 无法添加监视点 ({e})")
+            return
+
+        self.status_label.config(text=f"已添加监视点: 0x{watchpoint.start:04X} (+{watchpoint.length}) {self.watch_kind_var.get()}")
+        self._update_memory_view()
+
+    def clear_watchpoints(self):
+        self.simulator.clear_watchpoints()
+        self.status_label.config(text="已清除所有监视点")
+        self._update_memory_view()
+
     def _on_text_scroll(self, *args):
         # 代码编辑区滚动时，用于更新滚动条位置，并同步行号区滚动
         self.v_scrollbar.set(*args)
@@ -1248,37 +890,41 @@ class App:
         end_byte_addr = min(start_byte_addr + num_bytes_to_show, len(self.simulator.memory) * 2)
 
         addr_width = 4
+        watched = {addr for wp in self.simulator.watchpoints for addr in range(wp.start, wp.start + wp.length)}
 
         # 循环遍历字节地址
         for current_byte_addr in range(start_byte_addr, end_byte_addr):
-            word_addr = current_byte_addr // 2
-            byte_offset = current_byte_addr % 2
+            # 1. 按字节读取内存 (偶地址为高8位，奇地址为低8位)
+            decimal_value = self.simulator.read_byte(current_byte_addr)
+
+            # 2. 只在显示时才转换为8位二进制文本
+            byte_binary = format(decimal_value, '08b')
+            formatted_byte = f"{byte_binary[0:4]}_{byte_binary[4:8]}"
 
-            word_binary = self.simulator.memory[word_addr]
-            byte_binary = ""
-            decimal_value = "N/A"
-            formatted_byte = "ERR_FORMAT"
+            # 3. 构建包含十进制值的显示行
+            line = f"0x{current_byte_addr:0{addr_width}X}: {formatted_byte} ({decimal_value})\n"
+            self.memory_display_text.insert('end', line, "watched_byte" if current_byte_addr in watched else ())
 
-            if len(word_binary) == 16:
-                # 1. 根据字节偏移，正确提取8位的二进制字节字符串
-                byte_binary = word_binary[0:8] if byte_offset == 0 else word_binary[8:16]
+        self.memory_display_text.config(state='disabled')
 
-                # 2. 基于提取出的8位字节字符串来计算十进制值
-                try:
-                    # 注意：用 int(byte_binary, 2) 而不是 int(word_binary, 2)
-                    decimal_value = int(byte_binary, 2)
-                except (ValueError, TypeError):
-                    decimal_value = "N/A"
 
-                # 3. 准备格式化的8位二进制显示
-                formatted_byte = f"{byte_binary[0:4]}_{byte_binary[4:8]}"
+    def _refresh_changed_views(self):
+        # 根据外设总线的脏集合，只重绘被写过的外设和 (位于当前显示范围内的) 内存行
+        regions, rows = self.simulator.bus.take_dirty()
 
-            # 4. 构建包含正确十进制值的显示行
-            line = f"0x{current_byte_addr:0{addr_width}X}: {formatted_byte} ({decimal_value})\n"
-            self.memory_display_text.insert('end', line)
+        if regions is None or regions & {'led', 'digits'}:
+            self._update_peripherals_view()
 
-        self.memory_display_text.config(state='disabled')
+        start_row = (self.memory_view_start_addr & ~1) // bus.ROW_BYTES
+        end_row = ((self.memory_view_start_addr & ~1) + 127) // bus.ROW_BYTES # 内存视图显示 128 字节
+        if rows is None or any(start_row <= row <= end_row for row in rows):
+            self._update_memory_view()
 
+    def _update_peripherals_view(self):
+        devices = self.simulator.bus.state()
+        leds = ' '.join('●' if on else '○' for on in devices['led']['leds'])
+        digits = ' '.join(str(d) for d in devices['digits']['digits'])
+        self.peripherals_label.config(text=f"LED: {leds}   数码管: {digits}")
 
     def update_ui_state(self, is_continuous_run=False):
         # 根据模拟器的当前状态更新所有UI元素
@@ -1290,20 +936,20 @@ class App:
             self.reg_labels[i].config(text=f"{val} (0x{val:04X})")
         # pc_val = self.simulator.pc
         # self.pc_label_val.config(text=f"{pc_val} (0x{pc_val:04X})")
+        cycles = self.timing.cycles(self.simulator)
+        self.board_time_label.config(text=f"周期: {cycles}  开发板时间: {timing.format_duration(self.timing.seconds(cycles))}")
 
-        # 2. 有条件地更新内存视图
+        # 2. 有条件地更新内存视图和外设显示 (只重绘有改动的部分)
         if not is_continuous_run:
-            # 如果是单步执行、暂停、或程序结束时，总是完整刷新内存视图
-            if hasattr(self, '_update_memory_view'):
-                self._update_memory_view()
+            # 如果是单步执行、暂停、或程序结束时，总是刷新
+            self._refresh_changed_views()
 
         else:
             # 如果是连续执行模式，我们只定期刷新内存视图以提升性能
             self.run_step_counter += 1
             # 20 刷新一次,好像实现,但是祖宗之法不可变
             if self.run_step_counter % 20 == 0:
-                if hasattr(self, '_update_memory_view'):
-                    self._update_memory_view()
+                self._refresh_changed_views()
 
         # 3. 更新按钮状态
         if hasattr(self, '_update_button_states'):
@@ -1314,12 +960,83 @@ class App:
         if hasattr(self, '_update_current_line_highlight'):
             self._update_current_line_highlight()
 
+    def _bus_fault_warning(self, since):
+        # 总线的越界访存计数自 since 以来增加时，返回附加在状态栏后的警告 (写ROM、读外设等，开发板上的结果会不同)
+        bus = self.simulator.bus
+        if bus is None or bus.fault_count <= since:
+            return ''
+        first = f"，第一次: {bus.faults[since].describe()}" if since < len(bus.faults) else ''
+        return f"{BUS_FAULT_MARK}{bus.fault_count - since} 次访问了地址映射之外的地址{first}]"
+
+    def _show_bus_fault_warning(self, since):
+        warning = self._bus_fault_warning(since)
+        if warning:
+            text = self.status_label.cget("text").split(BUS_FAULT_MARK)[0]
+            self.status_label.config(text=text + warning)
+
     def step_code(self):
+        self.simulator.watch_hit = None
+        faults_before = self.simulator.bus.fault_count
         if self.simulator.step():
-            self.status_label.config(text=f"已单步执行. PC = {self.simulator.pc}")
+            if self.simulator.watch_hit is not None:
+                self.status_label.config(text=self.simulator.watch_hit.describe())
+            else:
+                self.status_label.config(text=f"已单步执行. PC = {self.simulator.pc}")
 
         else:
             self.status_label.config(text="模拟器已停止")
+        self._show_bus_fault_warning(faults_before)
+        self.update_ui_state()
+
+    def step_back_code(self):
+        self.simulator.bus.mark_all_dirty() # 后退会直接改写内存，不经过总线
+        if self.simulator.step_back(1):
+            self.status_label.config(text=f"已后退一步. 第 {self.simulator.step_count} 步, PC = {self.simulator.pc}")
+        else:
+            self.status_label.config(text="没有可以后退的执行记录")
+        self.update_ui_state()
+
+    def go_to_step_code(self):
+        try:
+            target = int(self.goto_step_entry.get().strip(), 0)
+        except ValueError:
+            self.status_label.config(text="请输入要跳到的步数")
+            return
+
+        self.simulator.bus.mark_all_dirty()
+        reached = self.simulator.go_to_step(target)
+        if reached == target:
+            self.status_label.config(text=f"已跳到第 {reached} 步. PC = {self.simulator.pc}")
+        else:
+            self.status_label.config(text=f"无法到达第 {target} 步，停在第 {reached} 步. PC = {self.simulator.pc}")
+        self.update_ui_state()
+
+    def save_checkpoint(self):
+        path = filedialog.asksaveasfilename(title="保存检查点", defaultextension=".ckpt",
+                                            filetypes=(("检查点", "*.ckpt"), ("所有文件", "*.*")))
+        if not path:
+            return
+        try:
+            self.simulator.save_checkpoint(path)
+            self.status_label.config(text=f"检查点已保存: {path} (第 {self.simulator.step_count} 步)")
+        except OSError as e:
+            self.status_label.config(text=f"保存检查点出错: {e}")
+
+    def load_checkpoint(self):
+        # 恢复检查点中的机器状态；源码行断点仍按当前编辑区的代码对应
+        path = filedialog.askopenfilename(title="载入检查点", filetypes=(("检查点", "*.ckpt"), ("所有文件", "*.*")))
+        if not path:
+            return
+        try:
+            self.simulator.load_checkpoint(path)
+        except (OSError, ValueError) as e:
+            self.status_label.config(text=f"载入检查点出错: {e}")
+            return
+
+        self._breakpoint_pcs_cache = None
+        if self.simulator.history is None:
+            self.simulator.enable_history()
+        self.status_label.config(text=f"已从检查点恢复: 第 {self.simulator.step_count} 步, PC = {self.simulator.pc}")
         self.update_ui_state()
 
     def run_code(self):
@@ -1333,14 +1050,33 @@ class App:
         # print(f"--- DEBUG: run_code - 'is_running_continuously' 设置为 {self.is_running_continuously} ---")
 
         self.status_label.config(text="正在连续执行...")
+        self._run_fault_start = self.simulator.bus.fault_count
         self._update_button_states() # 禁用“执行”、“单步”等，启用“停止”
+        self.pacer.start() # 实时模式从此刻开始计时
         self._execute_next_instruction_in_run_mode()
 
 
+    def _breakpoint_pcs(self):
+        # 将源码行断点 (self.breakpoints) 通过 pc_to_source_line_map 一次性转换为断点PC集合
+        # 有条件断点时转换为字典 {PC: Breakpoint 或 None}；条件只挂在该行展开后的第一条指令上，每执行一次该行计一次
+        if self._breakpoint_pcs_cache is None:
+            line_map = self.simulator.pc_to_source_line_map
+            pcs = {pc for pc, source_line_num in enumerate(line_map) if source_line_num in self.breakpoints}
+            if self.breakpoint_conditions:
+                pcs = dict.fromkeys(pcs)
+                for pc, source_line_num in enumerate(line_map):
+                    if source_line_num in self.breakpoint_conditions:
+                        if pc > 0 and line_map[pc - 1] == source_line_num:
+                            del pcs[pc]
+                        else:
+                            pcs[pc] = self.breakpoint_conditions[source_line_num]
+            self._breakpoint_pcs_cache = pcs
+        return self._breakpoint_pcs_cache
+
     def _execute_next_instruction_in_run_mode(self):
-        # print(f"--- DEBUG: 进入 _execute_next... - is_running: {self.is_running_continuously}, halted: {self.simulator.halted} ---")
+        # 每次 after() 回调在模拟器内部连续执行一批指令 (run_until)，命中断点时精确停在断点PC
 
-        # 1. 检查是否应该停止连续执行 (由用户点击停止、模拟器已停止、或断点触发)
+        # 1. 检查是否应该停止连续执行 (由用户点击停止或模拟器已停止)
         if not self.is_running_continuously or self.simulator.halted:
             self.is_running_continuously = False # 确保标志位正确
 
@@ -1348,78 +1084,61 @@ class App:
                 self.root.after_cancel(self._continuous_run_job)
                 self._continuous_run_job = None
 
-            # 更新状态信息和按钮
             # 只有在状态不是由“断点暂停”或“手动停止”设置时，才覆盖状态信息
             current_status = self.status_label.cget("text")
             if "暂停" not in current_status and "停止" not in current_status:
-                final_status = "模拟器已停止."
-
-                if self.simulator.halted:
-                    # 给出更具体的停止原因
-                    is_at_end = False
-
-                    if self.simulator.pc >= len(self.simulator.pc_to_source_line_map):
-                        is_at_end = True
-
-                    if is_at_end:
-                        final_status = "程序执行完毕."
-                    else:
-                        final_status = "模拟器因错误或未知原因停止."
-                self.status_label.config(text=final_status)
+                self.status_label.config(text="模拟器已停止.")
 
             self._update_button_states() # 更新所有按钮
             self.update_ui_state()       # 更新UI显示（寄存器、PC、高亮等）
             return # 结束本次执行
 
-        # 2.断点检查 (在执行指令之前)
-        current_pc = self.simulator.pc
-        # 确保 pc_to_source_line_map 已加载且 PC 在有效范围内
-
-        if hasattr(self.simulator, 'pc_to_source_line_map') and \
-        self.simulator.pc_to_source_line_map and \
-        0 <= current_pc < len(self.simulator.pc_to_source_line_map):
+        # 2. 执行一批指令，断点检查在模拟器内部、每条指令执行之前完成
+        if self.realtime_var.get():
+            batch = min(self.pacer.budget(), self.realtime_max_batch) # 按真实流逝的时间决定本次执行多少条
+        else:
+            batch = self.run_batch_steps
+        steps, reason = self.simulator.run_until(batch, self._breakpoint_pcs())
 
+        if reason == 'breakpoint':
+            # 命中断点，暂停执行，不安排下一次 after()
+            self.is_running_continuously = False
+            current_pc = self.simulator.pc
             source_line_num = self.simulator.pc_to_source_line_map[current_pc]
-            if source_line_num in self.breakpoints:
-                # 命中断点
-                self.is_running_continuously = False # 停止连续运行
-
-                # print(f"--- DEBUG: 断点命中! - 'is_running_continuously' 设置为 {self.is_running_continuously} ---")
-
+            breakpoint = self.breakpoint_conditions.get(source_line_num)
+            if breakpoint is not None:
+                self.status_label.config(text=f"在条件断点处暂停: 第 {source_line_num} 行 (PC={current_pc}), "
+                                              f"{breakpoint.describe()}")
+            else:
                 self.status_label.config(text=f"在断点处暂停: 第 {source_line_num} 行 (PC={current_pc})")
 
-                self._update_button_states() # 更新按钮状态（启用"单步"、"执行"等）
-                self.update_ui_state()       # 刷新UI以高亮断点行
+        elif reason == 'watchpoint':
+            # 访存命中监视点，停在该指令之后
+            self.is_running_continuously = False
+            self.status_label.config(text=f"在监视点处暂停: {self.simulator.watch_hit.describe()}")
 
-                # 暂停执行，不调用 step() 也不安排下一次 after()
-                return
-                # 断点检查结束
+        elif reason == 'halt':
+            self.is_running_continuously = False
+            self.status_label.config(text="程序执行完毕.")
 
-        # 3. 如果没有命中断点，则执行一步
-        # simulator.step() 会执行指令并更新PC。如果执行后出错或结束，它会返回 False。
-        if not self.simulator.step():
-            self.is_running_continuously = False # 模拟器内部停止了
+        elif reason == 'self_loop':
+            # 跳转到自身 (如 end: jal r0, end)，继续执行也不会再改变状态
+            self.is_running_continuously = False
+            self.status_label.config(text=f"程序执行完毕 (PC={self.simulator.pc} 处跳转到自身，已暂停).")
 
-            # print(f"--- DEBUG: simulator.step() 返回 False - 'is_running_continuously' 设置为 {self.is_running_continuously} ---")
+        elif reason == 'error':
+            self.is_running_continuously = False
+            self.status_label.config(text="模拟器因错误或未知原因停止.")
 
-            # 状态将在下一次调用此函数开头的 if 块中被处理和更新
-            # 为了立即响应，我们也可以在这里直接处理
-            self.status_label.config(text="模拟器执行时遇到错误或结束。")
-            self._update_button_states()
-            self.update_ui_state()
-            return
+        self._show_bus_fault_warning(self._run_fault_start) # 本次连续执行中的越界访存 (不停止执行)
 
-        # 4. 更新UI并安排下一次执行
+        # 3. 更新UI并安排下一批执行
+        self._update_button_states()
         self.update_ui_state() # 更新寄存器、PC、内存、高亮行等
 
-        # 再检查，以防 step() 操作改变了状态 (例如，执行了最后一条指令)
-        # print(f"--- DEBUG: 准备安排下一次 after() - is_running: {self.is_running_continuously}, halted: {self.simulator.halted} ---")
-
         if self.is_running_continuously and not self.simulator.halted:
             delay_ms = 50  # 执行速度控制 (毫秒)
             self._continuous_run_job = self.root.after(delay_ms, self._execute_next_instruction_in_run_mode)
-        # else:
-        #     print(f"--- DEBUG: 循环终止 - is_running: {self.is_running_continuously}, halted: {self.simulator.halted} ---")
 
     def stop_continuous_run(self):
         if self.is_running_continuously:
@@ -1471,10 +1190,13 @@ class App:
 
         if hasattr(self, 'breakpoints') and isinstance(self.breakpoints, set):
             self.breakpoints.clear()
+            self.breakpoint_conditions.clear()
+            self._breakpoint_pcs_cache = None
             # print("--- DEBUG: 所有断点已在重置时清除 ---") # 调试
         else:
             # 如果 breakpoints 属性不存在或类型不正确，创建一个空的，以防后续代码出错
             self.breakpoints = set()
+            self._breakpoint_pcs_cache = None
 
         # 清除旧的高亮，因为PC变为0
         if self.current_highlighted_tk_line is not None: